@@ -0,0 +1,300 @@
+import itertools
+import json
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from fastapi import Response
+
+from app.config import config
+from app.db_routing import primary_reads
+
+logger = logging.getLogger(__name__)
+
+POST_LIST_KEY = "post:list:"
+
+
+def post_detail_key(post_id: int) -> str:
+    # A namespace per post, so a write to one post leaves the others cached.
+    return f"post:detail:{post_id}:"
+
+
+def new_generation(unique: Any) -> str:
+    # Starts with when it was made, so readers can tell a fresh invalidation.
+    return f"{time.time():.3f}-{unique}"
+
+
+def generation_age(generation: str) -> float:
+    made_at, _, _ = generation.partition("-")
+    try:
+        return time.time() - float(made_at)
+    except ValueError:
+        return float("inf")
+
+
+class TTLCache:
+    """In-process LRU cache with per-entry expiry and an optional byte budget."""
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = lambda value: 0,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        expires_at, _, value = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, size, value)
+        self.size += size
+
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes is not None and self.size > self.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    @abstractmethod
+    async def generation(self, namespace: str) -> str:
+        """Current generation of ``namespace``; part of every key under it."""
+
+    @abstractmethod
+    async def bump_generation(self, namespace: str) -> None: ...
+
+    @abstractmethod
+    async def clear(self) -> None: ...
+
+    @abstractmethod
+    def stats(self) -> dict: ...
+
+
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float) -> None:
+        self._cache = TTLCache(max_entries, ttl, max_bytes=max_bytes, sizeof=len)
+        # Generations are never reused, so one that is evicted or expires only
+        # turns the entries under it into misses.
+        self._generations = TTLCache(max_entries, ttl)
+        self._next_generation = itertools.count(1)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._cache.set(key, value, ttl)
+
+    async def generation(self, namespace: str) -> str:
+        generation = self._generations.get(namespace)
+        if generation is None:
+            generation = new_generation(next(self._next_generation))
+            self._generations.set(namespace, generation)
+        return generation
+
+    async def bump_generation(self, namespace: str) -> None:
+        self._generations.set(namespace, new_generation(next(self._next_generation)))
+
+    async def clear(self) -> None:
+        self._cache.clear()
+        self._generations.clear()
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self._cache.stats()}
+
+
+class RedisCacheBackend(CacheBackend):
+    """Shared cache for multi-worker deployments; any Redis-compatible server works.
+
+    Size bounds and eviction are left to the server (maxmemory and an LRU
+    maxmemory-policy), so only hits and misses are counted here.
+    """
+
+    def __init__(self, client: Any, namespace: str = "app:") -> None:
+        self._client = client
+        self._namespace = namespace
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCacheBackend":
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError(
+                "CACHE_BACKEND=redis requires the 'redis' package to be installed"
+            ) from e
+        return cls(redis.from_url(url))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = await self._client.get(self._namespace + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._client.set(self._namespace + key, value, px=int(ttl * 1000))
+
+    async def generation(self, namespace: str) -> str:
+        key = f"{self._namespace}generation:{namespace}"
+        generation = await self._client.get(key)
+        if generation is None:
+            # Random rather than counted: a generation key evicted by the
+            # server must not come back with a value used before.
+            await self._client.set(key, new_generation(uuid.uuid4().hex), nx=True)
+            generation = await self._client.get(key)
+        return generation.decode() if isinstance(generation, bytes) else generation
+
+    async def bump_generation(self, namespace: str) -> None:
+        await self._client.set(
+            f"{self._namespace}generation:{namespace}",
+            new_generation(uuid.uuid4().hex),
+        )
+
+    async def clear(self) -> None:
+        # Not on any request path; SCAN walks the whole keyspace.
+        keys = [
+            key async for key in self._client.scan_iter(match=self._namespace + "*")
+        ]
+        if keys:
+            await self._client.delete(*keys)
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses}
+
+
+class ResponseCache:
+    """Read-through cache of fully serialized JSON responses.
+
+    Responses are cached under a namespace such as POST_LIST_KEY. Every key
+    embeds the namespace's current generation, so invalidating a namespace
+    only moves it to a new generation, whatever the number of entries; the
+    old ones age out. A response built while its namespace was invalidated
+    is not stored, so a read racing a write cannot cache what it read
+    before the write. For ``primary_seconds`` after an invalidation,
+    responses are built from the primary database: a replica that has not
+    caught up with the write would otherwise have its stale rows cached
+    for every client.
+    """
+
+    def __init__(
+        self, backend: CacheBackend, ttl: float, primary_seconds: float = 0
+    ) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.primary_seconds = primary_seconds
+
+    async def respond(
+        self,
+        namespace: str,
+        key: str,
+        build: Callable[[], Awaitable[tuple[bytes, dict]]],
+    ) -> Response:
+        generation = await self.backend.generation(namespace)
+        full_key = f"{namespace}{generation}:{key}"
+        cached = await self.backend.get(full_key)
+        if cached is not None:
+            raw_headers, body = cached.split(b"\n", 1)
+            headers = json.loads(raw_headers)
+        else:
+            with primary_reads(generation_age(generation) < self.primary_seconds):
+                body, headers = await build()
+            if await self.backend.generation(namespace) == generation:
+                await self.backend.set(
+                    full_key, json.dumps(headers).encode() + b"\n" + body, self.ttl
+                )
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def invalidate(self, *namespaces: str) -> None:
+        for namespace in namespaces:
+            logger.debug(f"Invalidating cached responses under '{namespace}'")
+            await self.backend.bump_generation(namespace)
+
+    async def clear(self) -> None:
+        await self.backend.clear()
+
+    def stats(self) -> dict:
+        return self.backend.stats()
+
+
+def create_cache_backend() -> CacheBackend:
+    if config.CACHE_BACKEND == "redis":
+        return RedisCacheBackend.from_url(config.CACHE_URL)
+    return MemoryCacheBackend(
+        config.CACHE_MAX_ENTRIES, config.CACHE_MAX_BYTES, config.CACHE_TTL_SECONDS
+    )
+
+
+response_cache = ResponseCache(
+    create_cache_backend(),
+    config.CACHE_TTL_SECONDS,
+    primary_seconds=config.REPLICA_STICKY_SECONDS,
+)
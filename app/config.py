@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Literal, Optional
 from functools import lru_cache
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -30,6 +30,140 @@ class GlobalConfig(BaseSettings):
     DEEPAI_API_KEY: Optional[str] = None
     SENTRY_DNS: Optional[str] = None
 
+    # /metrics and /stats/* are off unless OPS_TOKEN is set; then they need
+    # "Authorization: Bearer <OPS_TOKEN>" (Prometheus: authorization.credentials)
+    OPS_TOKEN: Optional[str] = None
+
+    # Database connection pool; the acquire timeout is in seconds, after which
+    # requests get a 503. STATEMENT_CACHE_SIZE is asyncpg's per-connection
+    # prepared statement cache (use 0 behind pgbouncer in transaction mode).
+    DATABASE_POOL_MIN_SIZE: int = 1
+    DATABASE_POOL_MAX_SIZE: int = 10
+    DATABASE_POOL_ACQUIRE_TIMEOUT: float = 5
+    DATABASE_STATEMENT_CACHE_SIZE: int = 100
+
+    # Read replicas (a JSON list in the environment): SELECTs go to healthy
+    # replicas, except for a client whose last_write cookie or X-Last-Write
+    # header is within STICKY_SECONDS, and cache fills within STICKY_SECONDS
+    # of an invalidation
+    DATABASE_REPLICA_URLS: list[str] = []
+    REPLICA_STICKY_SECONDS: float = 5
+    REPLICA_HEALTH_CHECK_INTERVAL: float = 10
+    REPLICA_HEALTH_CHECK_TIMEOUT: float = 2
+
+    # SQLite profile: WAL and connect-time pragmas, writes serialized on one
+    # connection and SELECTs spread over SQLITE_READERS reader connections.
+    # CACHE_SIZE follows SQLite's convention (negative means KiB), BUSY_TIMEOUT
+    # is in milliseconds.
+    SQLITE_TUNED: bool = True
+    SQLITE_READERS: int = 4
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE: int = -64 * 1024
+    SQLITE_BUSY_TIMEOUT: int = 5000
+
+    # Response cache: "memory" (per worker) or "redis" (shared, needs CACHE_URL).
+    # Jobs run in app.worker, so only "redis" lets their post updates reach
+    # the API processes before the TTL.
+    CACHE_BACKEND: str = "memory"
+    CACHE_URL: Optional[str] = None
+    CACHE_TTL_SECONDS: float = 30
+    CACHE_MAX_ENTRIES: int = 10_000
+    CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # Authenticated user lookups; a negative TTL of 0 disables caching unknown emails
+    USER_CACHE_TTL_SECONDS: float = 60
+    USER_CACHE_NEGATIVE_TTL_SECONDS: float = 0
+    USER_CACHE_MAX_ENTRIES: int = 10_000
+    TOKEN_CACHE_MAX_ENTRIES: int = 10_000
+
+    # Shared outbound HTTP clients (Mailgun, DeepAI); timeouts in seconds
+    HTTP_MAX_CONNECTIONS: int = 20
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    HTTP_KEEPALIVE_EXPIRY: float = 30
+    HTTP_CONNECT_TIMEOUT: float = 5
+    HTTP_READ_TIMEOUT: float = 10
+    HTTP_WRITE_TIMEOUT: float = 10
+    HTTP_POOL_TIMEOUT: float = 5
+    DEEPAI_READ_TIMEOUT: float = 60
+
+    # Durable job queue (python -m app.worker); times in seconds. A running
+    # job's lease lasts VISIBILITY_TIMEOUT and is renewed while it runs, up
+    # to JOB_TIMEOUT. Done and dead jobs are purged after RETENTION.
+    JOB_WORKER_CONCURRENCY: int = 4
+    JOB_POLL_INTERVAL: float = 1
+    JOB_VISIBILITY_TIMEOUT: float = 120
+    JOB_TIMEOUT: float = 600
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_BACKOFF_BASE: float = 2
+    JOB_BACKOFF_MAX: float = 600
+    JOB_RETENTION: float = 7 * 24 * 60 * 60
+    JOB_PURGE_INTERVAL: float = 60 * 60
+
+    # Where uploads go: "b2" or "local" (files under LOCAL_STORAGE_PATH served
+    # at LOCAL_STORAGE_BASE_URL). With ACCEL_REDIRECT set to an internal nginx
+    # location, nginx sends the file instead of the app.
+    STORAGE_BACKEND: str = "b2"
+    LOCAL_STORAGE_PATH: str = "uploads"
+    LOCAL_STORAGE_BASE_URL: str = "/files"
+    LOCAL_STORAGE_ACCEL_REDIRECT: Optional[str] = None
+
+    # Object storage transfers run on a bounded pool; timeout in seconds
+    UPLOAD_MAX_CONCURRENCY: int = 4
+    UPLOAD_MAX_PENDING: int = 16
+    UPLOAD_TIMEOUT: float = 300
+    # Files of at least STREAM_THRESHOLD bytes are streamed as a multipart
+    # upload; each transfer holds at most STREAM_BUFFERS parts in memory
+    UPLOAD_STREAM_THRESHOLD: int = 16 * 1024 * 1024
+    UPLOAD_PART_SIZE: int = 16 * 1024 * 1024
+    UPLOAD_STREAM_BUFFERS: int = 4
+    UPLOAD_PART_WORKERS: int = 8
+    # Resumable uploads are staged under SESSION_PATH, which every app worker
+    # must share; sessions idle for SESSION_TTL seconds are garbage-collected
+    UPLOAD_SESSION_PATH: str = "upload-sessions"
+    UPLOAD_SESSION_TTL: float = 24 * 60 * 60
+    UPLOAD_SESSION_GC_INTERVAL: float = 10 * 60
+    # How often an upload waits on another in-flight upload of the same content
+    UPLOAD_DEDUP_POLL_INTERVAL: float = 0.5
+
+    # Image derivatives are rendered on a process pool; each worker is capped
+    # at WORKER_MEMORY_LIMIT bytes of address space and MAX_PIXELS per image
+    IMAGE_MAX_WORKERS: int = 2
+    IMAGE_MAX_PENDING: int = 8
+    IMAGE_MAX_TASKS_PER_CHILD: int = 50
+    IMAGE_WORKER_MEMORY_LIMIT: Optional[int] = 1024 * 1024 * 1024
+    IMAGE_MAX_PIXELS: int = 50_000_000
+    IMAGE_MAX_SOURCE_BYTES: int = 25 * 1024 * 1024
+    IMAGE_QUALITY: int = 80
+    IMAGE_TIMEOUT: float = 60
+
+    # bcrypt runs on a bounded thread pool; requests beyond MAX_PENDING get a 503
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_MAX_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 32
+
+    # The log file rolls over at ROTATE_BYTES or after ROTATE_INTERVAL seconds;
+    # rotated segments are compressed and the oldest deleted beyond
+    # RETENTION_BYTES in total
+    LOG_FILE: str = "app.log"
+    LOG_ROTATE_BYTES: int = 50 * 1024 * 1024
+    LOG_ROTATE_INTERVAL: Optional[float] = 24 * 60 * 60
+    LOG_RETENTION_BYTES: Optional[int] = 500 * 1024 * 1024
+    LOG_COMPRESSION: Literal["gzip", "zstd", "none"] = "gzip"
+    # Log records are handed to a listener thread that formats and writes
+    # them; when QUEUE_SIZE records are waiting, OVERFLOW "drop" discards new
+    # ones (and counts them) while "block" makes the logging call wait
+    LOG_QUEUE_ENABLED: bool = True
+    LOG_QUEUE_SIZE: int = 10_000
+    LOG_QUEUE_OVERFLOW: Literal["drop", "block"] = "drop"
+    # Each logging call site may emit PER_SECOND records a second (bursts of
+    # BURST); errors always pass, as does every record of the TRACE_SAMPLE_RATE
+    # share of requests. Suppressed counts are logged every SUMMARY_INTERVAL
+    LOG_RATE_LIMIT_ENABLED: bool = True
+    LOG_RATE_LIMIT_PER_SECOND: float = 10
+    LOG_RATE_LIMIT_BURST: int = 50
+    LOG_TRACE_SAMPLE_RATE: float = 0.01
+    LOG_SUPPRESSED_SUMMARY_INTERVAL: float = 60
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -47,6 +181,10 @@ class DevConfig(GlobalConfig):
 
 
 class ProdConfig(GlobalConfig):
+    # Sized for PostgreSQL via asyncpg (postgresql+asyncpg://...)
+    DATABASE_POOL_MIN_SIZE: int = 5
+    DATABASE_POOL_MAX_SIZE: int = 20
+    DATABASE_POOL_ACQUIRE_TIMEOUT: float = 2
     model_config = SettingsConfigDict(
         env_prefix="PROD_", env_file=".env", env_file_encoding="utf-8", extra="ignore"
     )
@@ -55,6 +193,11 @@ class ProdConfig(GlobalConfig):
 class TestConfig(GlobalConfig):
     DATABASE_URL: str = "sqlite+aiosqlite:///./test.db"
     BD_FORCE_RELOAD: bool = True
+    BCRYPT_ROUNDS: int = 4
+    OPS_TOKEN: Optional[str] = "test-ops-token"
+    # Tests wrap each case in one rolled-back transaction, which a separate
+    # reader connection could not see into.
+    SQLITE_TUNED: bool = False
     model_config = SettingsConfigDict(
         env_prefix="TEST_", env_file=".env", env_file_encoding="utf-8", extra="ignore"
     )
@@ -1,6 +1,9 @@
 from app.config import config
 import sqlalchemy
-import databases
+from sqlalchemy.dialects import postgresql, sqlite
+from app.db_pool import PooledDatabase
+from app.db_routing import RoutedDatabase
+from app.db_sqlite import sqlite_pragmas
 
 metadata = sqlalchemy.MetaData()
 
@@ -19,8 +22,17 @@ post_table = sqlalchemy.Table(
     metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column("body", sqlalchemy.String, nullable=False),
-    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("user.id")),
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("user.id"), index=True),
     sqlalchemy.Column("image_url", sqlalchemy.String),
+    # Denormalized counters, kept in step with likes/comments by the write
+    # handlers and rebuilt by app.reconcile.
+    sqlalchemy.Column(
+        "like_count", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+    sqlalchemy.Column(
+        "comment_count", sqlalchemy.Integer, nullable=False, server_default="0"
+    ),
+    sqlalchemy.Index("ix_posts_like_count_id", "like_count", "id"),
 )
 
 comments_table = sqlalchemy.Table(
@@ -28,7 +40,7 @@ comments_table = sqlalchemy.Table(
     metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column("body", sqlalchemy.String, nullable=False),
-    sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("posts.id")),
+    sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("posts.id"), index=True),
     sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("user.id")),
 )
 
@@ -37,21 +49,169 @@ likes_table = sqlalchemy.Table(
     metadata,
     sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("posts.id")),
-    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("user.id")),
+    sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("user.id"), index=True),
+    # Also serves lookups by post_id, so that column needs no index of its own.
+    sqlalchemy.Index("uq_likes_post_user", "post_id", "user_id", unique=True),
+)
+
+# Durable background jobs, consumed by app.worker
+jobs_table = sqlalchemy.Table(
+    "jobs",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("task", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("payload", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("status", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("attempts", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("max_attempts", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("run_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Column("locked_until", sqlalchemy.Float),
+    sqlalchemy.Column("idempotency_key", sqlalchemy.String),
+    sqlalchemy.Column("last_error", sqlalchemy.String),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Index("ix_jobs_status_run_at", "status", "run_at"),
+    sqlalchemy.Index("uq_jobs_idempotency_key", "idempotency_key", unique=True),
 )
 
-# If SQLite async, use a sync URL for table creation
-sync_url = config.DATABASE_URL.replace("sqlite+aiosqlite", "sqlite")
+# Content-addressed index of uploaded files, see app.uploads
+files_table = sqlalchemy.Table(
+    "files",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("content_hash", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("size", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("file_url", sqlalchemy.String),
+    sqlalchemy.Column("status", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("ref_count", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("claimed_at", sqlalchemy.Float),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Index("uq_files_content_hash", "content_hash", unique=True),
+)
 
-engine = sqlalchemy.create_engine(
-    sync_url,
-    connect_args={"check_same_thread": False} if sync_url.startswith("sqlite") else {},
+# Resumable uploads in progress; the bytes are staged on disk, see
+# app.upload_sessions
+upload_sessions_table = sqlalchemy.Table(
+    "upload_sessions",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("file_name", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("size", sqlalchemy.Integer),
+    sqlalchemy.Column("received", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("status", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("file_url", sqlalchemy.String),
+    sqlalchemy.Column("locked_until", sqlalchemy.Float),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Column("updated_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Index("ix_upload_sessions_updated_at", "updated_at"),
 )
 
-# Create tables synchronously
-# metadata.drop_all(engine)
-metadata.create_all(engine)
+# Resized and recompressed copies of a post's image, see app.images
+post_images_table = sqlalchemy.Table(
+    "post_images",
+    metadata,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("posts.id"), nullable=False),
+    sqlalchemy.Column("name", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("url", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("width", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("height", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("content_type", sqlalchemy.String, nullable=False),
+    sqlalchemy.Index("uq_post_images_post_name", "post_id", "name", unique=True),
+)
+
+# Applied schema versions; the schema itself is created and changed by
+# app.migrations, never at import time
+schema_migrations_table = sqlalchemy.Table(
+    "schema_migrations",
+    metadata,
+    sqlalchemy.Column("version", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("name", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("applied_at", sqlalchemy.Float, nullable=False),
+)
+
+
+def pool_options(url: str) -> dict:
+    # Only asyncpg keeps a pool; aiosqlite opens a connection per acquire and
+    # is bounded by the PoolGate alone.
+    if not url.startswith("postgres"):
+        return {}
+    return {
+        "min_size": config.DATABASE_POOL_MIN_SIZE,
+        "max_size": config.DATABASE_POOL_MAX_SIZE,
+        "statement_cache_size": config.DATABASE_STATEMENT_CACHE_SIZE,
+    }
+
+
+def pooled_database(url: str, **kwargs) -> PooledDatabase:
+    return PooledDatabase(
+        url,
+        max_size=config.DATABASE_POOL_MAX_SIZE,
+        acquire_timeout=config.DATABASE_POOL_ACQUIRE_TIMEOUT,
+        **pool_options(url),
+        **kwargs,
+    )
+
+
+def create_database() -> PooledDatabase:
+    if config.DATABASE_REPLICA_URLS:
+        return RoutedDatabase(
+            config.DATABASE_URL,
+            readers=[
+                pooled_database(url, name=f"replica-{index}")
+                for index, url in enumerate(config.DATABASE_REPLICA_URLS)
+            ],
+            sticky_seconds=config.REPLICA_STICKY_SECONDS,
+            health_check_interval=config.REPLICA_HEALTH_CHECK_INTERVAL,
+            health_check_timeout=config.REPLICA_HEALTH_CHECK_TIMEOUT,
+            max_size=config.DATABASE_POOL_MAX_SIZE,
+            acquire_timeout=config.DATABASE_POOL_ACQUIRE_TIMEOUT,
+            **pool_options(config.DATABASE_URL),
+        )
+
+    if config.DATABASE_URL.startswith("sqlite") and config.SQLITE_TUNED:
+        # SQLite allows one writer at a time anyway; queueing writes on a
+        # single connection avoids busy-lock retries, while WAL lets the
+        # reader connections proceed concurrently.
+        pragmas = sqlite_pragmas()
+        reader = PooledDatabase(
+            config.DATABASE_URL,
+            max_size=config.SQLITE_READERS,
+            acquire_timeout=config.DATABASE_POOL_ACQUIRE_TIMEOUT,
+            sqlite_pragmas=pragmas,
+            name="reader",
+        )
+        return RoutedDatabase(
+            config.DATABASE_URL,
+            readers=[reader],
+            health_check_interval=config.REPLICA_HEALTH_CHECK_INTERVAL,
+            max_size=1,
+            acquire_timeout=config.DATABASE_POOL_ACQUIRE_TIMEOUT,
+            sqlite_pragmas=pragmas,
+        )
+
+    return pooled_database(config.DATABASE_URL)
+
 
 # Async database instance
-# db_args = {"min_size": 1, "max_size": 3} if sync_url.startswith("postgres") else {},
-database = databases.Database(config.DATABASE_URL)
+database = create_database()
+
+
+def dialect_insert(table: sqlalchemy.Table):
+    # INSERT construct with ON CONFLICT support for the configured database.
+    if database.url.dialect == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+def json_array_agg(*columns: sqlalchemy.ColumnElement):
+    # Aggregate rows into a JSON array of objects keyed by column name.
+    pairs = []
+    for column in columns:
+        pairs += [sqlalchemy.literal_column(f"'{column.name}'"), column]
+
+    if database.url.dialect == "postgresql":
+        return sqlalchemy.func.coalesce(
+            sqlalchemy.func.json_agg(sqlalchemy.func.json_build_object(*pairs)),
+            sqlalchemy.literal_column("'[]'::json"),
+        )
+    return sqlalchemy.func.json_group_array(sqlalchemy.func.json_object(*pairs))
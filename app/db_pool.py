@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import time
+from typing import Any, Optional
+
+import databases
+from databases.interfaces import DatabaseBackend
+
+from app.db_sqlite import TunedSQLiteBackend
+from app.metrics import (
+    DB_POOL_ACQUIRE,
+    DB_POOL_IN_USE,
+    DB_POOL_MAX,
+    DB_POOL_TIMEOUTS,
+    DB_POOL_WAITERS,
+    DB_QUERY_LATENCY,
+    labelled,
+    statement_name,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class PoolGate:
+    """Bounds the connections checked out of a backend and measures acquires.
+
+    Waiting longer than ``acquire_timeout`` for a free slot raises
+    PoolTimeoutError, which the app turns into a 503, instead of letting
+    requests pile up behind an exhausted pool. ``name`` labels the pool's
+    metrics.
+    """
+
+    def __init__(
+        self,
+        backend: DatabaseBackend,
+        max_size: int,
+        acquire_timeout: float,
+        name: str = "primary",
+    ) -> None:
+        self.backend = backend
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.name = name
+        self._in_use_gauge = DB_POOL_IN_USE.labels(name)
+        self._waiters_gauge = DB_POOL_WAITERS.labels(name)
+        self._acquire_histogram = DB_POOL_ACQUIRE.labels(name)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.in_use = 0
+        self.waiters = 0
+        self.acquires = 0
+        self.timeouts = 0
+        self.acquire_seconds_total = 0.0
+        self.acquire_seconds_max = 0.0
+
+    async def connect(self) -> None:
+        # Created here rather than in __init__ so it belongs to the running loop.
+        self._slots = asyncio.Semaphore(self.max_size)
+        await self.backend.connect()
+        DB_POOL_MAX.labels(self.name).set(self.max_size)
+
+    async def disconnect(self) -> None:
+        await self.backend.disconnect()
+        DB_POOL_MAX.labels(self.name).set(0)
+
+    def connection(self) -> "GatedConnection":
+        return GatedConnection(self, self.backend.connection())
+
+    async def acquire_slot(self) -> None:
+        started = time.perf_counter()
+        # Only a caller that finds the pool full shows up as waiting.
+        blocked = self._slots.locked()
+        if blocked:
+            self._waiters_gauge.inc()
+        self.waiters += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            DB_POOL_TIMEOUTS.labels(self.name).inc()
+            logger.warning(f"No database connection free after {self.acquire_timeout}s")
+            raise PoolTimeoutError("Database connection pool is exhausted")
+        finally:
+            self.waiters -= 1
+            if blocked:
+                self._waiters_gauge.dec()
+
+        waited = time.perf_counter() - started
+        self._acquire_histogram.observe(waited)
+        self._in_use_gauge.inc()
+        self.in_use += 1
+        self.acquires += 1
+        self.acquire_seconds_total += waited
+        self.acquire_seconds_max = max(self.acquire_seconds_max, waited)
+
+    def release_slot(self) -> None:
+        self.in_use -= 1
+        self._in_use_gauge.dec()
+        self._slots.release()
+
+    def stats(self) -> dict:
+        # asyncpg pools know how many of their connections sit idle; SQLite
+        # opens a connection per acquire, so there is nothing idle to report.
+        pool = getattr(self.backend, "_pool", None)
+        size = pool.get_size() if hasattr(pool, "get_size") else None
+        idle = pool.get_idle_size() if hasattr(pool, "get_idle_size") else None
+        return {
+            "max_size": self.max_size,
+            "size": size,
+            "in_use": self.in_use,
+            "idle": idle,
+            "waiters": self.waiters,
+            "acquires": self.acquires,
+            "timeouts": self.timeouts,
+            "acquire_seconds_total": self.acquire_seconds_total,
+            "acquire_seconds_max": self.acquire_seconds_max,
+        }
+
+
+class GatedConnection:
+    def __init__(self, gate: PoolGate, connection: Any) -> None:
+        self._gate = gate
+        self._connection = connection
+
+    async def acquire(self) -> None:
+        await self._gate.acquire_slot()
+        try:
+            await self._connection.acquire()
+        except BaseException:
+            self._gate.release_slot()
+            raise
+
+    async def release(self) -> None:
+        try:
+            await self._connection.release()
+        finally:
+            self._gate.release_slot()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._connection, name)
+
+
+class PooledDatabase(databases.Database):
+    """databases.Database whose connections are checked out through a PoolGate.
+
+    With ``sqlite_pragmas`` a SQLite database keeps its connections open and
+    applies the pragmas to each new one, see app.db_sqlite. Every statement's
+    latency, including the wait for a connection, is recorded in
+    app.metrics under its statement name.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        max_size: int,
+        acquire_timeout: float,
+        sqlite_pragmas: Optional[dict] = None,
+        name: str = "primary",
+        **options: Any,
+    ) -> None:
+        super().__init__(url, **options)
+        backend = self._backend
+        if sqlite_pragmas is not None:
+            backend = TunedSQLiteBackend(self.url, sqlite_pragmas, **options)
+        self._backend = PoolGate(backend, max_size, acquire_timeout, name)
+
+    async def _timed(self, method: str, query: Any, *args: Any, **kwargs: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await getattr(super(), method)(query, *args, **kwargs)
+        finally:
+            labelled(DB_QUERY_LATENCY, statement_name(query)).observe(
+                time.perf_counter() - started
+            )
+
+    async def fetch_all(self, query: Any, values: Optional[dict] = None) -> list:
+        return await self._timed("fetch_all", query, values)
+
+    async def fetch_one(self, query: Any, values: Optional[dict] = None) -> Any:
+        return await self._timed("fetch_one", query, values)
+
+    async def fetch_val(
+        self, query: Any, values: Optional[dict] = None, column: Any = 0
+    ) -> Any:
+        return await self._timed("fetch_val", query, values, column=column)
+
+    async def execute(self, query: Any, values: Optional[dict] = None) -> Any:
+        return await self._timed("execute", query, values)
+
+    async def execute_many(self, query: Any, values: list) -> None:
+        return await self._timed("execute_many", query, values)
+
+    def pool_stats(self) -> dict:
+        return self._backend.stats()
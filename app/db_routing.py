@@ -0,0 +1,286 @@
+import asyncio
+import contextlib
+import itertools
+import logging
+import math
+import sqlite3
+import time
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, Iterator, Optional, Union
+
+from sqlalchemy.sql import ClauseElement, Select
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.db_pool import PooledDatabase, PoolTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Carries the time of a client's last write between its requests, so their
+# reads can follow their writes whichever process serves them.
+LAST_WRITE_COOKIE = "last_write"
+LAST_WRITE_HEADER = "X-Last-Write"
+
+# SQLSTATE classes of a broken connection or server rather than a bad query:
+# connection exception, insufficient resources, operator intervention.
+CONNECTION_SQLSTATE_CLASSES = ("08", "53", "57")
+
+
+class Writes:
+    """When the client behind the current request last wrote, if recently."""
+
+    def __init__(self, last_write: float = 0) -> None:
+        self.last_write = last_write
+        self.wrote = False
+
+    def record(self) -> None:
+        self.last_write = time.time()
+        self.wrote = True
+
+
+request_writes: ContextVar[Optional[Writes]] = ContextVar(
+    "request_writes", default=None
+)
+_primary_reads: ContextVar[bool] = ContextVar("primary_reads", default=False)
+
+
+@contextlib.contextmanager
+def primary_reads(enabled: bool = True) -> Iterator[None]:
+    """Send the reads made inside to the primary, for data just written."""
+    token = _primary_reads.set(enabled or _primary_reads.get())
+    try:
+        yield
+    finally:
+        _primary_reads.reset(token)
+
+
+def is_connection_error(error: Exception) -> bool:
+    if isinstance(error, (OSError, asyncio.TimeoutError)):
+        return True
+    sqlstate = getattr(error, "sqlstate", None)
+    if isinstance(sqlstate, str):
+        return sqlstate[:2] in CONNECTION_SQLSTATE_CLASSES
+    # asyncpg's "connection is closed" and SQLite failing to open its file
+    # carry no SQLSTATE.
+    if type(error).__name__ == "InterfaceError":
+        return True
+    return isinstance(error, sqlite3.OperationalError) and str(error).startswith(
+        ("unable to open", "disk I/O error")
+    )
+
+
+def is_read_query(query: Union[ClauseElement, str]) -> bool:
+    if isinstance(query, str):
+        return query.lstrip()[:6].lower() == "select"
+    # Cached statements (app.db_statements) carry the statement they wrap.
+    query = getattr(query, "statement", query)
+    return isinstance(query, Select) and query._for_update_arg is None
+
+
+class RoutedDatabase(PooledDatabase):
+    """Sends plain SELECTs to reader databases, everything else here.
+
+    Readers are used round-robin while their health checks pass; a reader
+    whose connection fails is taken out until the next successful check and
+    the query is retried here. Inside a transaction every statement stays on
+    this connection so reads see the transaction's own writes. For
+    ``sticky_seconds`` after a client writes, its reads stay here too so
+    replication lag cannot hide the write; ReadYourWritesMiddleware carries
+    the time of the write between the client's requests.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        readers: list[PooledDatabase],
+        sticky_seconds: float = 0,
+        health_check_interval: Optional[float] = None,
+        health_check_timeout: float = 2,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(url, **kwargs)
+        self.readers = readers
+        self.healthy = [True] * len(readers)
+        self.sticky_seconds = sticky_seconds
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self._next_reader = itertools.count()
+        self._health_task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> None:
+        await super().connect()
+        for index, reader in enumerate(self.readers):
+            try:
+                await reader.connect()
+            except Exception:
+                logger.exception(f"Could not connect to reader {index}")
+                self.healthy[index] = False
+        if self.health_check_interval:
+            self._health_task = asyncio.create_task(self._check_health_forever())
+
+    async def disconnect(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for reader in self.readers:
+            if reader.is_connected:
+                await reader.disconnect()
+        await super().disconnect()
+
+    async def check_health(self) -> None:
+        for index, reader in enumerate(self.readers):
+            try:
+                if not reader.is_connected:
+                    await reader.connect()
+                await asyncio.wait_for(
+                    reader.fetch_val("SELECT 1"), self.health_check_timeout
+                )
+                healthy = True
+            except Exception as e:
+                logger.debug(f"Reader {index} health check failed: {e}")
+                healthy = False
+            if healthy != self.healthy[index]:
+                logger.warning(
+                    f"Reader {index} is {'healthy' if healthy else 'unhealthy'}"
+                )
+            self.healthy[index] = healthy
+
+    async def _check_health_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await self.check_health()
+
+    def _pick_reader(self, query: Union[ClauseElement, str]) -> Optional[int]:
+        writes = request_writes.get()
+        if not is_read_query(query):
+            if writes is not None:
+                writes.record()
+            return None
+        if _primary_reads.get() or self.connection()._transaction_stack:
+            return None
+        if writes is not None and writes.last_write > time.time() - self.sticky_seconds:
+            return None
+
+        healthy = [index for index, ok in enumerate(self.healthy) if ok]
+        if not healthy:
+            return None
+        return healthy[next(self._next_reader) % len(healthy)]
+
+    async def _read(self, method: str, query, *args: Any, **kwargs: Any) -> Any:
+        index = self._pick_reader(query)
+        if index is not None:
+            try:
+                return await getattr(self.readers[index], method)(
+                    query, *args, **kwargs
+                )
+            except PoolTimeoutError:
+                raise
+            except Exception as e:
+                # A bad query would fail the same way on the primary.
+                if not is_connection_error(e):
+                    raise
+                logger.warning(f"Reader {index} failed, using the primary: {e}")
+                self.healthy[index] = False
+        return await getattr(super(), method)(query, *args, **kwargs)
+
+    async def fetch_all(
+        self, query: Union[ClauseElement, str], values: Optional[dict] = None
+    ) -> list:
+        return await self._read("fetch_all", query, values)
+
+    async def fetch_one(
+        self, query: Union[ClauseElement, str], values: Optional[dict] = None
+    ) -> Any:
+        return await self._read("fetch_one", query, values)
+
+    async def fetch_val(
+        self,
+        query: Union[ClauseElement, str],
+        values: Optional[dict] = None,
+        column: Any = 0,
+    ) -> Any:
+        return await self._read("fetch_val", query, values, column=column)
+
+    async def execute(
+        self, query: Union[ClauseElement, str], values: Optional[dict] = None
+    ) -> Any:
+        self._pick_reader(query)
+        return await super().execute(query, values)
+
+    async def execute_many(
+        self, query: Union[ClauseElement, str], values: list
+    ) -> None:
+        self._pick_reader(query)
+        return await super().execute_many(query, values)
+
+    async def iterate(
+        self, query: Union[ClauseElement, str], values: Optional[dict] = None
+    ) -> AsyncGenerator[Any, None]:
+        index = self._pick_reader(query)
+        target = self.readers[index].iterate if index is not None else super().iterate
+        async for record in target(query, values):
+            yield record
+
+    def pool_stats(self) -> dict:
+        return {
+            **super().pool_stats(),
+            "readers": [
+                {**reader.pool_stats(), "healthy": healthy}
+                for reader, healthy in zip(self.readers, self.healthy)
+            ],
+        }
+
+
+class ReadYourWritesMiddleware:
+    """Keeps a client's reads on the primary for a while after it writes.
+
+    A response to a request that wrote sets the time of the write in the
+    ``last_write`` cookie and the X-Last-Write header. Requests that bring
+    either back within ``sticky_seconds`` read from the primary, so the
+    client's own writes are visible whichever process serves it.
+    """
+
+    def __init__(self, app: ASGIApp, sticky_seconds: float) -> None:
+        self.app = app
+        self.sticky_seconds = sticky_seconds
+
+    def _last_write(self, scope: Scope) -> float:
+        connection = HTTPConnection(scope)
+        value = connection.headers.get(LAST_WRITE_HEADER) or connection.cookies.get(
+            LAST_WRITE_COOKIE
+        )
+        try:
+            last_write = float(value) if value else 0
+        except ValueError:
+            return 0
+        # The value comes from the client: "inf" or a time in the future
+        # would pin it to the primary for good.
+        if not math.isfinite(last_write):
+            return 0
+        return min(last_write, time.time())
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        writes = Writes(self._last_write(scope))
+
+        async def send_last_write(message: Message) -> None:
+            if message["type"] == "http.response.start" and writes.wrote:
+                headers = MutableHeaders(scope=message)
+                last_write = f"{writes.last_write:.3f}"
+                headers.append(LAST_WRITE_HEADER, last_write)
+                headers.append(
+                    "Set-Cookie",
+                    f"{LAST_WRITE_COOKIE}={last_write}; Path=/; HttpOnly;"
+                    f" SameSite=Lax; Max-Age={math.ceil(self.sticky_seconds)}",
+                )
+            await send(message)
+
+        token = request_writes.set(writes)
+        try:
+            await self.app(scope, receive, send_last_write)
+        finally:
+            request_writes.reset(token)
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Callable, Optional
+
+from app.metrics import EXECUTOR_PENDING
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorBusyError(Exception):
+    pass
+
+
+class BoundedExecutor:
+    """Thread pool for blocking work that sheds load instead of queueing forever.
+
+    At most ``max_workers`` calls run at once and at most ``max_pending`` are
+    admitted in total (running plus waiting); beyond that ``run`` raises
+    ExecutorBusyError, which the app turns into a 503.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int) -> None:
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        # Created on first use, so importing a module that defines an executor
+        # starts no threads or processes.
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._pending_gauge = EXECUTOR_PENDING.labels(name)
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self._create_executor()
+        return self._executor
+
+    def _create_executor(self) -> Executor:
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix=self.name
+        )
+
+    def _submit(
+        self, fn: Callable[..., Any], args: tuple, submitted_at: float
+    ) -> asyncio.Future:
+        def call() -> Any:
+            waited = time.perf_counter() - submitted_at
+            with self._lock:
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+                self.active += 1
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+        return asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    async def run(
+        self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None
+    ) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            logger.warning(f"{self.name} executor is saturated, rejecting work")
+            raise ExecutorBusyError(f"{self.name} executor is saturated")
+
+        self.pending += 1
+        self._pending_gauge.inc()
+        try:
+            future = self._submit(fn, args, time.perf_counter())
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            # The worker thread cannot be interrupted; it finishes in the
+            # background but the caller stops waiting for it.
+            self.timed_out += 1
+            raise
+        finally:
+            self.pending -= 1
+            self._pending_gauge.dec()
+            self.completed += 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "active": self.active,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+        }
+
+
+class BoundedProcessExecutor(BoundedExecutor):
+    """BoundedExecutor backed by worker processes, for CPU-bound work.
+
+    ``fn`` and its arguments must be picklable. Workers are started with
+    spawn so they do not inherit the parent's memory, and are replaced after
+    ``max_tasks_per_child`` calls so leaks and fragmentation cannot build up.
+    Queue wait and active counts are not tracked across the process boundary.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_workers: int,
+        max_pending: int,
+        max_tasks_per_child: Optional[int] = None,
+        initializer: Optional[Callable[..., None]] = None,
+        initargs: tuple = (),
+    ) -> None:
+        self.max_tasks_per_child = max_tasks_per_child
+        self.initializer = initializer
+        self.initargs = initargs
+        super().__init__(name, max_workers, max_pending)
+
+    def _create_executor(self) -> Executor:
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=get_context("spawn"),
+            max_tasks_per_child=self.max_tasks_per_child,
+            initializer=self.initializer,
+            initargs=self.initargs,
+        )
+
+    def _submit(
+        self, fn: Callable[..., Any], args: tuple, submitted_at: float
+    ) -> asyncio.Future:
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
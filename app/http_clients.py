@@ -0,0 +1,94 @@
+import importlib.util
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from app.config import config
+from app.metrics import UPSTREAM_LATENCY, labelled
+
+logger = logging.getLogger(__name__)
+
+MAILGUN = "mailgun"
+DEEPAI = "deepai"
+# Absolute URLs of images to post-process, wherever they are hosted
+IMAGES = "images"
+
+UPSTREAMS = {
+    MAILGUN: "https://api.mailgun.net",
+    DEEPAI: "https://api.deepai.org",
+    IMAGES: "",
+}
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def upstream_timeout(name: str) -> httpx.Timeout:
+    read = config.DEEPAI_READ_TIMEOUT if name == DEEPAI else config.HTTP_READ_TIMEOUT
+    return httpx.Timeout(
+        connect=config.HTTP_CONNECT_TIMEOUT,
+        read=read,
+        write=config.HTTP_WRITE_TIMEOUT,
+        pool=config.HTTP_POOL_TIMEOUT,
+    )
+
+
+def latency_hooks(name: str) -> dict:
+    # Time until the response headers arrive; requests that fail before a
+    # response surface as errors in the caller instead.
+    async def start(request: httpx.Request) -> None:
+        request.extensions["started"] = time.perf_counter()
+
+    async def observe(response: httpx.Response) -> None:
+        started = response.request.extensions.get("started")
+        if started is not None:
+            labelled(UPSTREAM_LATENCY, name, response.status_code).observe(
+                time.perf_counter() - started
+            )
+
+    return {"request": [start], "response": [observe]}
+
+
+def create_http_client(
+    name: str, transport: Optional[httpx.AsyncBaseTransport] = None
+) -> httpx.AsyncClient:
+    logger.debug(f"Creating HTTP client for {name}")
+    return httpx.AsyncClient(
+        base_url=UPSTREAMS[name],
+        http2=http2_available(),
+        limits=httpx.Limits(
+            max_connections=config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=upstream_timeout(name),
+        transport=transport,
+        event_hooks=latency_hooks(name),
+    )
+
+
+async def start_http_clients(
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+) -> None:
+    await close_http_clients()
+    for name in UPSTREAMS:
+        _clients[name] = create_http_client(name, transport)
+
+
+async def close_http_clients() -> None:
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    # Created lazily so code running outside the app lifespan (workers,
+    # scripts) shares a client per upstream as well.
+    if name not in _clients:
+        _clients[name] = create_http_client(name)
+    return _clients[name]
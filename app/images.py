@@ -0,0 +1,109 @@
+"""Thumbnails and recompressed copies of post images.
+
+The ``generate_image_variants`` job downloads a post's image and renders
+every variant in app.libs.images on a process pool. It then uploads the
+results through the configured storage backend and records their URLs in
+post_images.
+"""
+
+import logging
+import os
+import tempfile
+
+import aiofiles
+from databases import Database
+
+from app.cache import POST_LIST_KEY, post_detail_key, response_cache
+from app.config import config
+from app.database import dialect_insert, post_images_table, post_table
+from app.executors import BoundedProcessExecutor
+from app.http_clients import IMAGES, get_http_client
+from app.libs.images import limit_worker_memory, render_variants
+from app.libs.storage import LocalStorage, get_storage, run_transfer
+
+logger = logging.getLogger(__name__)
+
+image_executor = BoundedProcessExecutor(
+    "image",
+    max_workers=config.IMAGE_MAX_WORKERS,
+    max_pending=config.IMAGE_MAX_PENDING,
+    max_tasks_per_child=config.IMAGE_MAX_TASKS_PER_CHILD,
+    initializer=limit_worker_memory,
+    initargs=(config.IMAGE_MAX_PIXELS, config.IMAGE_WORKER_MEMORY_LIMIT),
+)
+
+
+class ImageSourceError(Exception):
+    pass
+
+
+async def fetch_source(image_url: str, destination: str) -> str:
+    storage = get_storage()
+    if isinstance(storage, LocalStorage) and image_url.startswith(
+        f"{storage.base_url}/"
+    ):
+        path = storage.path_for(image_url.removeprefix(f"{storage.base_url}/"))
+        if path is None:
+            raise ImageSourceError(f"Image {image_url} is not in local storage")
+        return str(path)
+
+    logger.debug(f"Downloading {image_url}")
+    size = 0
+    async with get_http_client(IMAGES).stream("GET", image_url) as response:
+        response.raise_for_status()
+        async with aiofiles.open(destination, "wb") as f:
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > config.IMAGE_MAX_SOURCE_BYTES:
+                    raise ImageSourceError(f"Image {image_url} is too large")
+                await f.write(chunk)
+    return destination
+
+
+async def generate_image_variants(post_id: int, database: Database) -> list[dict]:
+    post = await database.fetch_one(
+        post_table.select().where(post_table.c.id == post_id)
+    )
+    if post is None or not post.image_url:
+        logger.debug(f"Post {post_id} has no image to render")
+        return []
+
+    storage = get_storage()
+    with tempfile.TemporaryDirectory(prefix="variants-") as work_dir:
+        source = await fetch_source(post.image_url, os.path.join(work_dir, "source"))
+        variants = await image_executor.run(
+            render_variants,
+            source,
+            work_dir,
+            config.IMAGE_QUALITY,
+            timeout=config.IMAGE_TIMEOUT,
+        )
+
+        for variant in variants:
+            path = variant.pop("path")
+            variant["url"] = await run_transfer(
+                storage.upload_file,
+                path,
+                f"post-{post_id}-{os.path.basename(path)}",
+                os.path.getsize(path),
+            )
+
+    for variant in variants:
+        query = dialect_insert(post_images_table).values(post_id=post_id, **variant)
+        await database.execute(
+            query.on_conflict_do_update(
+                index_elements=["post_id", "name"],
+                set_={
+                    "url": query.excluded.url,
+                    "width": query.excluded.width,
+                    "height": query.excluded.height,
+                    "content_type": query.excluded.content_type,
+                },
+            )
+        )
+
+    # Runs in the job worker: this reaches the API processes only through a
+    # shared cache backend, see config.CACHE_BACKEND.
+    await response_cache.invalidate(POST_LIST_KEY, post_detail_key(post_id))
+    logger.info(f"Stored {len(variants)} image variants for post {post_id}")
+    return variants
@@ -0,0 +1,286 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional
+
+import sqlalchemy
+from databases import Database
+
+from app import images, tasks
+from app.config import config
+from app.database import database, dialect_insert, jobs_table, post_table
+from app.db_routing import primary_reads
+from app.metrics import JOB_DURATION, labelled
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+
+
+async def _generate_and_add_to_post(**kwargs):
+    response = await tasks.generate_and_add_to_post(database=database, **kwargs)
+    await enqueue_image_variants(kwargs["post_id"])
+    return response
+
+
+async def _generate_image_variants(**kwargs):
+    return await images.generate_image_variants(database=database, **kwargs)
+
+
+JOB_HANDLERS: dict[str, Callable[..., Awaitable]] = {
+    "send_user_registration_email": tasks.send_user_registration_email,
+    "generate_and_add_to_post": _generate_and_add_to_post,
+    "generate_image_variants": _generate_image_variants,
+}
+
+
+def backoff_delay(attempts: int) -> float:
+    # Exponential backoff with jitter so retries of a failing upstream
+    # spread out instead of arriving together.
+    delay = min(config.JOB_BACKOFF_BASE * 2 ** (attempts - 1), config.JOB_BACKOFF_MAX)
+    return random.uniform(delay / 2, delay)
+
+
+async def enqueue(
+    task: str,
+    payload: dict,
+    idempotency_key: Optional[str] = None,
+    delay: float = 0,
+    db: Database = database,
+) -> Optional[int]:
+    # Callers enqueue in the transaction that writes the rows the job acts
+    # on, so the two commit together.
+    if task not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job task '{task}'")
+
+    now = time.time()
+    query = (
+        dialect_insert(jobs_table)
+        .values(
+            task=task,
+            payload=json.dumps(payload),
+            status=QUEUED,
+            attempts=0,
+            max_attempts=config.JOB_MAX_ATTEMPTS,
+            run_at=now + delay,
+            idempotency_key=idempotency_key,
+            created_at=now,
+        )
+        .on_conflict_do_nothing(index_elements=["idempotency_key"])
+        .returning(jobs_table.c.id)
+    )
+    logger.debug(f"Enqueueing job {task}")
+    job = await db.fetch_one(query)
+
+    if job is None:
+        logger.debug(f"Job with idempotency key '{idempotency_key}' already exists")
+        return None
+    return job.id
+
+
+async def enqueue_image_variants(
+    post_id: int, db: Database = database
+) -> Optional[int]:
+    # Called right after the image is saved; a replica may not have it yet.
+    with primary_reads():
+        image_url = await db.fetch_val(
+            sqlalchemy.select(post_table.c.image_url).where(post_table.c.id == post_id)
+        )
+    if not image_url:
+        return None
+    # Keyed on the URL too, so a post whose image changes is rendered again.
+    digest = hashlib.sha256(image_url.encode()).hexdigest()[:16]
+    return await enqueue(
+        "generate_image_variants",
+        {"post_id": post_id},
+        idempotency_key=f"post-variants:{post_id}:{digest}",
+        db=db,
+    )
+
+
+def _runnable(now: float):
+    return sqlalchemy.or_(
+        sqlalchemy.and_(jobs_table.c.status == QUEUED, jobs_table.c.run_at <= now),
+        # A running job whose lease expired belongs to a worker that died.
+        sqlalchemy.and_(
+            jobs_table.c.status == RUNNING, jobs_table.c.locked_until < now
+        ),
+    )
+
+
+async def claim_job(db: Database = database):
+    now = time.time()
+    candidate = (
+        sqlalchemy.select(jobs_table.c.id)
+        .where(_runnable(now))
+        .order_by(jobs_table.c.run_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    query = (
+        jobs_table.update()
+        .where(jobs_table.c.id == candidate, _runnable(now))
+        .values(
+            status=RUNNING,
+            attempts=jobs_table.c.attempts + 1,
+            locked_until=now + config.JOB_VISIBILITY_TIMEOUT,
+        )
+        .returning(*jobs_table.c)
+    )
+    return await db.fetch_one(query)
+
+
+class LeaseLostError(Exception):
+    pass
+
+
+class Lease:
+    """A claimed job's lock; only its holder may renew it or record a result.
+
+    A worker that stalled past ``locked_until`` may find its job claimed by
+    another worker, and must then leave the job alone.
+    """
+
+    def __init__(self, job_id: int, locked_until: float) -> None:
+        self.job_id = job_id
+        self.locked_until = locked_until
+
+    def _update(self, **values):
+        return (
+            jobs_table.update()
+            .where(
+                jobs_table.c.id == self.job_id,
+                jobs_table.c.locked_until == self.locked_until,
+            )
+            .values(**values)
+            .returning(jobs_table.c.id)
+        )
+
+    async def renew(self, db: Database) -> bool:
+        locked_until = time.time() + config.JOB_VISIBILITY_TIMEOUT
+        if await db.fetch_one(self._update(locked_until=locked_until)) is None:
+            return False
+        self.locked_until = locked_until
+        return True
+
+    async def finish(self, db: Database, **values) -> None:
+        if await db.fetch_one(self._update(locked_until=None, **values)) is None:
+            logger.warning(
+                f"Job {self.job_id} was claimed by another worker,"
+                " not recording its result"
+            )
+
+
+async def _run_renewing_lease(handler: Awaitable, lease: Lease, db: Database):
+    # The handler stays on this task, and so on this task's connection; a
+    # side task renews the lease and cancels the handler if it was lost.
+    running = asyncio.current_task()
+    lost = False
+
+    async def renew_forever() -> None:
+        nonlocal lost
+        while True:
+            await asyncio.sleep(config.JOB_VISIBILITY_TIMEOUT / 3)
+            try:
+                renewed = await lease.renew(db)
+            except Exception:
+                logger.exception(f"Could not renew the lease of job {lease.job_id}")
+                continue
+            if not renewed:
+                lost = True
+                running.cancel()
+                return
+
+    renewer = asyncio.create_task(renew_forever())
+    try:
+        return await asyncio.wait_for(handler, config.JOB_TIMEOUT)
+    except asyncio.CancelledError:
+        if not lost:
+            raise
+        running.uncancel()
+        raise LeaseLostError(f"Job {lease.job_id} lost its lease")
+    finally:
+        renewer.cancel()
+
+
+async def run_job(job, db: Database = database) -> None:
+    lease = Lease(job.id, job.locked_until)
+    if job.attempts > job.max_attempts:
+        logger.error(f"Job {job.id} ({job.task}) exhausted its attempts")
+        await lease.finish(db, status=DEAD)
+        return
+
+    handler = JOB_HANDLERS.get(job.task)
+    if handler is None:
+        logger.error(f"Job {job.id} has unknown task '{job.task}'")
+        await lease.finish(db, status=DEAD, last_error="Unknown task")
+        return
+
+    logger.info(f"Running job {job.id} ({job.task}), attempt {job.attempts}")
+    started = time.perf_counter()
+    try:
+        # Jobs act on rows their producer has only just written.
+        with primary_reads():
+            await _run_renewing_lease(handler(**json.loads(job.payload)), lease, db)
+    except LeaseLostError:
+        # Another worker owns the job now and runs it again.
+        logger.warning(f"Job {job.id} ({job.task}) lost its lease, abandoning it")
+        return
+    except Exception as e:
+        elapsed = time.perf_counter() - started
+        error = f"{type(e).__name__}: {e}"
+        if job.attempts >= job.max_attempts:
+            logger.error(f"Job {job.id} ({job.task}) failed for good: {error}")
+            labelled(JOB_DURATION, job.task, DEAD).observe(elapsed)
+            await lease.finish(db, status=DEAD, last_error=error)
+        else:
+            labelled(JOB_DURATION, job.task, "retry").observe(elapsed)
+            delay = backoff_delay(job.attempts)
+            logger.warning(
+                f"Job {job.id} ({job.task}) failed, retrying in {delay:.1f}s: {error}"
+            )
+            await lease.finish(
+                db,
+                status=QUEUED,
+                run_at=time.time() + delay,
+                last_error=error,
+            )
+        return
+
+    labelled(JOB_DURATION, job.task, DONE).observe(time.perf_counter() - started)
+    await lease.finish(db, status=DONE, last_error=None)
+
+
+async def run_pending_jobs(db: Database = database) -> int:
+    # Drain every job that is due right now; used by tests and one-off runs.
+    ran = 0
+    while job := await claim_job(db):
+        await run_job(job, db)
+        ran += 1
+    return ran
+
+
+async def queue_stats(db: Database = database) -> dict:
+    rows = await db.fetch_all(
+        sqlalchemy.select(jobs_table.c.status, sqlalchemy.func.count()).group_by(
+            jobs_table.c.status
+        )
+    )
+    return {QUEUED: 0, RUNNING: 0, DONE: 0, DEAD: 0, **{row[0]: row[1] for row in rows}}
+
+
+async def purge_finished_jobs(db: Database = database) -> None:
+    # run_at is when a job last became due, so roughly when it finished.
+    await db.execute(
+        jobs_table.delete().where(
+            jobs_table.c.status.in_([DONE, DEAD]),
+            jobs_table.c.run_at < time.time() - config.JOB_RETENTION,
+        )
+    )
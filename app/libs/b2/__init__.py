@@ -1,5 +1,6 @@
 import logging
 from functools import lru_cache
+from typing import BinaryIO
 
 import b2sdk.v2 as b2
 from app.config import config
@@ -11,7 +12,7 @@ logger = logging.getLogger(__name__)
 @lru_cache()
 def b2_api():
     info = b2.InMemoryAccountInfo()
-    b2_api = b2.B2Api(info)
+    b2_api = b2.B2Api(info, max_upload_workers=config.UPLOAD_PART_WORKERS)
 
     b2_api.authorize_account("production", config.B2_KEY_ID, config.B2_APPLICATION_KEY)
 
@@ -38,3 +39,25 @@ def b2_upload_file(local_file: str, file_name: str) -> str:
     )
 
     return download_url
+
+
+def b2_upload_stream(stream: BinaryIO, file_name: str) -> str:
+    api = b2_api()
+    logger.debug(f"Streaming {file_name} to B2 as a large file")
+
+    # Parts are read straight from the stream into a fixed set of buffers;
+    # while one fills the others upload in parallel, which bounds memory to
+    # UPLOAD_STREAM_BUFFERS * UPLOAD_PART_SIZE per transfer.
+    uploaded_file = b2_get_bucket(api).upload_unbound_stream(
+        stream,
+        file_name,
+        recommended_upload_part_size=config.UPLOAD_PART_SIZE,
+        buffers_count=config.UPLOAD_STREAM_BUFFERS,
+        buffer_size=config.UPLOAD_PART_SIZE,
+    )
+
+    download_url = api.get_download_url_for_fileid(uploaded_file.id_)
+    logger.debug(f"Streamed {file_name} to B2 successfully")
+
+    return download_url
+
@@ -0,0 +1,90 @@
+"""Pillow rendering of image derivatives.
+
+Runs inside the image worker processes, so it must not import the rest of
+the app (config, database) to keep spawn start-up cheap. The API processes
+import this module only to name these functions for the process pool, so
+Pillow itself is imported by the functions that use it.
+"""
+
+import os
+import resource
+from typing import TYPE_CHECKING, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+class VariantSpec(NamedTuple):
+    name: str
+    max_size: int
+    format: str
+
+
+VARIANTS = (
+    VariantSpec("thumb_webp", 320, "WEBP"),
+    VariantSpec("thumb_jpeg", 320, "JPEG"),
+    VariantSpec("large_webp", 1600, "WEBP"),
+    VariantSpec("large_jpeg", 1600, "JPEG"),
+)
+
+EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+CONTENT_TYPES = {"WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+
+def limit_worker_memory(max_pixels: int, memory_limit: Optional[int]) -> None:
+    # Process pool initializer: refuse decompression bombs and cap the
+    # address space so one huge image kills its worker, not the host.
+    from PIL import Image
+
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def _flatten(image: "Image.Image") -> "Image.Image":
+    from PIL import Image
+
+    if image.mode in ("RGB", "L"):
+        return image
+    if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def render_variants(
+    source: str,
+    output_dir: str,
+    quality: int,
+    variants: tuple[VariantSpec, ...] = VARIANTS,
+) -> list[dict]:
+    from PIL import Image, ImageOps
+
+    largest = max(variant.max_size for variant in variants)
+    rendered = []
+    with Image.open(source) as image:
+        # For JPEG sources, decode straight at a reduced scale instead of
+        # materialising the full-resolution bitmap.
+        image.draft("RGB", (largest, largest))
+        image = _flatten(ImageOps.exif_transpose(image))
+
+        # Biggest first, so each smaller variant resizes an already
+        # shrunk copy.
+        for variant in sorted(variants, key=lambda v: v.max_size, reverse=True):
+            image.thumbnail((variant.max_size, variant.max_size))
+            path = os.path.join(
+                output_dir, f"{variant.name}.{EXTENSIONS[variant.format]}"
+            )
+            image.save(path, variant.format, quality=quality, optimize=True)
+            rendered.append(
+                {
+                    "name": variant.name,
+                    "path": path,
+                    "width": image.width,
+                    "height": image.height,
+                    "content_type": CONTENT_TYPES[variant.format],
+                }
+            )
+    return rendered
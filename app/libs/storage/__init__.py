@@ -0,0 +1,133 @@
+import logging
+import os
+import shutil
+import time
+import uuid
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Callable, Optional, Union
+
+from app.config import config
+from app.executors import BoundedExecutor
+from app.metrics import UPSTREAM_LATENCY, labelled
+
+logger = logging.getLogger(__name__)
+
+# Storage clients are blocking, so transfers run here rather than on the event loop.
+transfer_executor = BoundedExecutor(
+    "storage-transfer",
+    max_workers=config.UPLOAD_MAX_CONCURRENCY,
+    max_pending=config.UPLOAD_MAX_PENDING,
+)
+transfer_stats = {"uploads": 0, "bytes": 0, "seconds": 0.0}
+
+
+class StorageBackend(ABC):
+    """Blocking object storage client; calls are made on transfer_executor."""
+
+    @abstractmethod
+    def upload_file(self, local_file: str, file_name: str) -> str: ...
+
+    @abstractmethod
+    def upload_stream(self, stream: BinaryIO, file_name: str) -> str: ...
+
+
+class B2Storage(StorageBackend):
+    def upload_file(self, local_file: str, file_name: str) -> str:
+        from app.libs.b2 import b2_upload_file
+
+        return b2_upload_file(local_file, file_name)
+
+    def upload_stream(self, stream: BinaryIO, file_name: str) -> str:
+        from app.libs.b2 import b2_upload_stream
+
+        return b2_upload_stream(stream, file_name)
+
+
+class LocalStorage(StorageBackend):
+    """Stores files on local disk and serves them from ``base_url``.
+
+    Meant for single-node deployments, development and benchmarks where
+    talking to the real object store is not wanted.
+    """
+
+    def __init__(self, root: Union[str, Path], base_url: str) -> None:
+        self.root = Path(root).resolve()
+        self.base_url = base_url.rstrip("/")
+
+    def _new_key(self, file_name: str) -> str:
+        # A random directory per upload keeps the original name in the URL
+        # without letting two uploads of "image.png" overwrite each other.
+        return f"{uuid.uuid4().hex}/{os.path.basename(file_name) or 'file'}"
+
+    def _create(self, key: str) -> Path:
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def upload_file(self, local_file: str, file_name: str) -> str:
+        key = self._new_key(file_name)
+        logger.debug(f"Copying {local_file} to local storage as {key}")
+        # copyfile uses sendfile on Linux, so the bytes stay in the kernel.
+        shutil.copyfile(local_file, self._create(key))
+        return f"{self.base_url}/{key}"
+
+    def upload_stream(self, stream: BinaryIO, file_name: str) -> str:
+        key = self._new_key(file_name)
+        logger.debug(f"Streaming {file_name} to local storage as {key}")
+        with open(self._create(key), "wb") as f:
+            shutil.copyfileobj(stream, f, config.UPLOAD_PART_SIZE)
+        return f"{self.base_url}/{key}"
+
+    def path_for(self, key: str) -> Optional[Path]:
+        # Resolve symlinks and ".." so a key can never escape the root.
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root) or not path.is_file():
+            return None
+        return path
+
+
+@lru_cache()
+def get_storage() -> StorageBackend:
+    if config.STORAGE_BACKEND == "local":
+        return LocalStorage(config.LOCAL_STORAGE_PATH, config.LOCAL_STORAGE_BASE_URL)
+    return B2Storage()
+
+
+async def run_transfer(
+    upload: Callable[[Union[str, BinaryIO], str], str],
+    source: Union[str, BinaryIO],
+    file_name: str,
+    size: int,
+) -> str:
+    def timed_upload() -> tuple[str, float]:
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            download_url = upload(source, file_name)
+            outcome = "ok"
+        finally:
+            elapsed = time.perf_counter() - started
+            labelled(UPSTREAM_LATENCY, config.STORAGE_BACKEND, outcome).observe(elapsed)
+        return download_url, elapsed
+
+    download_url, elapsed = await transfer_executor.run(
+        timed_upload, timeout=config.UPLOAD_TIMEOUT
+    )
+
+    transfer_stats["uploads"] += 1
+    transfer_stats["bytes"] += size
+    transfer_stats["seconds"] += elapsed
+    logger.debug(f"Transferred {size} bytes in {elapsed:.3f}s")
+    return download_url
+
+
+def upload_stats() -> dict:
+    seconds = transfer_stats["seconds"]
+    return {
+        "backend": config.STORAGE_BACKEND,
+        **transfer_executor.stats(),
+        **transfer_stats,
+        "bytes_per_second": transfer_stats["bytes"] / seconds if seconds else 0.0,
+    }
@@ -0,0 +1,158 @@
+"""Log file rotation by size or age, with compressed, size-capped backups.
+
+A rollover only renames the current file to a timestamped name and opens a
+new one, so it costs the logging thread a single rename. Compressing the
+rotated segment and pruning old ones down to ``retention_bytes`` happen on
+a background thread.
+"""
+
+import gzip
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from logging.handlers import BaseRotatingHandler
+from typing import Optional
+
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+
+
+def _compress_gzip(source: str, destination: str) -> None:
+    with open(source, "rb") as src, gzip.open(destination, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+
+
+def _compress_zstd(source: str, destination: str) -> None:
+    import zstandard
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        zstandard.ZstdCompressor().copy_stream(src, dst)
+
+
+COMPRESSORS = {"gzip": _compress_gzip, "zstd": _compress_zstd}
+
+
+class CompressingRotatingFileHandler(BaseRotatingHandler):
+    """Rolls ``filename`` over at ``max_bytes`` or every ``interval`` seconds.
+
+    Rotated segments are named ``<filename>.<YYYYmmdd-HHMMSS>`` and then
+    compressed with ``compression`` ("gzip", "zstd" or "none"). Segments,
+    oldest first, are deleted while all of them together exceed
+    ``retention_bytes``.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: int,
+        interval: Optional[float] = None,
+        retention_bytes: Optional[int] = None,
+        compression: str = "gzip",
+        encoding: Optional[str] = None,
+    ) -> None:
+        if compression not in SUFFIXES:
+            raise ValueError(f"Unknown log compression {compression!r}")
+        if compression == "zstd":
+            # Fail at startup rather than on the first rollover.
+            import zstandard  # noqa: F401
+
+        super().__init__(filename, "a", encoding=encoding, delay=True)
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.retention_bytes = retention_bytes
+        self.compression = compression
+        self.rollover_at = self._next_rollover()
+        self._rotated: queue.Queue[Optional[str]] = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+
+    def _next_rollover(self) -> Optional[float]:
+        return time.time() + self.interval if self.interval else None
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        if self.stream is None:
+            self.stream = self._open()
+        return self.max_bytes > 0 and self.stream.tell() >= self.max_bytes
+
+    def rotated_name(self) -> str:
+        name = f"{self.baseFilename}.{time.strftime('%Y%m%d-%H%M%S')}"
+        candidate, attempt = name, 0
+        while any(
+            os.path.exists(candidate + suffix) for suffix in ("", *SUFFIXES.values())
+        ):
+            attempt += 1
+            candidate = f"{name}-{attempt}"
+        return candidate
+
+    def doRollover(self) -> None:
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename):
+            rotated = self.rotated_name()
+            os.rename(self.baseFilename, rotated)
+            self._rotated.put(rotated)
+            self._start_worker()
+        self.rollover_at = self._next_rollover()
+
+    def _start_worker(self) -> None:
+        # A plain thread rather than an executor: the queue listener still
+        # writes, and may roll over, from atexit, after executors stop
+        # accepting work.
+        if self._worker is None:
+            self._worker = threading.Thread(
+                target=self._work, name="log-rotation", daemon=True
+            )
+            self._worker.start()
+
+    def _work(self) -> None:
+        while (rotated := self._rotated.get()) is not None:
+            self._finish_rotation(rotated)
+
+    def _finish_rotation(self, rotated: str) -> None:
+        try:
+            if self.compression != "none":
+                compressed = rotated + SUFFIXES[self.compression]
+                COMPRESSORS[self.compression](rotated, compressed + ".tmp")
+                os.replace(compressed + ".tmp", compressed)
+                os.remove(rotated)
+            if self.retention_bytes is not None:
+                self.prune()
+        except Exception:
+            # Logging about it through this handler could fail the same way;
+            # report it like any other failure inside a handler.
+            self.handleError(
+                logging.makeLogRecord({"msg": f"Could not finish rotating {rotated}"})
+            )
+
+    def segments(self) -> list[str]:
+        directory, base = os.path.split(self.baseFilename)
+        return sorted(
+            (
+                os.path.join(directory, name)
+                for name in os.listdir(directory)
+                if name.startswith(f"{base}.") and not name.endswith(".tmp")
+            ),
+            key=os.path.getmtime,
+        )
+
+    def prune(self) -> None:
+        segments = self.segments()
+        sizes = [os.path.getsize(path) for path in segments]
+        total = sum(sizes)
+        for path, size in zip(segments, sizes):
+            if total <= self.retention_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def close(self) -> None:
+        # Let pending compressions finish so no uncompressed segment is left.
+        if self._worker is not None:
+            self._rotated.put(None)
+            self._worker.join()
+            self._worker = None
+        super().close()
@@ -1,6 +1,25 @@
+import atexit
+import copy
 import logging
+import queue
+import threading
+import time
+import zlib
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from asgi_correlation_id import correlation_id
+
 from app.config import DevConfig, config
+from app.log_rotation import CompressingRotatingFileHandler
+
+# Handlers that do formatting and I/O; with LOG_QUEUE_ENABLED they run on the
+# listener thread instead of being attached to the loggers.
+OUTPUT_HANDLERS = ("default", "rotating_file")
+
+_listener: Optional["LogQueueListener"] = None
+_rate_limit: Optional["LogRateLimitFilter"] = None
 
 
 def obfuscated(email: str, obfuscated_length: int) -> str:
@@ -21,7 +40,211 @@ class EmailObfuscationFilter(logging.Filter):
         return True
 
 
+class LogRateLimitFilter(logging.Filter):
+    """Token-bucket limit on repetitive records, per logging call site.
+
+    Each call site (logger and line, so one message template however its
+    arguments vary) may pass ``rate`` records a second with bursts of up to
+    ``burst``. Records at ERROR and above always pass, as does everything
+    logged during the ``trace_sample_rate`` share of requests picked by
+    their correlation id, so some requests keep a complete trail. How many
+    records each call site lost is logged every ``summary_interval``
+    seconds.
+
+    The decision is stored on the record, so a record that passes through
+    several handlers with this filter uses only one token.
+    """
+
+    def __init__(
+        self,
+        name: str = "",
+        rate: float = 10,
+        burst: int = 50,
+        trace_sample_rate: float = 0.01,
+        summary_interval: float = 60,
+    ) -> None:
+        super().__init__(name)
+        self.rate = rate
+        self.burst = burst
+        self.trace_sample_rate = trace_sample_rate
+        self.summary_interval = summary_interval
+        self._lock = threading.Lock()
+        self._buckets: dict[tuple[str, int], list[float]] = {}
+        self._suppressed: dict[tuple[str, int], tuple[int, object]] = {}
+        self._summarized_at = time.monotonic()
+        self.suppressed_total = 0
+
+    def is_traced(self, request_id: Optional[str]) -> bool:
+        if request_id is None or self.trace_sample_rate <= 0:
+            return False
+        return (
+            zlib.crc32(request_id.encode()) % 10_000 < self.trace_sample_rate * 10_000
+        )
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        allowed = record.__dict__.get("_rate_limit_allowed")
+        if allowed is None:
+            allowed = self._allow(record)
+            # Underscored so the JSON formatter leaves it out of the output.
+            record._rate_limit_allowed = allowed
+        return allowed
+
+    def _allow(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR or record.__dict__.get("_log_summary"):
+            return True
+        if self.is_traced(correlation_id.get()):
+            return True
+
+        now = time.monotonic()
+        key = (record.name, record.lineno)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            allowed = tokens >= 1
+            bucket[0] = tokens - 1 if allowed else tokens
+
+            if not allowed:
+                count, _ = self._suppressed.get(key, (0, None))
+                self._suppressed[key] = (count + 1, record.msg)
+                self.suppressed_total += 1
+
+            summary = None
+            if now - self._summarized_at >= self.summary_interval:
+                self._summarized_at = now
+                summary, self._suppressed = self._suppressed, {}
+
+        if summary:
+            self._log_summary(summary)
+        return allowed
+
+    def _log_summary(self, summary: dict) -> None:
+        logger = logging.getLogger(__name__)
+        for (name, lineno), (count, message) in summary.items():
+            logger.warning(
+                f"Suppressed {count} records from {name}:{lineno}: {message}",
+                extra={"_log_summary": True},
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = sum(count for count, _ in self._suppressed.values())
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "trace_sample_rate": self.trace_sample_rate,
+            "suppressed_total": self.suppressed_total,
+            "suppressed_since_summary": pending,
+        }
+
+
+class LogQueueHandler(QueueHandler):
+    """Hands records to a bounded queue, dropping or blocking when it is full.
+
+    Filters attached here run on the logging thread, so the correlation id
+    and other context variables are still visible to them.
+    """
+
+    def __init__(self, max_size: int, overflow: str = "drop") -> None:
+        super().__init__(queue.Queue(max_size))
+        self.overflow = overflow
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock prepare merges the arguments into the message and renders
+        # the traceback here, on the logging thread; leave both to the
+        # listener's formatters. The context fields the filters above set are
+        # plain attributes, so the copy carries them as they were.
+        return copy.copy(record)
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stats(self) -> dict:
+        return {
+            "max_size": self.queue.maxsize,
+            "queued": self.queue.qsize(),
+            "overflow": self.overflow,
+            "dropped": self.dropped,
+        }
+
+
+class LogQueueListener(QueueListener):
+    def __init__(self, handler: LogQueueHandler, *handlers: logging.Handler) -> None:
+        super().__init__(handler.queue, *handlers, respect_handler_level=True)
+        self.handler = handler
+
+    def enqueue_sentinel(self) -> None:
+        # Wait for room rather than fail when the queue is full at shutdown.
+        self.queue.put(self._sentinel)
+
+
+def start_log_listener(handler: LogQueueHandler, *handlers: logging.Handler) -> None:
+    global _listener
+    stop_log_listener()
+    _listener = LogQueueListener(handler, *handlers)
+    _listener.start()
+
+
+def stop_log_listener() -> None:
+    """Write out every queued record and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_log_listener)
+
+
+def log_queue_stats() -> dict:
+    if _listener is None:
+        return {"enabled": False}
+    return {"enabled": True, **_listener.handler.stats()}
+
+
+def log_rate_limit_stats() -> dict:
+    if _rate_limit is None:
+        return {"enabled": False}
+    return {"enabled": True, **_rate_limit.stats()}
+
+
 def configure_logging() -> None:
+    global _rate_limit
+    queued = config.LOG_QUEUE_ENABLED
+    stop_log_listener()
+
+    rate_limit = []
+    _rate_limit = None
+    if config.LOG_RATE_LIMIT_ENABLED:
+        _rate_limit = LogRateLimitFilter(
+            rate=config.LOG_RATE_LIMIT_PER_SECOND,
+            burst=config.LOG_RATE_LIMIT_BURST,
+            trace_sample_rate=config.LOG_TRACE_SAMPLE_RATE,
+            summary_interval=config.LOG_SUPPRESSED_SUMMARY_INTERVAL,
+        )
+        rate_limit = [_rate_limit]
+
+    # Filters that read the calling thread's context move from the output
+    # handlers to the queue handler; the rest stay with their destination.
+    context_filters = {
+        "default": [*rate_limit, "correlation_id", "email_obfuscation"],
+        "rotating_file": [*rate_limit, "correlation_id"],
+        "queue": [*rate_limit, "correlation_id"],
+    }
+    if queued:
+        context_filters["default"] = ["email_obfuscation"]
+        context_filters["rotating_file"] = []
+    outputs = ["queue"] if queued else list(OUTPUT_HANDLERS)
+
     dictConfig(
         {
             "version": 1,
@@ -54,40 +277,55 @@ def configure_logging() -> None:
                     "class": "rich.logging.RichHandler",
                     "formatter": "console",
                     "level": "DEBUG",
-                    "filters": ["correlation_id", "email_obfuscation"],
+                    "filters": context_filters["default"],
                 },
                 "rotating_file": {
-                    "class": "logging.handlers.RotatingFileHandler",
-                    "filename": "app.log",
-                    "maxBytes": 1024 * 1024,
-                    "backupCount": 5,
+                    "()": CompressingRotatingFileHandler,
+                    "filename": config.LOG_FILE,
+                    "max_bytes": config.LOG_ROTATE_BYTES,
+                    "interval": config.LOG_ROTATE_INTERVAL,
+                    "retention_bytes": config.LOG_RETENTION_BYTES,
+                    "compression": config.LOG_COMPRESSION,
                     "formatter": "file",
                     "level": "DEBUG",
                     "encoding": "utf8",
-                    "filters": ["correlation_id"],
+                    "filters": context_filters["rotating_file"],
+                },
+                "queue": {
+                    "()": LogQueueHandler,
+                    "max_size": config.LOG_QUEUE_SIZE,
+                    "overflow": config.LOG_QUEUE_OVERFLOW,
+                    "level": "DEBUG",
+                    "filters": context_filters["queue"],
                 },
             },
             "loggers": {
                 "uvicorn": {
-                    "handlers": ["default", "rotating_file"],
+                    "handlers": outputs,
                     "level": "INFO",
                     "propagate": False,
                 },
                 "app": {
-                    "handlers": ["default", "rotating_file"],
+                    "handlers": outputs,
                     "level": "DEBUG" if isinstance(config, DevConfig) else "INFO",
                     "propagate": False,
                 },
                 "database": {
-                    "handlers": ["default", "rotating_file"],
+                    "handlers": outputs,
                     "level": "WARNING",
                     "propagate": False,
                 },
                 "sqlalchemy": {
-                    "handlers": ["default"],
+                    "handlers": outputs[:1],
                     "level": "WARNING",
                     "propagate": False,
                 },
             },
         }
     )
+
+    if queued:
+        start_log_listener(
+            logging.getHandlerByName("queue"),
+            *(logging.getHandlerByName(name) for name in OUTPUT_HANDLERS),
+        )
@@ -1,15 +1,26 @@
 import logging
-import sentry_sdk
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, status
+from fastapi.responses import JSONResponse
 from asgi_correlation_id import CorrelationIdMiddleware
 from fastapi.exception_handlers import http_exception_handler
 from app.database import database
 from app.routers.routes_posts import router as posts_router
 from app.routers.routes_users import router as users_router
 from app.routers.routes_upload import router as upload_router
-from app.logging_conf import configure_logging
+from app.routers.routes_stats import router as stats_router
+from app.routers.routes_files import router as files_router
+from app.routers.routes_metrics import router as metrics_router
+from app.logging_conf import configure_logging, stop_log_listener
+from app.metrics import MetricsMiddleware, mark_process_dead, track_in_flight
 from app.config import config
+from app.db_pool import PoolTimeoutError
+from app.db_routing import ReadYourWritesMiddleware
+from app.executors import ExecutorBusyError
+from app.http_clients import close_http_clients, start_http_clients
+from app.libs.storage import transfer_executor
+from app.migrations import pending_migrations
+from app.security import password_hash_executor
 
 
 logger = logging.getLogger("app")
@@ -20,27 +31,63 @@ async def lifespan(app: FastAPI):
     configure_logging()
     logger.info("Starting up...")
     await database.connect()
+    pending = await pending_migrations(database)
+    if pending:
+        logger.warning(
+            f"Database schema is behind, run python -m app.migrations: {pending}"
+        )
+    await start_http_clients()
     yield
+    await close_http_clients()
     await database.disconnect()
+    password_hash_executor.shutdown()
+    transfer_executor.shutdown()
+    mark_process_dead()
+    logger.info("Shut down")
+    stop_log_listener()
 
 
-sentry_sdk.init(
-    dsn=config.SENTRY_DNS,
-    # Add data like request headers and IP for users,
-    # see https://docs.sentry.io/platforms/python/data-management/data-collected/ for more info
-    send_default_pii=True,
-)
+if config.SENTRY_DNS:
+    # Imported only when reporting is configured, it is slow to load.
+    import sentry_sdk
+
+    sentry_sdk.init(
+        dsn=config.SENTRY_DNS,
+        # Add data like request headers and IP for users,
+        # see https://docs.sentry.io/platforms/python/data-management/data-collected/ for more info
+        send_default_pii=True,
+    )
 
 
 app = FastAPI(lifespan=lifespan)
 app.add_middleware(CorrelationIdMiddleware)
+app.add_middleware(MetricsMiddleware)
+if config.DATABASE_REPLICA_URLS:
+    app.add_middleware(
+        ReadYourWritesMiddleware, sticky_seconds=config.REPLICA_STICKY_SECONDS
+    )
 
 app.include_router(posts_router)
 app.include_router(users_router)
 app.include_router(upload_router)
+app.include_router(stats_router)
+app.include_router(files_router)
+app.include_router(metrics_router)
+track_in_flight(app.routes)
 
 
 @app.exception_handler(HTTPException)
 async def http_exception_handle_logging(request, exc):
     logger.error(f"HTTP Exception: {exc.detail}")
     return await http_exception_handler(request, exc)
+
+
+@app.exception_handler(ExecutorBusyError)
+@app.exception_handler(PoolTimeoutError)
+async def service_busy_handler(request, exc):
+    logger.warning(f"Rejecting request, {exc}")
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, please retry shortly"},
+        headers={"Retry-After": "1"},
+    )
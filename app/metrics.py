@@ -0,0 +1,216 @@
+"""Prometheus metrics, served at /metrics.
+
+Metrics are recorded in-process with prometheus_client, so recording one is
+a dictionary lookup and an increment. To aggregate several uvicorn workers
+(and app.worker) set PROMETHEUS_MULTIPROC_DIR to a directory shared by all
+of them, emptied before they start: every process then writes its values to
+files there and /metrics, whichever worker serves it, sums them up.
+"""
+
+import os
+import time
+from typing import Any, Hashable
+
+from sqlalchemy.sql import Select
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+)  # fmt: skip
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time to serve a request, by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests being handled, by route template",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds",
+    "Time to run a database statement, including waiting for a connection",
+    ["statement"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_POOL_MAX = Gauge(
+    "db_pool_max_connections",
+    "Connections a pool may hand out",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_IN_USE = Gauge(
+    "db_pool_connections_in_use",
+    "Connections checked out of a pool",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_WAITERS = Gauge(
+    "db_pool_waiters",
+    "Callers waiting for a free connection",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_ACQUIRE = Histogram(
+    "db_pool_acquire_duration_seconds",
+    "Time spent waiting for a free connection",
+    ["pool"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_POOL_TIMEOUTS = Counter(
+    "db_pool_acquire_timeouts",
+    "Acquires that gave up because the pool was exhausted",
+    ["pool"],
+)
+JOBS = Gauge(
+    "jobs",
+    "Background jobs by status, as of the last scrape",
+    ["status"],
+    multiprocess_mode="mostrecent",
+)
+JOB_DURATION = Histogram(
+    "job_duration_seconds",
+    "Time to run a background job, by task and outcome",
+    ["task", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+EXECUTOR_PENDING = Gauge(
+    "executor_pending",
+    "Calls admitted to a bounded executor, running or waiting",
+    ["executor"],
+    multiprocess_mode="livesum",
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds",
+    "Time until an upstream service answered, by upstream and status",
+    ["upstream", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+_children: dict[tuple, Any] = {}
+
+
+def labelled(metric: Any, *labels: Hashable) -> Any:
+    """``metric.labels(*labels)``, cached so the hot path takes no lock."""
+    key = (metric, labels)
+    child = _children.get(key)
+    if child is None:
+        child = _children[key] = metric.labels(*labels)
+    return child
+
+
+def statement_name(query: Any) -> str:
+    """A label for a statement: its CachedStatement name, else verb and table."""
+    name = getattr(query, "name", None)
+    if isinstance(name, str):
+        return name
+    if isinstance(query, str):
+        return query.split(None, 1)[0].lower() if query.strip() else "empty"
+    query = getattr(query, "statement", query)
+    if isinstance(query, Select):
+        froms = query.columns_clause_froms
+        table = getattr(froms[0], "name", None) if froms else None
+        return f"select_{table}" if table else "select"
+    table = getattr(query, "table", None)
+    verb = query.__visit_name__
+    return f"{verb}_{table.name}" if table is not None else verb
+
+
+def multiprocess_enabled() -> bool:
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+def render_metrics() -> tuple[bytes, str]:
+    registry = REGISTRY
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    # Drops this process's live gauges (in-flight, pool usage) from the sums.
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(os.getpid())
+
+
+class MetricsMiddleware:
+    """Records the latency of every request under its route template.
+
+    The router stores the matched route in the scope, so the template is
+    read from there once the request is done; requests no route matched are
+    recorded as "unmatched" to keep raw paths out of the labels.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            labelled(
+                REQUEST_LATENCY,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status,
+            ).observe(time.perf_counter() - started)
+
+
+class InFlight:
+    """Wraps a route's ``handle`` to count the requests it is handling."""
+
+    def __init__(self, handle: ASGIApp, route: str) -> None:
+        self.handle = handle
+        self.route = route
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        gauge = labelled(REQUESTS_IN_FLIGHT, scope.get("method", ""), self.route)
+        gauge.inc()
+        try:
+            await self.handle(scope, receive, send)
+        finally:
+            gauge.dec()
+
+
+def track_in_flight(routes: list) -> None:
+    """Count in-flight requests on each route, under its template.
+
+    The template is only known once a route matched, after any middleware
+    has run, so the count is kept by the route itself. FastAPI hands an
+    included router's requests to the original route's ``handle``, so that
+    is what gets wrapped.
+    """
+    for route in routes:
+        router = getattr(route, "original_router", None)
+        if router is not None:
+            track_in_flight(router.routes)
+        elif hasattr(route, "path") and not isinstance(route.handle, InFlight):
+            route.handle = InFlight(route.handle, route.path)
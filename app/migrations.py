@@ -0,0 +1,450 @@
+"""Versioned schema migrations.
+
+The app never creates or alters tables itself; run
+``python -m app.migrations`` (or ``upgrade``) before starting it, and
+``python -m app.migrations status`` to list applied and pending versions.
+
+Each entry in MIGRATIONS runs once, in order, and is recorded in
+schema_migrations. Every version carries its own frozen copy of the DDL it
+runs, so later edits to app.database never change it. Schema changes go in
+as a new entry at the end; one that has shipped is never edited. Every step
+is idempotent, so a migration that was interrupted before being recorded
+can simply run again. Concurrent upgrades never apply the same version
+twice. On PostgreSQL indexes are built with CREATE INDEX CONCURRENTLY so
+reads and writes keep flowing while they build.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import time
+from typing import AsyncIterator, Awaitable, Callable
+
+import sqlalchemy
+from databases import Database
+from sqlalchemy.schema import CreateTable
+
+from app.database import (
+    database,
+    dialect_insert,
+    likes_table,
+    schema_migrations_table,
+)
+from app.db_routing import primary_reads
+from app.logging_conf import configure_logging
+from app.reconcile import reconcile_post_counters
+
+logger = logging.getLogger(__name__)
+
+UNIQUE_INDEX_ATTEMPTS = 3
+# Any constant shared by every process that runs upgrades.
+MIGRATION_LOCK_KEY = 0x6D696772
+
+# The schema each version creates, frozen as it shipped. Editing a table in
+# app.database does not change these; the change goes in a new version.
+schema = sqlalchemy.MetaData()
+
+schema_migrations = sqlalchemy.Table(
+    "schema_migrations",
+    schema,
+    sqlalchemy.Column("version", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("name", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("applied_at", sqlalchemy.Float, nullable=False),
+)
+
+# Version 1
+v1_tables = [
+    sqlalchemy.Table(
+        "user",
+        schema,
+        sqlalchemy.Column(
+            "id", sqlalchemy.Integer, autoincrement=True, primary_key=True
+        ),
+        sqlalchemy.Column("name", sqlalchemy.String),
+        sqlalchemy.Column("email", sqlalchemy.String, unique=True),
+        sqlalchemy.Column("password", sqlalchemy.String),
+        sqlalchemy.Column("confirmed", sqlalchemy.Boolean),
+    ),
+    sqlalchemy.Table(
+        "posts",
+        schema,
+        sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+        sqlalchemy.Column("body", sqlalchemy.String, nullable=False),
+        sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("user.id")),
+        sqlalchemy.Column("image_url", sqlalchemy.String),
+    ),
+    sqlalchemy.Table(
+        "comments",
+        schema,
+        sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+        sqlalchemy.Column("body", sqlalchemy.String, nullable=False),
+        sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("posts.id")),
+        sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("user.id")),
+    ),
+    sqlalchemy.Table(
+        "likes",
+        schema,
+        sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+        sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("posts.id")),
+        sqlalchemy.Column("user_id", sqlalchemy.ForeignKey("user.id")),
+    ),
+]
+
+# Columns of the version 1 tables that databases created by the app before
+# migrations existed can lack.
+BASELINE_COLUMNS = {
+    "user": {"confirmed": "BOOLEAN"},
+    "posts": {
+        "user_id": 'INTEGER REFERENCES "user" (id)',
+        "image_url": "VARCHAR",
+    },
+    "comments": {"user_id": 'INTEGER REFERENCES "user" (id)'},
+}
+
+# Version 2
+COUNTER_COLUMNS = {
+    "like_count": "INTEGER NOT NULL DEFAULT 0",
+    "comment_count": "INTEGER NOT NULL DEFAULT 0",
+}
+# (name, table, columns)
+V2_INDEXES = [
+    ("ix_comments_post_id", "comments", ("post_id",)),
+    ("ix_likes_user_id", "likes", ("user_id",)),
+    ("ix_posts_like_count_id", "posts", ("like_count", "id")),
+    ("ix_posts_user_id", "posts", ("user_id",)),
+]
+
+# Version 4
+jobs = sqlalchemy.Table(
+    "jobs",
+    schema,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("task", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("payload", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("status", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("attempts", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("max_attempts", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("run_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Column("locked_until", sqlalchemy.Float),
+    sqlalchemy.Column("idempotency_key", sqlalchemy.String),
+    sqlalchemy.Column("last_error", sqlalchemy.String),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+)
+
+# Version 5
+files = sqlalchemy.Table(
+    "files",
+    schema,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("content_hash", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("size", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("file_url", sqlalchemy.String),
+    sqlalchemy.Column("status", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("ref_count", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("claimed_at", sqlalchemy.Float),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+)
+
+# Version 6
+upload_sessions = sqlalchemy.Table(
+    "upload_sessions",
+    schema,
+    sqlalchemy.Column("id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("file_name", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("size", sqlalchemy.Integer),
+    sqlalchemy.Column("received", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("status", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("file_url", sqlalchemy.String),
+    sqlalchemy.Column("locked_until", sqlalchemy.Float),
+    sqlalchemy.Column("created_at", sqlalchemy.Float, nullable=False),
+    sqlalchemy.Column("updated_at", sqlalchemy.Float, nullable=False),
+)
+
+# Version 7
+post_images = sqlalchemy.Table(
+    "post_images",
+    schema,
+    sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("post_id", sqlalchemy.ForeignKey("posts.id"), nullable=False),
+    sqlalchemy.Column("name", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("url", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("width", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("height", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("content_type", sqlalchemy.String, nullable=False),
+)
+
+
+def _is_postgres(database: Database) -> bool:
+    return database.url.dialect == "postgresql"
+
+
+async def create_table(database: Database, table: sqlalchemy.Table) -> None:
+    logger.debug(f"Creating table {table.name}")
+    await database.execute(CreateTable(table, if_not_exists=True))
+
+
+async def add_columns(database: Database, table: str, columns: dict[str, str]) -> None:
+    if _is_postgres(database):
+        existing = set()
+    else:
+        rows = await database.fetch_all(f'PRAGMA table_info("{table}")')
+        existing = {row["name"] for row in rows}
+
+    for column, definition in columns.items():
+        if column in existing:
+            continue
+        logger.info(f"Adding column {table}.{column}")
+        # Adding a column with a constant default is a metadata-only change on
+        # PostgreSQL 11+ and SQLite, so no table rewrite happens.
+        if_not_exists = "IF NOT EXISTS " if _is_postgres(database) else ""
+        await database.execute(
+            f'ALTER TABLE "{table}" ADD COLUMN {if_not_exists}"{column}" {definition}'
+        )
+
+
+async def remove_duplicate_likes(database: Database) -> None:
+    keep = (
+        sqlalchemy.select(sqlalchemy.func.min(likes_table.c.id))
+        .group_by(likes_table.c.post_id, likes_table.c.user_id)
+        .scalar_subquery()
+    )
+    query = likes_table.delete().where(likes_table.c.id.not_in(keep))
+    logger.debug("Executing query: %s", query)
+    await database.execute(query)
+
+
+async def _drop_invalid_index(database: Database, name: str) -> None:
+    # A failed CONCURRENTLY build leaves an INVALID index behind, which
+    # IF NOT EXISTS would otherwise happily skip.
+    invalid = await database.fetch_val(
+        "SELECT NOT i.indisvalid FROM pg_class c"
+        " JOIN pg_index i ON i.indexrelid = c.oid WHERE c.relname = :name",
+        values={"name": name},
+    )
+    if invalid:
+        logger.warning(f"Dropping invalid index {name}")
+        await database.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+
+
+async def create_index(
+    database: Database,
+    name: str,
+    table: str,
+    columns: tuple[str, ...],
+    unique: bool = False,
+) -> None:
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    concurrently = "CONCURRENTLY " if _is_postgres(database) else ""
+
+    if _is_postgres(database):
+        await _drop_invalid_index(database, name)
+
+    logger.info(f"Creating index {name}")
+    await database.execute(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX {concurrently}IF NOT EXISTS"
+        f' "{name}" ON "{table}" ({column_list})'
+    )
+
+
+async def create_unique_likes_index(database: Database) -> None:
+    # Duplicates can be inserted between the clean-up and the index build, so
+    # retry a few times; once the index exists the upsert keeps them out.
+    for attempt in range(1, UNIQUE_INDEX_ATTEMPTS + 1):
+        await remove_duplicate_likes(database)
+        try:
+            await create_index(
+                database, "uq_likes_post_user", "likes", ("post_id", "user_id"), True
+            )
+            return
+        except Exception:
+            if attempt == UNIQUE_INDEX_ATTEMPTS:
+                raise
+            logger.warning("Building uq_likes_post_user failed, retrying")
+
+
+async def add_baseline_columns(database: Database) -> None:
+    for table, columns in BASELINE_COLUMNS.items():
+        await add_columns(database, table, columns)
+
+
+async def create_tables(database: Database) -> None:
+    for table in v1_tables:
+        await create_table(database, table)
+    # Tables made by the app before migrations existed are left in place.
+    await add_baseline_columns(database)
+
+
+async def add_counters_and_indexes(database: Database) -> None:
+    await add_columns(database, "posts", COUNTER_COLUMNS)
+    for name, table, columns in V2_INDEXES:
+        await create_index(database, name, table, columns)
+    await create_unique_likes_index(database)
+    await reconcile_post_counters(database)
+
+
+async def create_jobs(database: Database) -> None:
+    await create_table(database, jobs)
+    await create_index(database, "ix_jobs_status_run_at", "jobs", ("status", "run_at"))
+    await create_index(
+        database, "uq_jobs_idempotency_key", "jobs", ("idempotency_key",), True
+    )
+
+
+async def create_files(database: Database) -> None:
+    await create_table(database, files)
+    await create_index(
+        database, "uq_files_content_hash", "files", ("content_hash",), True
+    )
+
+
+async def create_upload_sessions(database: Database) -> None:
+    await create_table(database, upload_sessions)
+    await create_index(
+        database, "ix_upload_sessions_updated_at", "upload_sessions", ("updated_at",)
+    )
+
+
+async def create_post_images(database: Database) -> None:
+    await create_table(database, post_images)
+    await create_index(
+        database, "uq_post_images_post_name", "post_images", ("post_id", "name"), True
+    )
+
+
+MIGRATIONS: list[tuple[int, str, Callable[[Database], Awaitable[None]]]] = [
+    (1, "create_tables", create_tables),
+    (2, "add_counters_and_indexes", add_counters_and_indexes),
+    # Version 1 used to create whatever app.database held and never added
+    # columns, so databases it ran on can still lack some of its columns.
+    (3, "add_baseline_columns", add_baseline_columns),
+    (4, "create_jobs", create_jobs),
+    (5, "create_files", create_files),
+    (6, "create_upload_sessions", create_upload_sessions),
+    (7, "create_post_images", create_post_images),
+]
+
+
+async def applied_versions(database: Database) -> set[int]:
+    try:
+        rows = await database.fetch_all(
+            sqlalchemy.select(schema_migrations_table.c.version)
+        )
+    except Exception:
+        # No schema_migrations table yet: nothing has been applied.
+        return set()
+    return {row.version for row in rows}
+
+
+async def pending_migrations(database: Database) -> list[tuple[int, str]]:
+    applied = await applied_versions(database)
+    return [
+        (version, name) for version, name, _ in MIGRATIONS if version not in applied
+    ]
+
+
+@contextlib.asynccontextmanager
+async def migration_lock(database: Database) -> AsyncIterator[None]:
+    """Hold PostgreSQL's advisory lock for migrations, so upgrades run one at a time.
+
+    SQLite has no such lock; there ``_apply`` records each version before
+    changing anything, in the same transaction.
+    """
+    if not _is_postgres(database):
+        yield
+        return
+    # Session-level, so the lock and unlock must use one connection.
+    async with database.connection():
+        await database.execute(
+            "SELECT pg_advisory_lock(:key)", {"key": MIGRATION_LOCK_KEY}
+        )
+        try:
+            yield
+        finally:
+            await database.execute(
+                "SELECT pg_advisory_unlock(:key)", {"key": MIGRATION_LOCK_KEY}
+            )
+
+
+async def _apply(
+    database: Database,
+    version: int,
+    name: str,
+    migrate: Callable[[Database], Awaitable[None]],
+) -> bool:
+    record = dialect_insert(schema_migrations_table).values(
+        version=version, name=name, applied_at=time.time()
+    )
+    if _is_postgres(database):
+        # CREATE INDEX CONCURRENTLY cannot run in a transaction; the advisory
+        # lock keeps other upgrades out instead.
+        await migrate(database)
+        await database.execute(record)
+        return True
+
+    # A concurrent upgrade blocks on the row until this one commits, then
+    # finds the version taken; a failed migration takes its row with it.
+    async with database.transaction():
+        claimed = await database.fetch_val(
+            record.on_conflict_do_nothing(index_elements=["version"]).returning(
+                schema_migrations_table.c.version
+            )
+        )
+        if claimed is None:
+            return False
+        await migrate(database)
+    return True
+
+
+async def upgrade(database: Database) -> list[int]:
+    await database.execute(CreateTable(schema_migrations, if_not_exists=True))
+
+    ran = []
+    # Replicas may lag behind the versions and tables just written.
+    with primary_reads():
+        async with migration_lock(database):
+            applied = await applied_versions(database)
+            for version, name, migrate in MIGRATIONS:
+                if version in applied:
+                    continue
+                logger.info(f"Applying migration {version} {name}")
+                started = time.perf_counter()
+                if not await _apply(database, version, name, migrate):
+                    logger.info(f"Migration {version} was applied by another upgrade")
+                    continue
+                logger.info(
+                    f"Applied migration {version} in {time.perf_counter() - started:.2f}s"
+                )
+                ran.append(version)
+
+    if not ran:
+        logger.info("Schema is up to date")
+    return ran
+
+
+async def status(database: Database) -> None:
+    applied = await applied_versions(database)
+    for version, name, _ in MIGRATIONS:
+        print(
+            f"{version:>4} {name:<32} {'applied' if version in applied else 'pending'}"
+        )
+
+
+async def main(command: str) -> None:
+    configure_logging()
+    await database.connect()
+    try:
+        if command == "status":
+            await status(database)
+        else:
+            await upgrade(database)
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "command", nargs="?", default="upgrade", choices=["upgrade", "status"]
+    )
+    asyncio.run(main(parser.parse_args().command))
@@ -1,4 +1,5 @@
-from pydantic import BaseModel, ConfigDict
+import json
+from pydantic import BaseModel, ConfigDict, field_validator
 from typing import Optional
 
 
@@ -6,12 +7,31 @@ class PostsIn(BaseModel):
     body: str
 
 
+class ImageVariant(BaseModel):
+    name: str
+    url: str
+    width: int
+    height: int
+    content_type: str
+
+
 class PostsOut(PostsIn):
     model_config = ConfigDict(from_attributes=True)
 
     id: int
     user_id: int
     image_url: Optional[str] = None
+    image_variants: list[ImageVariant] = []
+
+    @field_validator("image_variants", mode="before")
+    @classmethod
+    def parse_aggregated_variants(cls, value):
+        # SQLite hands back aggregated JSON as text.
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
 
 
 class CommentsIn(BaseModel):
@@ -38,6 +58,7 @@ class UserPostsWithComments(BaseModel):
 class UserPostsWithCommentsResponse(BaseModel):
     post: UserPostsWithLikes
     comments: list[CommentsOut]
+    next_comments_cursor: Optional[str] = None
 
 
 class PostLikeIn(BaseModel):
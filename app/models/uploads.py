@@ -0,0 +1,17 @@
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class UploadSessionIn(BaseModel):
+    file_name: str
+    size: Optional[int] = Field(default=None, ge=0)
+
+
+class UploadSessionOut(UploadSessionIn):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str
+    received: int
+    status: str
+    file_url: Optional[str] = None
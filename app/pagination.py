@@ -0,0 +1,38 @@
+import base64
+import binascii
+import json
+
+from fastapi import HTTPException, status
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(**position) -> str:
+    raw = json.dumps(position, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, **fields: type) -> dict:
+    # Cursors come from clients, so every field is checked against its type
+    # before it can reach a query.
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        ) from e
+
+    if not isinstance(position, dict) or not all(
+        _is_instance(position.get(key), kind) for key, kind in fields.items()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    return position
+
+
+def _is_instance(value, kind: type) -> bool:
+    # bool is a subclass of int, but never a valid id or count.
+    return isinstance(value, kind) and not isinstance(value, bool)
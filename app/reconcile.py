@@ -0,0 +1,58 @@
+"""Rebuild the denormalized post counters from the likes and comments tables.
+
+Run with ``python -m app.reconcile``.
+"""
+
+import asyncio
+import logging
+
+import sqlalchemy
+from databases import Database
+
+from app.database import comments_table, database, likes_table, post_table
+from app.logging_conf import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+async def reconcile_post_counters(database: Database) -> int:
+    like_count = (
+        sqlalchemy.select(sqlalchemy.func.count(likes_table.c.id))
+        .where(likes_table.c.post_id == post_table.c.id)
+        .scalar_subquery()
+    )
+    comment_count = (
+        sqlalchemy.select(sqlalchemy.func.count(comments_table.c.id))
+        .where(comments_table.c.post_id == post_table.c.id)
+        .scalar_subquery()
+    )
+
+    query = (
+        post_table.update()
+        .where(
+            sqlalchemy.or_(
+                post_table.c.like_count != like_count,
+                post_table.c.comment_count != comment_count,
+            )
+        )
+        .values(like_count=like_count, comment_count=comment_count)
+        .returning(post_table.c.id)
+    )
+    logger.debug("Executing query: %s", query)
+    repaired = await database.fetch_all(query)
+
+    logger.info(f"Reconciled counters for {len(repaired)} posts")
+    return len(repaired)
+
+
+async def main() -> None:
+    configure_logging()
+    await database.connect()
+    try:
+        await reconcile_post_counters(database)
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
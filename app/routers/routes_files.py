@@ -0,0 +1,34 @@
+import logging
+
+from fastapi import APIRouter, HTTPException, Response, status
+from fastapi.responses import FileResponse
+
+from app.config import config
+from app.libs.storage import LocalStorage, get_storage
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/files",
+    tags=["files"],
+)
+
+
+@router.get("/{key:path}")
+async def download_file(key: str):
+    storage = get_storage()
+    path = storage.path_for(key) if isinstance(storage, LocalStorage) else None
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
+        )
+
+    if config.LOCAL_STORAGE_ACCEL_REDIRECT:
+        # Let the fronting nginx send the file with sendfile and handle Range.
+        location = config.LOCAL_STORAGE_ACCEL_REDIRECT.rstrip("/")
+        relative = path.relative_to(storage.root).as_posix()
+        return Response(headers={"X-Accel-Redirect": f"{location}/{relative}"})
+
+    # FileResponse answers Range requests itself and uses zero-copy sends
+    # when the server supports them.
+    return FileResponse(path)
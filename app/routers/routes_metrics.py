@@ -0,0 +1,20 @@
+import logging
+
+from fastapi import APIRouter, Depends, Response
+
+from app.jobs import queue_stats
+from app.metrics import JOBS, render_metrics
+from app.security import require_ops_token
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["metrics"], dependencies=[Depends(require_ops_token)])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    # The job table is the queue, so its depth is read when scraped.
+    for status, count in (await queue_stats()).items():
+        JOBS.labels(status).set(count)
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
@@ -1,8 +1,27 @@
+import json
 import logging
 import sqlalchemy
 from enum import Enum
-from fastapi import APIRouter, HTTPException, status, Depends, BackgroundTasks, Request 
-from app.database import post_table, comments_table, likes_table, database
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    status,
+    Depends,
+    Request,
+    Query,
+)
+from pydantic import TypeAdapter
+from app.cache import POST_LIST_KEY, post_detail_key, response_cache
+from app.database import (
+    post_table,
+    post_images_table,
+    comments_table,
+    likes_table,
+    database,
+    dialect_insert,
+    json_array_agg,
+)
+from app.db_statements import CachedStatement
 from app.models.posts import (
     PostsIn,
     PostsOut,
@@ -13,10 +32,16 @@ from app.models.posts import (
     UserPostsWithCommentsResponse,
     UserPostsWithLikes,
 )
-from typing import Annotated
+from typing import Annotated, Optional
 from app.models.users import UserIn
+from app.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    decode_cursor,
+    encode_cursor,
+)
 from app.security import get_current_user
-from app.tasks import generate_and_add_to_post
+from app.jobs import enqueue
 
 router = APIRouter(
     prefix="/post",
@@ -25,41 +50,70 @@ router = APIRouter(
 
 logger = logging.getLogger(__name__)
 
-select_post_and_likes = (
+image_variants = (
     sqlalchemy.select(
-        post_table, sqlalchemy.func.count(likes_table.c.id).label("likes")
+        json_array_agg(
+            post_images_table.c.name,
+            post_images_table.c.url,
+            post_images_table.c.width,
+            post_images_table.c.height,
+            post_images_table.c.content_type,
+        )
     )
-    .select_from(post_table.outerjoin(likes_table))
-    .group_by(post_table.c.id)
+    .where(post_images_table.c.post_id == post_table.c.id)
+    .scalar_subquery()
+    .label("image_variants")
+)
+
+select_post_and_likes = sqlalchemy.select(
+    post_table, post_table.c.like_count.label("likes"), image_variants
+)
+
+find_post_query = CachedStatement(
+    post_table.select().where(post_table.c.id == sqlalchemy.bindparam("post_id")),
+    name="find_post",
 )
 
+post_list_adapter = TypeAdapter(list[UserPostsWithLikes])
+post_detail_adapter = TypeAdapter(UserPostsWithCommentsResponse)
+
 
 async def findPost(post_id: int):
     logger.info(f"Finding post with id: {post_id}")
-    query = post_table.select().where(post_table.c.id == post_id)
-    logger.debug(f"Executing query: {query}")
-    return await database.fetch_one(query)
+    logger.debug("Executing query: %s", find_post_query)
+    return await database.fetch_one(find_post_query, {"post_id": post_id})
 
 
 @router.post("/", response_model=PostsOut, status_code=status.HTTP_201_CREATED)
 async def create_post(
-    post: PostsIn, current_user: Annotated[UserIn, Depends(get_current_user)], background_task: BackgroundTasks, request: Request, prompt: str = None
+    post: PostsIn,
+    current_user: Annotated[UserIn, Depends(get_current_user)],
+    request: Request,
+    prompt: str = None,
 ):
     logger.info("Creating a new post")
     data = {**post.model_dump(), "user_id": current_user.id}
     query = post_table.insert().values(data)
-    logger.debug(f"Executing query: {query}")
-    last_record_id = await database.execute(query)
-
-    if prompt:
-        background_task.add_task(
-            generate_and_add_to_post,
-            current_user.email,
-            last_record_id,
-            request.url_for("get_post_with_comments", post_id = last_record_id),
-            database,
-            prompt
-        )
+    logger.debug("Executing query: %s", query)
+    # One transaction, so a crash cannot leave a post without its image job.
+    async with database.transaction():
+        last_record_id = await database.execute(query)
+        if prompt:
+            await enqueue(
+                "generate_and_add_to_post",
+                {
+                    "email": current_user.email,
+                    "post_id": last_record_id,
+                    "post_url": str(
+                        request.url_for(
+                            "get_post_with_comments", post_id=last_record_id
+                        )
+                    ),
+                    "prompt": prompt,
+                },
+                idempotency_key=f"post-image:{last_record_id}",
+            )
+    await response_cache.invalidate(POST_LIST_KEY)
 
     return {**data, "id": last_record_id}
 
@@ -70,20 +124,96 @@ class PostSorting(str, Enum):
     most_likes = "most_likes"
 
 
-@router.get(
-    "/", response_model=list[UserPostsWithLikes], status_code=status.HTTP_200_OK
-)
-async def get_all_post(sorting: PostSorting = PostSorting.new):
-    logger.info("Fetching all posts")
+def build_post_list_query(sorting: PostSorting, paged: bool) -> sqlalchemy.Select:
+    after_id = sqlalchemy.bindparam("after_id", type_=sqlalchemy.Integer)
+    after_likes = sqlalchemy.bindparam("after_likes", type_=sqlalchemy.Integer)
 
     if sorting == PostSorting.new:
         query = select_post_and_likes.order_by(post_table.c.id.desc())
+        if paged:
+            query = query.where(post_table.c.id < after_id)
     elif sorting == PostSorting.old:
         query = select_post_and_likes.order_by(post_table.c.id.asc())
+        if paged:
+            query = query.where(post_table.c.id > after_id)
     elif sorting == PostSorting.most_likes:
-        query = select_post_and_likes.order_by(sqlalchemy.desc("likes"))
-    logger.debug(f"Executing query: {query}")
-    return await database.fetch_all(query)
+        query = select_post_and_likes.order_by(
+            post_table.c.like_count.desc(), post_table.c.id.desc()
+        )
+        if paged:
+            query = query.where(
+                sqlalchemy.or_(
+                    post_table.c.like_count < after_likes,
+                    sqlalchemy.and_(
+                        post_table.c.like_count == after_likes,
+                        post_table.c.id < after_id,
+                    ),
+                )
+            )
+
+    return query.limit(sqlalchemy.bindparam("limit", type_=sqlalchemy.Integer))
+
+
+# Every list request has one of these shapes, so each is compiled only once.
+post_list_queries = {
+    (sorting, paged): CachedStatement(
+        build_post_list_query(sorting, paged),
+        name=f"post_list_{sorting.value}{'_paged' if paged else ''}",
+    )
+    for sorting in PostSorting
+    for paged in (False, True)
+}
+
+
+@router.get(
+    "/", response_model=list[UserPostsWithLikes], status_code=status.HTTP_200_OK
+)
+async def get_all_post(
+    sorting: PostSorting = PostSorting.new,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+):
+    logger.info("Fetching all posts")
+
+    return await response_cache.respond(
+        POST_LIST_KEY,
+        f"{sorting.value}:{limit}:{cursor}",
+        lambda: list_posts(sorting, limit, cursor),
+    )
+
+
+async def list_posts(
+    sorting: PostSorting, limit: int, cursor: Optional[str]
+) -> tuple[bytes, dict]:
+    after = None
+    if cursor:
+        after = decode_cursor(cursor, sorting=str, id=int, likes=int)
+        if after["sorting"] != sorting.value:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursor does not match the requested sorting",
+            )
+
+    query = post_list_queries[sorting, after is not None]
+    # Fetch one extra row to know whether another page exists.
+    values = {"limit": limit + 1}
+    if after:
+        values["after_id"] = after["id"]
+        if sorting == PostSorting.most_likes:
+            values["after_likes"] = after["likes"]
+    logger.debug("Executing query: %s", query)
+    posts = await database.fetch_all(query, values)
+
+    headers = {}
+    if len(posts) > limit:
+        posts = posts[:limit]
+        last = posts[-1]
+        headers["X-Next-Cursor"] = encode_cursor(
+            sorting=sorting.value, id=last["id"], likes=last["likes"]
+        )
+
+    posts = post_list_adapter.validate_python(posts, from_attributes=True)
+    return post_list_adapter.dump_json(posts), headers
 
 
 @router.post("/comment", response_model=CommentsOut, status_code=status.HTTP_200_OK)
@@ -98,8 +228,15 @@ async def create_comment(
 
     data = {**comment.model_dump(), "user_id": current_user.id}
     query = comments_table.insert().values(data)
-    logger.debug(f"Executing query: {query}")
-    last_record_id = await database.execute(query)
+    logger.debug("Executing query: %s", query)
+    async with database.transaction():
+        last_record_id = await database.execute(query)
+        await database.execute(
+            post_table.update()
+            .where(post_table.c.id == comment.post_id)
+            .values(comment_count=post_table.c.comment_count + 1)
+        )
+    await response_cache.invalidate(post_detail_key(comment.post_id))
     return {**data, "id": last_record_id}
 
 
@@ -107,25 +244,90 @@ async def create_comment(
 async def get_post_comments(post_id: int):
     logger.info(f"Fetching comments for post id: {post_id}")
     query = comments_table.select().where(comments_table.c.post_id == post_id)
-    logger.debug(f"Executing query: {query}")
+    logger.debug("Executing query: %s", query)
     return await database.fetch_all(query)
 
 
 @router.get("/{post_id}", response_model=UserPostsWithCommentsResponse)
-async def get_post_with_comments(post_id: int):
+async def get_post_with_comments(
+    post_id: int,
+    comments_limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    comments_cursor: Optional[str] = None,
+):
     logger.info(f"Fetching post with id: {post_id} and its comments")
 
-    query = select_post_and_likes.where(post_table.c.id == post_id)
-    logger.debug(f"Executing query: {query}")
+    return await response_cache.respond(
+        post_detail_key(post_id),
+        f"{comments_limit}:{comments_cursor}",
+        lambda: read_post_with_comments(post_id, comments_limit, comments_cursor),
+    )
+
+
+def build_post_detail_query(paged: bool) -> sqlalchemy.Select:
+    comments_page = comments_table.select().where(
+        comments_table.c.post_id == sqlalchemy.bindparam("post_id")
+    )
+    if paged:
+        comments_page = comments_page.where(
+            comments_table.c.id
+            > sqlalchemy.bindparam("comments_after_id", type_=sqlalchemy.Integer)
+        )
+    comments_page = (
+        comments_page.order_by(comments_table.c.id)
+        .limit(sqlalchemy.bindparam("comments_limit", type_=sqlalchemy.Integer))
+        .subquery()
+    )
+
+    # Post, like count and a page of comments in one statement, so a detail
+    # view costs a single round trip.
+    return select_post_and_likes.add_columns(
+        sqlalchemy.select(json_array_agg(*comments_page.c))
+        .scalar_subquery()
+        .label("comments")
+    ).where(post_table.c.id == sqlalchemy.bindparam("post_id"))
 
-    post = await database.fetch_one(query)
+
+post_detail_queries = {
+    paged: CachedStatement(
+        build_post_detail_query(paged),
+        name=f"post_detail{'_paged' if paged else ''}",
+    )
+    for paged in (False, True)
+}
+
+
+async def read_post_with_comments(
+    post_id: int, comments_limit: int, comments_cursor: Optional[str]
+) -> tuple[bytes, dict]:
+    query = post_detail_queries[bool(comments_cursor)]
+    values = {"post_id": post_id, "comments_limit": comments_limit + 1}
+    if comments_cursor:
+        values["comments_after_id"] = decode_cursor(comments_cursor, id=int)["id"]
+    logger.debug("Executing query: %s", query)
+    post = await database.fetch_one(query, values)
 
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
-    return {
-        "post": post,
-        "comments": await get_post_comments(post_id),
-    }
+
+    comments = post["comments"]
+    if isinstance(comments, str):
+        comments = json.loads(comments)
+    comments.sort(key=lambda comment: comment["id"])
+
+    next_comments_cursor = None
+    if len(comments) > comments_limit:
+        comments = comments[:comments_limit]
+        next_comments_cursor = encode_cursor(id=comments[-1]["id"])
+
+    detail = post_detail_adapter.validate_python(
+        {
+            "post": post,
+            "comments": comments,
+            "next_comments_cursor": next_comments_cursor,
+        },
+        from_attributes=True,
+    )
+    return post_detail_adapter.dump_json(detail), {}
 
 
 @router.post("/like", response_model=PostLikeOut, status_code=status.HTTP_201_CREATED)
@@ -143,8 +345,31 @@ async def like_post(
         )
 
     data = {**like.model_dump(), "user_id": current_user.id}
-    query = likes_table.insert().values(data)
-    logger.debug(f"Executing query: {query}")
-    last_recorded_id = await database.execute(query)
+    query = (
+        dialect_insert(likes_table)
+        .values(data)
+        .on_conflict_do_nothing(index_elements=["post_id", "user_id"])
+        .returning(likes_table.c.id)
+    )
+    logger.debug("Executing query: %s", query)
+    async with database.transaction():
+        inserted = await database.fetch_one(query)
+
+        if inserted is None:
+            logger.debug("Post already liked by this user")
+            existing = await database.fetch_one(
+                likes_table.select().where(
+                    likes_table.c.post_id == like.post_id,
+                    likes_table.c.user_id == current_user.id,
+                )
+            )
+            return {**data, "id": existing.id}
+
+        await database.execute(
+            post_table.update()
+            .where(post_table.c.id == like.post_id)
+            .values(like_count=post_table.c.like_count + 1)
+        )
+    await response_cache.invalidate(POST_LIST_KEY, post_detail_key(like.post_id))
 
-    return {**data, "id": last_recorded_id}
+    return {**data, "id": inserted.id}
@@ -0,0 +1,64 @@
+import logging
+
+from fastapi import APIRouter, Depends
+
+from app.cache import response_cache
+from app.database import database
+from app.images import image_executor
+from app.jobs import queue_stats
+from app.libs.storage import upload_stats
+from app.logging_conf import log_queue_stats, log_rate_limit_stats
+from app.security import (
+    password_hash_executor,
+    require_ops_token,
+    token_cache,
+    user_cache,
+)
+from app.uploads import dedup_stats
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/stats",
+    tags=["stats"],
+    dependencies=[Depends(require_ops_token)],
+)
+
+
+@router.get("/cache")
+async def cache_stats():
+    return response_cache.stats()
+
+
+@router.get("/auth")
+async def auth_stats():
+    return {
+        "users": user_cache.stats(),
+        "tokens": token_cache.stats(),
+        "password_hashing": password_hash_executor.stats(),
+    }
+
+
+@router.get("/database")
+async def database_stats():
+    return database.pool_stats()
+
+
+@router.get("/jobs")
+async def job_stats():
+    return await queue_stats()
+
+
+@router.get("/uploads")
+async def upload_transfer_stats():
+    return {**upload_stats(), "dedup": dedup_stats}
+
+
+@router.get("/images")
+async def image_stats():
+    return image_executor.stats()
+
+
+@router.get("/logging")
+async def logging_stats():
+    return {"queue": log_queue_stats(), "rate_limit": log_rate_limit_stats()}
@@ -1,10 +1,21 @@
+import asyncio
+import contextlib
+import hashlib
 import logging
+import os
 import tempfile
+from typing import Optional
 
 import aiofiles
 
 from fastapi import APIRouter, HTTPException, UploadFile, status
-from app.libs.b2 import b2_upload_file
+from app import upload_sessions
+from app.config import config
+from app.db_pool import PoolTimeoutError
+from app.executors import ExecutorBusyError
+from app.libs.storage import get_storage, run_transfer
+from app.models.uploads import UploadSessionIn, UploadSessionOut
+from app.uploads import store_once
 
 logger = logging.getLogger(__name__)
 
@@ -16,22 +27,210 @@ router = APIRouter(
 CHUNK_SIZE = 1024 * 1024
 
 
-@router.post("/", status_code=status.HTTP_201_CREATED)
-async def upload_file(file: UploadFile):
-    try:
-        with tempfile.NamedTemporaryFile() as temp_file:
-            file_name = temp_file.name
-            logger.debug(f"Saving files temporarily to {file_name}")
-            async with aiofiles.open(file_name, "wb") as f:
-                while chunk := await file.read(CHUNK_SIZE):
-                    await f.write(chunk)
+async def upload_via_temp_file(file: UploadFile) -> str:
+    with tempfile.NamedTemporaryFile() as temp_file:
+        file_name = temp_file.name
+        logger.debug(f"Saving files temporarily to {file_name}")
+        digest = hashlib.sha256()
+        size = 0
+        async with aiofiles.open(file_name, "wb") as f:
+            while chunk := await file.read(CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+                await f.write(chunk)
+
+        return await store_once(
+            digest.hexdigest(),
+            size,
+            lambda: run_transfer(
+                get_storage().upload_file, file_name, file.filename, size
+            ),
+        )
+
 
-            file_url = b2_upload_file(local_file=file_name, file_name=file.filename)
+async def upload_via_stream(file: UploadFile) -> str:
+    # The transfer thread reads the request's spooled body directly, so the
+    # bytes are not copied to another file and read back before uploading.
+    # Hashing needs one pass over the spool first so duplicates, large ones
+    # above all, skip the transfer altogether.
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := await file.read(CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    logger.debug(f"Streaming {file.filename} ({size} bytes) to storage")
 
+    async def transfer() -> str:
+        await file.seek(0)
+        return await run_transfer(
+            get_storage().upload_stream, file.file, file.filename, size
+        )
+
+    return await store_once(digest.hexdigest(), size, transfer)
+
+
+@contextlib.contextmanager
+def transfer_errors():
+    try:
+        yield
+    except (ExecutorBusyError, PoolTimeoutError):
+        raise
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Uploading the file timed out",
+        )
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="There was an error uploading the file",
         )
 
+
+@router.post("/", status_code=status.HTTP_201_CREATED)
+async def upload_file(file: UploadFile):
+    with transfer_errors():
+        if file.size is not None and file.size < config.UPLOAD_STREAM_THRESHOLD:
+            file_url = await upload_via_temp_file(file)
+        else:
+            file_url = await upload_via_stream(file)
+
     return {"detail": f"Successfully uploaded{file.filename}", "file_url": file_url}
+
+
+def session_expired() -> HTTPException:
+    # The staged bytes are gone, removed by collect_garbage after the TTL.
+    return HTTPException(
+        status_code=status.HTTP_410_GONE, detail="Upload session has expired"
+    )
+
+
+async def session_conflict(session_id: str, offset: Optional[int] = None):
+    # Work out why a session could not be leased, for the error response.
+    session = await upload_sessions.get_session(session_id)
+    if session is None:
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found"
+        )
+
+    headers = {"Upload-Offset": str(session.received)}
+    if session.status == upload_sessions.COMPLETE:
+        detail = "Upload session is already complete"
+    elif offset is not None and session.received != offset:
+        detail = f"Upload session expects offset {session.received}"
+    else:
+        detail = "Upload session is busy with another request"
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT, detail=detail, headers=headers
+    )
+
+
+@router.post(
+    "/sessions",
+    response_model=UploadSessionOut,
+    status_code=status.HTTP_201_CREATED,
+)
+async def create_upload_session(session: UploadSessionIn):
+    logger.info(f"Starting resumable upload of {session.file_name}")
+    return await upload_sessions.create_session(session.file_name, session.size)
+
+
+@router.get("/sessions/{session_id}", response_model=UploadSessionOut)
+async def get_upload_session(session_id: str):
+    session = await upload_sessions.get_session(session_id)
+    if session is None:
+        raise await session_conflict(session_id)
+    return session
+
+
+@router.patch("/sessions/{session_id}", response_model=UploadSessionOut)
+async def append_upload_chunk(session_id: str, offset: int, chunk: UploadFile):
+    session = await upload_sessions.lock_session(session_id, received=offset)
+    if session is None:
+        raise await session_conflict(session_id, offset)
+
+    received = offset
+    try:
+        async with aiofiles.open(upload_sessions.part_path(session_id), "r+b") as f:
+            # Bytes past the recorded offset are left over from an append
+            # that died half way; overwrite them.
+            await f.seek(offset)
+            while data := await chunk.read(CHUNK_SIZE):
+                if session.size is not None and received + len(data) > session.size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                        detail="Chunk goes past the declared file size",
+                    )
+                await f.write(data)
+                received += len(data)
+            await f.truncate()
+    except FileNotFoundError:
+        raise session_expired()
+    finally:
+        # Starlette has buffered the whole chunk before this handler runs, so
+        # a dropped connection never gets here; this records what was written
+        # when writing it failed part way.
+        holds_lease = await upload_sessions.unlock_session(
+            session_id, session.locked_until, received=received
+        )
+
+    if not holds_lease:
+        # The lease ran out mid-append and another request took over; what
+        # this one wrote is not counted.
+        raise await session_conflict(session_id, offset)
+    return await upload_sessions.get_session(session_id)
+
+
+@router.post("/sessions/{session_id}/complete", status_code=status.HTTP_201_CREATED)
+async def complete_upload_session(session_id: str):
+    session = await upload_sessions.get_session(session_id)
+    if session is not None and session.status == upload_sessions.COMPLETE:
+        return {
+            "detail": f"Successfully uploaded{session.file_name}",
+            "file_url": session.file_url,
+        }
+    if session is not None and session.size not in (None, session.received):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload session has {session.received} of {session.size} bytes",
+            headers={"Upload-Offset": str(session.received)},
+        )
+
+    session = await upload_sessions.lock_session(session_id)
+    if session is None:
+        raise await session_conflict(session_id)
+
+    path = upload_sessions.part_path(session_id)
+    try:
+        try:
+            os.truncate(path, session.received)
+        except FileNotFoundError:
+            raise session_expired()
+        with transfer_errors():
+            digest = hashlib.sha256()
+            async with aiofiles.open(path, "rb") as f:
+                while data := await f.read(CHUNK_SIZE):
+                    digest.update(data)
+
+            file_url = await store_once(
+                digest.hexdigest(),
+                session.received,
+                lambda: run_transfer(
+                    get_storage().upload_file, path, session.file_name, session.received
+                ),
+            )
+    except BaseException:
+        await upload_sessions.unlock_session(session_id, session.locked_until)
+        raise
+
+    await upload_sessions.unlock_session(
+        session_id,
+        session.locked_until,
+        status=upload_sessions.COMPLETE,
+        file_url=file_url,
+    )
+    os.remove(path)
+    return {
+        "detail": f"Successfully uploaded{session.file_name}",
+        "file_url": file_url,
+    }
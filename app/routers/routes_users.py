@@ -1,15 +1,16 @@
 import logging
 
-from app import tasks
-from fastapi import APIRouter, BackgroundTasks, HTTPException, status, Request
+from fastapi import APIRouter, HTTPException, status, Request
+from app.jobs import enqueue
 from app.models.users import UserIn, UserLogin
 from app.security import (
     get_user,
-    get_password_hashed,
+    hash_password,
     authenticate_user,
     create_access_token,
     get_subject_for_token_type,
     create_confirmation_token,
+    invalidate_cached_user,
 )
 from app.database import database, user_table
 
@@ -22,7 +23,7 @@ router = APIRouter(
 
 
 @router.post("/", status_code=201)
-async def create_user(user: UserIn, background_task: BackgroundTasks, request: Request):
+async def create_user(user: UserIn, request: Request):
     if await get_user(user.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -30,20 +31,27 @@ async def create_user(user: UserIn, background_task: BackgroundTasks, request: R
         )
     logger.info("Data recieved")
     data = user.model_dump()
-    data["password"] = get_password_hashed(data["password"])
+    data["password"] = await hash_password(data["password"])
 
     query = user_table.insert().values(data)
     # compiled = query.compile(compile_kwargs={"literal_binds": True})
-    logger.debug(f"Executing query: {query}")
-    await database.execute(query)
-
-    background_task.add_task(
-        tasks.send_user_registration_email,
-        email=user.email,
-        confirmation_url=request.url_for(
-            "confirm_user", token=create_confirmation_token(user.email)
-        ),
-    )
+    logger.debug("Executing query: %s", query)
+    # One transaction, so a crash cannot leave a user without their email job.
+    async with database.transaction():
+        await database.execute(query)
+        await enqueue(
+            "send_user_registration_email",
+            {
+                "email": user.email,
+                "confirmation_url": str(
+                    request.url_for(
+                        "confirm_user", token=create_confirmation_token(user.email)
+                    )
+                ),
+            },
+            idempotency_key=f"registration:{user.email}",
+        )
+    invalidate_cached_user(user.email)
 
     return {"detail": "User Created succesfully!, Please confirm your email"}
 
@@ -62,7 +70,8 @@ async def confirm_user(token: str):
         user_table.update().where(user_table.c.email == email).values(confirmed=True)
     )
 
-    logger.debug(f"Executing query: {query}")
+    logger.debug("Executing query: %s", query)
     await database.execute(query)
+    invalidate_cached_user(email)
 
     return {"detail": "User confirmed"}
@@ -1,20 +1,47 @@
 import datetime
+import hashlib
+import hmac
 import logging
+import time
 
-from typing import Annotated, Literal
+from typing import Annotated, Literal, Optional
 from fastapi import HTTPException, status, Depends
-from fastapi.security import OAuth2PasswordBearer
+from fastapi.security import (
+    HTTPAuthorizationCredentials,
+    HTTPBearer,
+    OAuth2PasswordBearer,
+)
 from jose import ExpiredSignatureError, JWTError, jwt
 from passlib.context import CryptContext
+import sqlalchemy
 
+from app.cache import TTLCache
 from app.config import config
 from app.database import database, user_table
+from app.db_routing import primary_reads
+from app.db_statements import CachedStatement
+from app.executors import BoundedExecutor
 
 logger = logging.getLogger(__name__)
 
 ALGORITHM = "HS256"
-pwd_contex = CryptContext(schemes=["bcrypt"])
+pwd_contex = CryptContext(schemes=["bcrypt"], bcrypt__rounds=config.BCRYPT_ROUNDS)
+password_hash_executor = BoundedExecutor(
+    "password-hash",
+    max_workers=config.PASSWORD_HASH_MAX_WORKERS,
+    max_pending=config.PASSWORD_HASH_MAX_PENDING,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+ops_scheme = HTTPBearer(auto_error=False)
+
+user_cache = TTLCache(config.USER_CACHE_MAX_ENTRIES, config.USER_CACHE_TTL_SECONDS)
+token_cache = TTLCache(config.TOKEN_CACHE_MAX_ENTRIES, ttl=0)
+_NOT_CACHED = object()
+
+user_by_email_query = CachedStatement(
+    user_table.select().where(user_table.c.email == sqlalchemy.bindparam("email")),
+    name="user_by_email",
+)
 
 
 def create_credentials_exception(detail: str) -> HTTPException:
@@ -33,6 +60,16 @@ def verify_password(palin_password: str, hashed_password: str) -> bool:
     return pwd_contex.verify(palin_password, hashed_password)
 
 
+async def hash_password(password: str) -> str:
+    return await password_hash_executor.run(get_password_hashed, password)
+
+
+async def check_password(palin_password: str, hashed_password: str) -> bool:
+    return await password_hash_executor.run(
+        verify_password, palin_password, hashed_password
+    )
+
+
 def access_token_expire_minutes() -> int:
     return 60
 
@@ -61,23 +98,38 @@ def create_confirmation_token(email: str):
     return encoded_jwt
 
 
+def decode_token(token: str) -> tuple:
+    # Signature verification is skipped for tokens already verified; the cache
+    # key is the token's SHA-256 digest so raw tokens are never kept around.
+    digest = hashlib.sha256(token.encode()).digest()
+    claims = token_cache.get(digest)
+
+    if claims is None:
+        try:
+            payload = jwt.decode(token, key=config.SECRET_KEY, algorithms=ALGORITHM)
+        except ExpiredSignatureError as e:
+            raise create_credentials_exception("Token has expired") from e
+        except JWTError as e:
+            raise create_credentials_exception("Invalid token") from e
+
+        claims = (payload.get("sub"), payload.get("type"), payload.get("exp"))
+        if isinstance(claims[2], (int, float)):
+            token_cache.set(digest, claims, ttl=claims[2] - time.time())
+    elif time.time() > claims[2]:
+        token_cache.delete(digest)
+        raise create_credentials_exception("Token has expired")
+
+    return claims
+
+
 def get_subject_for_token_type(
     token: str, expected_type: Literal["access", "confirmation"]
 ) -> str:
-    try:
-        payload = jwt.decode(token, key=config.SECRET_KEY, algorithms=ALGORITHM)
-    except ExpiredSignatureError as e:
-        raise create_credentials_exception("Token has expired") from e
-    except JWTError as e:
-        raise create_credentials_exception("Invalid token") from e
-
-    email = payload.get("sub")
+    email, type, _ = decode_token(token)
 
     if email is None:
         raise create_credentials_exception("Token is missing 'sub field")
 
-    type = payload.get("type")
-
     if type is None or type != expected_type:
         raise create_credentials_exception(
             f"Token has incorrect type, expected '{expected_type}'"
@@ -87,13 +139,33 @@ def get_subject_for_token_type(
 
 async def get_user(email: str):
     logger.debug("Fetching user from database", extra={"email": email})
-    query = user_table.select().where(user_table.c.email == email)
-    logger.info(query)
-    result = await database.fetch_one(query)
+    logger.debug("Executing query: %s", user_by_email_query)
+    # Login and confirmation links read a user just written, often from a
+    # client that never made the write; the result is cached anyway.
+    with primary_reads():
+        result = await database.fetch_one(user_by_email_query, {"email": email})
     if result:
         return result
 
 
+async def get_cached_user(email: str):
+    user = user_cache.get(email, _NOT_CACHED)
+    if user is not _NOT_CACHED:
+        return user
+
+    user = await get_user(email)
+    if user is None:
+        user_cache.set(email, None, ttl=config.USER_CACHE_NEGATIVE_TTL_SECONDS)
+    else:
+        user_cache.set(email, user)
+    return user
+
+
+def invalidate_cached_user(email: str) -> None:
+    logger.debug("Invalidating cached user", extra={"email": email})
+    user_cache.delete(email)
+
+
 async def authenticate_user(email: str, password: str):
     logger.debug("Authenticating user", extra={"email": email})
     user = await get_user(email)
@@ -101,7 +173,7 @@ async def authenticate_user(email: str, password: str):
     if not user:
         raise create_credentials_exception("Inavlid email or password")
 
-    if not verify_password(password, user["password"]):
+    if not await check_password(password, user["password"]):
         raise create_credentials_exception("Inavlid email or password")
     if not user.confirmed:
         raise create_credentials_exception("User has not confirmed email")
@@ -110,8 +182,24 @@ async def authenticate_user(email: str, password: str):
 
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
     email = get_subject_for_token_type(token, "access")
-    user = await get_user(email)
+    user = await get_cached_user(email)
 
     if user is None:
         raise create_credentials_exception("Could not find user for this token")
     return user
+
+
+async def require_ops_token(
+    credentials: Annotated[Optional[HTTPAuthorizationCredentials], Depends(ops_scheme)],
+) -> None:
+    # Metrics and stats expose internals, so without a token they do not exist.
+    if not config.OPS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if credentials is None or not hmac.compare_digest(
+        credentials.credentials.encode(), config.OPS_TOKEN.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid operations token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
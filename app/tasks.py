@@ -2,7 +2,9 @@ import logging
 
 import httpx
 from databases import Database
+from app.cache import POST_LIST_KEY, post_detail_key, response_cache
 from app.database import post_table
+from app.http_clients import DEEPAI, MAILGUN, get_http_client
 
 from json import JSONDecodeError
 from app.config import config
@@ -16,28 +18,28 @@ class APIResponseError(Exception):
 
 async def send_simple_email(to: str, subject: str, body: str):
     logger.debug(f"Sending email to '{to [:3]}' with subject '{subject[:20]}'")
-    async with httpx.AsyncClient() as client:
-        try:
-            logger.debug("Start sending email")
-            response = await client.post(
-                f"https://api.mailgun.net/v3/{config.MAILGUN_DOMAIN}/messages",
-                auth=("api", config.MAILGUN_API_KEY),
-                data={
-                    "from": f"Sachin Perera <mailgun@{config.MAILGUN_DOMAIN}>",
-                    "to": [to],
-                    "subject": subject,
-                    "text": body,
-                },
-            )
-            response.raise_for_status()
+    client = get_http_client(MAILGUN)
+    try:
+        logger.debug("Start sending email")
+        response = await client.post(
+            f"/v3/{config.MAILGUN_DOMAIN}/messages",
+            auth=("api", config.MAILGUN_API_KEY),
+            data={
+                "from": f"Sachin Perera <mailgun@{config.MAILGUN_DOMAIN}>",
+                "to": [to],
+                "subject": subject,
+                "text": body,
+            },
+        )
+        response.raise_for_status()
 
-            logger.debug(response.content)
+        logger.debug(response.content)
 
-            return response
-        except httpx.HTTPStatusError as err:
-            raise APIResponseError(
-                f"API  request failed with status code {err.response.status_code}"
-            ) from err
+        return response
+    except httpx.HTTPStatusError as err:
+        raise APIResponseError(
+            f"API  request failed with status code {err.response.status_code}"
+        ) from err
 
 
 async def send_user_registration_email(email: str, confirmation_url: str):
@@ -54,26 +56,26 @@ async def send_user_registration_email(email: str, confirmation_url: str):
 
 async def _generate_cute_creature_api(prompt: str):
     logger.debug("Generating cute creature")
-    async with httpx.AsyncClient() as client:
-        try :
-            response = await client.post(
-                "https://api.deepai.org/api/cute-creature-generator",
-                data={"text": prompt},
-                headers={"api-key": config.DEEPAI_API_KEY},
-                timeout=60,
-            )
-            logger.debug(response)
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as err:
-            raise APIResponseError(
-                f"API request failed with status code {err.response.status_code}"
-            ) from err
-        except (JSONDecodeError, TypeError) as err:
-            raise APIResponseError(
-                "API response passing failed"
-            ) from err
-        
+    client = get_http_client(DEEPAI)
+    try:
+        response = await client.post(
+            "/api/cute-creature-generator",
+            data={"text": prompt},
+            headers={"api-key": config.DEEPAI_API_KEY},
+        )
+        logger.debug(response)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as err:
+        raise APIResponseError(
+            f"API request failed with status code {err.response.status_code}"
+        ) from err
+    except (JSONDecodeError, TypeError) as err:
+        raise APIResponseError(
+            "API response passing failed"
+        ) from err
+
+
 async def generate_and_add_to_post(
         email: str,
         post_id: int,
@@ -103,9 +105,12 @@ async def generate_and_add_to_post(
         .values(image_url = response["output_url"])
     )
 
-    logger.debug(query)
+    logger.debug("Executing query: %s", query)
 
     await database.execute(query)
+    # Runs in the job worker: this reaches the API processes only through a
+    # shared cache backend, see config.CACHE_BACKEND.
+    await response_cache.invalidate(POST_LIST_KEY, post_detail_key(post_id))
 
     logger.debug("Database connection in background task closed")
 
@@ -1,10 +1,15 @@
+import asyncio
 import os
 from typing import AsyncGenerator, Generator
 from unittest.mock import AsyncMock, Mock
 import pytest
 from fastapi.testclient import TestClient
 from httpx import ASGITransport, AsyncClient, Request, Response
+from app.cache import response_cache
+from app.config import config
 from app.database import database, user_table
+from app.migrations import upgrade
+from app.security import token_cache, user_cache
 from app.test.helpers import create_post
 
 os.environ["ENV_STATE"] = "test"
@@ -17,6 +22,20 @@ def anyio_backend() -> str:
     return "asyncio"
 
 
+async def migrate() -> None:
+    await database.connect()
+    try:
+        await upgrade(database)
+    finally:
+        await database.disconnect()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema() -> None:
+    # On its own event loop, so the tests keep getting a fresh context each.
+    asyncio.run(migrate())
+
+
 @pytest.fixture
 def client() -> Generator:
     yield TestClient(app)
@@ -30,6 +49,14 @@ async def db() -> AsyncGenerator:
     await database.disconnect()
 
 
+@pytest.fixture(autouse=True)
+async def clear_caches() -> AsyncGenerator:
+    yield
+    await response_cache.clear()
+    user_cache.clear()
+    token_cache.clear()
+
+
 @pytest.fixture()
 async def async_client():
     transport = ASGITransport(app=app)
@@ -37,6 +64,11 @@ async def async_client():
         yield ac
 
 
+@pytest.fixture()
+def ops_headers() -> dict:
+    return {"Authorization": f"Bearer {config.OPS_TOKEN}"}
+
+
 @pytest.fixture()
 async def created_user(async_client: AsyncClient) -> dict:
     user_details = {"name": "test", "email": "test@example.netfake", "password": "1234"}
@@ -67,14 +99,12 @@ async def logged_in_token(async_client: AsyncClient, confirm_user: dict) -> str:
 
 @pytest.fixture(autouse=True)
 def mock_httpx_client(mocker):
-    mocked_client = mocker.patch("app.tasks.httpx.AsyncClient")
-
     mocked_async_client = Mock()
 
     response = Response(status_code=200, content="", request=Request("POST", "//"))
 
     mocked_async_client.post = AsyncMock(return_value=response)
-    mocked_client.return_value.__aenter__.return_value = mocked_async_client
+    mocker.patch("app.tasks.get_http_client", return_value=mocked_async_client)
 
     return mocked_async_client
 
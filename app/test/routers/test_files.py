@@ -0,0 +1,90 @@
+import io
+import pathlib
+
+import pytest
+from httpx import AsyncClient
+
+from app.libs import storage
+
+
+@pytest.fixture()
+def local_storage(tmp_path: pathlib.Path, mocker) -> storage.LocalStorage:
+    backend = storage.LocalStorage(tmp_path, "/files")
+    mocker.patch("app.routers.routes_files.get_storage", return_value=backend)
+    return backend
+
+
+def test_local_storage_upload_file(
+    local_storage: storage.LocalStorage, tmp_path: pathlib.Path
+):
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"0123456789")
+
+    url = local_storage.upload_file(str(source), "image.png")
+
+    assert url.startswith("/files/") and url.endswith("/image.png")
+    key = url.removeprefix("/files/")
+    assert local_storage.path_for(key).read_bytes() == b"0123456789"
+
+
+def test_local_storage_rejects_keys_outside_root(local_storage: storage.LocalStorage):
+    assert local_storage.path_for("../../etc/passwd") is None
+
+
+@pytest.mark.anyio
+async def test_download_file(
+    async_client: AsyncClient, local_storage: storage.LocalStorage
+):
+    url = local_storage.upload_stream(io.BytesIO(b"0123456789"), "data.bin")
+
+    response = await async_client.get(url)
+
+    assert response.status_code == 200
+    assert response.content == b"0123456789"
+
+
+@pytest.mark.anyio
+async def test_download_file_range(
+    async_client: AsyncClient, local_storage: storage.LocalStorage
+):
+    url = local_storage.upload_stream(io.BytesIO(b"0123456789"), "data.bin")
+
+    response = await async_client.get(url, headers={"Range": "bytes=2-5"})
+
+    assert response.status_code == 206
+    assert response.content == b"2345"
+    assert response.headers["content-range"] == "bytes 2-5/10"
+
+
+@pytest.mark.anyio
+async def test_download_file_accel_redirect(
+    async_client: AsyncClient, local_storage: storage.LocalStorage, mocker
+):
+    mocker.patch.object(storage.config, "LOCAL_STORAGE_ACCEL_REDIRECT", "/internal/")
+    url = local_storage.upload_stream(io.BytesIO(b"0123456789"), "data.bin")
+
+    response = await async_client.get(url)
+
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["x-accel-redirect"] == url.replace("/files", "/internal")
+
+
+@pytest.mark.anyio
+async def test_download_missing_file(
+    async_client: AsyncClient, local_storage: storage.LocalStorage
+):
+    response = await async_client.get("/files/nope/missing.bin")
+
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_download_without_local_storage(async_client: AsyncClient, mocker):
+    mocker.patch(
+        "app.routers.routes_files.get_storage", return_value=storage.B2Storage()
+    )
+
+    response = await async_client.get("/files/any/file.bin")
+
+    assert response.status_code == 404
@@ -0,0 +1,70 @@
+import pytest
+from httpx import AsyncClient
+from prometheus_client.parser import text_string_to_metric_families
+
+
+def samples(text: str) -> dict:
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for family in text_string_to_metric_families(text)
+        for sample in family.samples
+    }
+
+
+@pytest.mark.anyio
+async def test_metrics_label_requests_by_route_template(
+    async_client: AsyncClient, created_post: dict, ops_headers: dict
+):
+    await async_client.get(f"/post/{created_post['id']}")
+    await async_client.get("/no-such-page")
+
+    response = await async_client.get("/metrics", headers=ops_headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    values = samples(response.text)
+    labels = (("method", "GET"), ("route", "/post/{post_id}"), ("status", "200"))
+    assert values[("http_request_duration_seconds_count", labels)] >= 1
+    unmatched = (("method", "GET"), ("route", "unmatched"), ("status", "404"))
+    assert values[("http_request_duration_seconds_count", unmatched)] >= 1
+    assert not any(
+        dict(labels).get("route", "").startswith("/post/1") for _, labels in values
+    )
+    # The scrape itself is still being handled.
+    in_flight = (("method", "GET"), ("route", "/metrics"))
+    assert values[("http_requests_in_flight", in_flight)] == 1
+    assert ("jobs", (("status", "queued"),)) in values
+
+
+@pytest.mark.anyio
+async def test_metrics_record_statement_latency(
+    async_client: AsyncClient, created_post: dict, ops_headers: dict
+):
+    await async_client.get(f"/post/{created_post['id']}")
+
+    values = samples((await async_client.get("/metrics", headers=ops_headers)).text)
+
+    statement = (("statement", "post_detail"),)
+    assert values[("db_query_duration_seconds_count", statement)] >= 1
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("path", ["/metrics", "/stats/database"])
+async def test_ops_endpoints_need_the_token(async_client: AsyncClient, path: str):
+    missing = await async_client.get(path)
+    wrong = await async_client.get(path, headers={"Authorization": "Bearer nope"})
+
+    assert missing.status_code == wrong.status_code == 401
+    assert missing.headers["www-authenticate"] == "Bearer"
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("path", ["/metrics", "/stats/database"])
+async def test_ops_endpoints_are_off_without_a_token(
+    async_client: AsyncClient, ops_headers: dict, path: str, mocker
+):
+    mocker.patch("app.security.config.OPS_TOKEN", None)
+
+    response = await async_client.get(path, headers=ops_headers)
+
+    assert response.status_code == 404
@@ -2,6 +2,8 @@ from pydantic import BaseModel
 import pytest
 from httpx import AsyncClient
 from app import security
+from app.jobs import run_pending_jobs
+from app.pagination import encode_cursor
 
 from app.test.helpers import create_post, create_comment, create_like
 
@@ -70,6 +72,9 @@ async def test_create_post_with_prompt(
         "body": body,
         "image_url": None,
     }.items() <= response.json().items()
+    mock_generate_cute_creature_api.assert_not_called()
+
+    await run_pending_jobs()
     mock_generate_cute_creature_api.assert_called()
 
 
@@ -244,3 +249,184 @@ async def test_get_post_with_comments(async_client: AsyncClient, created_comment
     print(response.json())
 
     assert response.status_code == 200
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "sorting, expected_order",
+    [
+        ("new", [3, 2, 1]),
+        ("old", [1, 2, 3]),
+        ("most_likes", [2, 3, 1]),
+    ],
+)
+async def test_get_all_posts_paginated(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    sorting: str,
+    expected_order: list[int],
+):
+    await create_post("Test post_1", async_client, logged_in_token)
+    await create_post("Test post_2", async_client, logged_in_token)
+    await create_post("Test post_3", async_client, logged_in_token)
+    await create_like(2, async_client, logged_in_token)
+
+    post_ids = []
+    params = {"sorting": sorting, "limit": 2}
+    while True:
+        response = await async_client.get("/post/", params=params)
+        assert response.status_code == 200
+        post_ids += [post["id"] for post in response.json()]
+
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        params["cursor"] = cursor
+
+    assert post_ids == expected_order
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_invalid_cursor(async_client: AsyncClient):
+    response = await async_client.get("/post/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_cursor_with_wrong_types(async_client: AsyncClient):
+    cursor = encode_cursor(sorting="new", id="1 OR 1=1", likes=0)
+    response = await async_client.get("/post/", params={"cursor": cursor})
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_cursor_sorting_mismatch(
+    async_client: AsyncClient, logged_in_token: str
+):
+    await create_post("Test post_1", async_client, logged_in_token)
+    await create_post("Test post_2", async_client, logged_in_token)
+
+    response = await async_client.get("/post/", params={"limit": 1})
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = await async_client.get(
+        "/post/", params={"sorting": "old", "cursor": cursor}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_like_and_comment_update_post_counters(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    await create_like(created_post["id"], async_client, logged_in_token)
+    await create_comment(
+        "Test comment", created_post["id"], async_client, logged_in_token
+    )
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+
+    assert response.json()["post"]["likes"] == 1
+    assert len(response.json()["comments"]) == 1
+
+
+@pytest.mark.anyio
+async def test_like_post_twice_is_idempotent(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    first = await create_like(created_post["id"], async_client, logged_in_token)
+    second = await create_like(created_post["id"], async_client, logged_in_token)
+
+    assert first["id"] == second["id"]
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["post"]["likes"] == 1
+
+
+@pytest.mark.anyio
+async def test_like_post_not_found(async_client: AsyncClient, logged_in_token: str):
+    response = await async_client.post(
+        "/post/like",
+        json={"post_id": 99},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_get_post_with_comments_paginated(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    for i in range(3):
+        await create_comment(
+            f"Test comment {i}", created_post["id"], async_client, logged_in_token
+        )
+
+    response = await async_client.get(
+        f"/post/{created_post['id']}", params={"comments_limit": 2}
+    )
+    data = response.json()
+
+    assert data["post"] == created_post
+    assert [comment["body"] for comment in data["comments"]] == [
+        "Test comment 0",
+        "Test comment 1",
+    ]
+
+    response = await async_client.get(
+        f"/post/{created_post['id']}",
+        params={"comments_limit": 2, "comments_cursor": data["next_comments_cursor"]},
+    )
+    data = response.json()
+
+    assert [comment["body"] for comment in data["comments"]] == ["Test comment 2"]
+    assert data["next_comments_cursor"] is None
+
+
+@pytest.mark.anyio
+async def test_get_post_with_comments_not_found(async_client: AsyncClient):
+    response = await async_client.get("/post/99")
+
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_get_all_post_cache_invalidated_by_like(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    response = await async_client.get("/post/")
+    assert response.json()[0]["likes"] == 0
+
+    await create_like(created_post["id"], async_client, logged_in_token)
+
+    response = await async_client.get("/post/")
+    assert response.json()[0]["likes"] == 1
+
+
+@pytest.mark.anyio
+async def test_get_post_with_comments_cache_invalidated_by_comment(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()["comments"] == []
+
+    await create_comment(
+        "Test comment", created_post["id"], async_client, logged_in_token
+    )
+
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert len(response.json()["comments"]) == 1
+
+
+@pytest.mark.anyio
+async def test_cache_stats(
+    async_client: AsyncClient, created_post: dict, ops_headers: dict
+):
+    await async_client.get("/post/")
+    await async_client.get("/post/")
+
+    response = await async_client.get("/stats/cache", headers=ops_headers)
+
+    assert response.status_code == 200
+    assert response.json()["hits"] >= 1
@@ -1,3 +1,5 @@
+import time
+
 import pytest
 from app import security
 from jose import jwt
@@ -150,3 +152,91 @@ async def test_get_current_user_wrong_token_type(created_user: dict):
 
     with pytest.raises(security.HTTPException):
         await security.get_current_user(token)
+
+
+@pytest.mark.anyio
+async def test_get_current_user_is_cached(created_user: dict, mocker):
+    token = security.create_access_token(created_user["email"])
+    await security.get_current_user(token)
+
+    spy = mocker.spy(security, "get_user")
+    user = await security.get_current_user(token)
+
+    assert user["email"] == created_user["email"]
+    spy.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_get_cached_user_negative_caching(mocker):
+    mocker.patch.object(security.config, "USER_CACHE_NEGATIVE_TTL_SECONDS", 60)
+    spy = mocker.spy(security, "get_user")
+
+    assert await security.get_cached_user("test@notfound.com") is None
+    assert await security.get_cached_user("test@notfound.com") is None
+    assert spy.call_count == 1
+
+
+@pytest.mark.anyio
+async def test_get_cached_user_negative_caching_disabled(mocker):
+    spy = mocker.spy(security, "get_user")
+
+    await security.get_cached_user("test@notfound.com")
+    await security.get_cached_user("test@notfound.com")
+
+    assert spy.call_count == 2
+
+
+@pytest.mark.anyio
+async def test_invalidate_cached_user(created_user: dict, mocker):
+    await security.get_cached_user(created_user["email"])
+    security.invalidate_cached_user(created_user["email"])
+
+    spy = mocker.spy(security, "get_user")
+    await security.get_cached_user(created_user["email"])
+
+    spy.assert_called_once()
+
+
+@pytest.mark.anyio
+async def test_hash_password():
+    hashed = await security.hash_password("password")
+
+    assert await security.check_password("password", hashed)
+    assert not await security.check_password("wrong", hashed)
+
+
+def test_get_subject_for_token_type_cached(mocker):
+    token = security.create_access_token("test@example.com")
+    security.get_subject_for_token_type(token, "access")
+
+    spy = mocker.spy(security.jwt, "decode")
+
+    assert "test@example.com" == security.get_subject_for_token_type(token, "access")
+    spy.assert_not_called()
+    assert security.token_cache.stats()["hits"] >= 1
+
+
+def test_get_subject_for_token_type_cached_wrong_type():
+    token = security.create_access_token("test@example.com")
+    security.get_subject_for_token_type(token, "access")
+
+    with pytest.raises(security.HTTPException):
+        security.get_subject_for_token_type(token, "confirmation")
+
+
+def test_get_subject_for_token_type_cached_expired(mocker):
+    token = security.create_access_token("test@example.com")
+    security.get_subject_for_token_type(token, "access")
+
+    mocker.patch("app.security.time.time", return_value=time.time() + 3601)
+
+    with pytest.raises(security.HTTPException) as exe_info:
+        security.get_subject_for_token_type(token, "access")
+    assert "Token has expired" == exe_info.value.detail
+
+
+def test_get_subject_for_token_type_invalid_token_not_cached():
+    with pytest.raises(security.HTTPException):
+        security.get_subject_for_token_type("Invalid token", "access")
+
+    assert len(security.token_cache) == 0
@@ -1,11 +1,18 @@
 import contextlib
+import hashlib
 import os
 import pathlib
 import tempfile
+import threading
+import time
 
 import pytest
+from databases import Database
 from httpx import AsyncClient
 
+from app.database import files_table
+from app.libs import b2, storage
+
 
 @pytest.fixture()
 def sample_image(fs) -> pathlib.Path:
@@ -16,10 +23,16 @@ def sample_image(fs) -> pathlib.Path:
 
 
 @pytest.fixture(autouse=True)
-def mock_b2_upload_file(mocker):
-    return mocker.patch(
-        "app.routers.routes_upload.b2_upload_file", return_value="https://fakeurl.com"
-    )
+def mock_storage(mocker):
+    backend = mocker.Mock(spec=storage.StorageBackend)
+    backend.upload_file.return_value = "https://fakeurl.com"
+    mocker.patch("app.routers.routes_upload.get_storage", return_value=backend)
+    return backend
+
+
+@pytest.fixture()
+def mock_upload_file(mock_storage):
+    return mock_storage.upload_file
 
 
 @pytest.fixture(autouse=True)
@@ -71,3 +84,139 @@ async def test_temp_file_remove_after_upload(
     created_temp_file = named_temp_file_spy.spy_return
 
     assert not os.path.exists(created_temp_file.name)
+
+
+@pytest.mark.anyio
+async def test_upload_runs_on_transfer_executor(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    sample_image: pathlib.Path,
+    mock_upload_file,
+):
+    mock_upload_file.side_effect = lambda *args: threading.current_thread().name
+
+    response = await call_upload_endpoint(async_client, logged_in_token, sample_image)
+
+    assert response.json()["file_url"].startswith("storage-transfer")
+
+
+@pytest.mark.anyio
+async def test_upload_timeout(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    sample_image: pathlib.Path,
+    mock_upload_file,
+    mocker,
+):
+    mocker.patch.object(storage.config, "UPLOAD_TIMEOUT", 0.01)
+    mock_upload_file.side_effect = lambda *args: time.sleep(0.1)
+
+    response = await call_upload_endpoint(async_client, logged_in_token, sample_image)
+
+    assert response.status_code == 504
+
+
+@pytest.mark.anyio
+async def test_upload_transfer_executor_saturated(
+    async_client: AsyncClient, logged_in_token: str, sample_image: pathlib.Path, mocker
+):
+    mocker.patch.object(storage.transfer_executor, "max_pending", 0)
+
+    response = await call_upload_endpoint(async_client, logged_in_token, sample_image)
+
+    assert response.status_code == 503
+
+
+@pytest.mark.anyio
+async def test_large_upload_streams_without_temp_file(
+    async_client: AsyncClient,
+    logged_in_token: str,
+    mock_storage,
+    mock_upload_file,
+    mocker,
+):
+    mocker.patch.object(storage.config, "UPLOAD_STREAM_THRESHOLD", 4)
+    named_temp_file_spy = mocker.spy(tempfile, "NamedTemporaryFile")
+    received = {}
+
+    def fake_upload_stream(stream, file_name):
+        received[file_name] = stream.read()
+        return "https://fakeurl.com/stream"
+
+    mock_storage.upload_stream.side_effect = fake_upload_stream
+
+    response = await async_client.post(
+        "/upload/",
+        files={"file": ("big.bin", b"0123456789")},
+        headers={"Authorization": f"Bearer {logged_in_token}"},
+    )
+
+    assert response.status_code == 201
+    assert response.json()["file_url"] == "https://fakeurl.com/stream"
+    assert received == {"big.bin": b"0123456789"}
+    named_temp_file_spy.assert_not_called()
+    mock_upload_file.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_duplicate_streamed_upload_skips_transfer(
+    async_client: AsyncClient,
+    db: Database,
+    logged_in_token: str,
+    mock_storage,
+    mocker,
+):
+    mocker.patch.object(storage.config, "UPLOAD_STREAM_THRESHOLD", 4)
+    mock_storage.upload_stream.side_effect = lambda stream, name: (
+        stream.read() and "https://fakeurl.com/stream"
+    )
+
+    urls = []
+    for name in ("big.bin", "copy.bin"):
+        response = await async_client.post(
+            "/upload/",
+            files={"file": (name, b"0123456789")},
+            headers={"Authorization": f"Bearer {logged_in_token}"},
+        )
+        urls.append(response.json()["file_url"])
+
+    assert urls == ["https://fakeurl.com/stream"] * 2
+    mock_storage.upload_stream.assert_called_once()
+    content_hash = hashlib.sha256(b"0123456789").hexdigest()
+    row = await db.fetch_one(
+        files_table.select().where(files_table.c.content_hash == content_hash)
+    )
+    assert row.ref_count == 2
+
+
+def test_b2_upload_stream_bounds_buffers(mocker):
+    api = mocker.patch.object(b2, "b2_api").return_value
+    bucket = mocker.patch.object(b2, "b2_get_bucket").return_value
+    api.get_download_url_for_fileid.return_value = "https://fakeurl.com/big.bin"
+    stream = object()
+
+    assert b2.b2_upload_stream(stream, "big.bin") == "https://fakeurl.com/big.bin"
+
+    bucket.upload_unbound_stream.assert_called_once_with(
+        stream,
+        "big.bin",
+        recommended_upload_part_size=b2.config.UPLOAD_PART_SIZE,
+        buffers_count=b2.config.UPLOAD_STREAM_BUFFERS,
+        buffer_size=b2.config.UPLOAD_PART_SIZE,
+    )
+
+
+@pytest.mark.anyio
+async def test_duplicate_upload_skips_transfer(
+    async_client: AsyncClient, logged_in_token: str, mock_upload_file
+):
+    for name in ("first.bin", "second.bin"):
+        response = await async_client.post(
+            "/upload/",
+            files={"file": (name, b"same bytes")},
+            headers={"Authorization": f"Bearer {logged_in_token}"},
+        )
+        assert response.status_code == 201
+        assert response.json()["file_url"] == "https://fakeurl.com"
+
+    mock_upload_file.assert_called_once()
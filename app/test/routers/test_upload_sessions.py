@@ -0,0 +1,192 @@
+import os
+import pathlib
+import time
+
+import pytest
+from databases import Database
+from httpx import AsyncClient
+
+from app import upload_sessions
+from app.database import upload_sessions_table
+from app.libs import storage
+
+
+@pytest.fixture(autouse=True)
+def session_path(tmp_path: pathlib.Path, mocker) -> pathlib.Path:
+    mocker.patch.object(upload_sessions.config, "UPLOAD_SESSION_PATH", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture(autouse=True)
+def mock_storage(mocker):
+    backend = mocker.Mock(spec=storage.StorageBackend)
+    stored = {}
+
+    def upload_file(local_file: str, file_name: str) -> str:
+        stored[file_name] = pathlib.Path(local_file).read_bytes()
+        return f"https://fakeurl.com/{file_name}"
+
+    backend.upload_file.side_effect = upload_file
+    backend.stored = stored
+    mocker.patch("app.routers.routes_upload.get_storage", return_value=backend)
+    return backend
+
+
+async def start_session(async_client: AsyncClient, size=None) -> dict:
+    response = await async_client.post(
+        "/upload/sessions", json={"file_name": "big.bin", "size": size}
+    )
+    assert response.status_code == 201
+    return response.json()
+
+
+async def append(async_client: AsyncClient, session_id: str, offset: int, data: bytes):
+    return await async_client.patch(
+        f"/upload/sessions/{session_id}",
+        params={"offset": offset},
+        files={"chunk": ("chunk", data)},
+    )
+
+
+@pytest.mark.anyio
+async def test_resumable_upload(async_client: AsyncClient, mock_storage):
+    session = await start_session(async_client, size=10)
+
+    first = await append(async_client, session["id"], 0, b"01234")
+    assert first.json()["received"] == 5
+    second = await append(async_client, session["id"], 5, b"56789")
+    assert second.json()["received"] == 10
+    response = await async_client.post(f"/upload/sessions/{session['id']}/complete")
+
+    assert response.status_code == 201
+    assert response.json()["file_url"] == "https://fakeurl.com/big.bin"
+    assert mock_storage.stored == {"big.bin": b"0123456789"}
+    assert not os.path.exists(upload_sessions.part_path(session["id"]))
+
+
+@pytest.mark.anyio
+async def test_query_offset(async_client: AsyncClient):
+    session = await start_session(async_client)
+    await append(async_client, session["id"], 0, b"0123")
+
+    response = await async_client.get(f"/upload/sessions/{session['id']}")
+
+    assert response.json()["received"] == 4
+    assert response.json()["status"] == upload_sessions.OPEN
+
+
+@pytest.mark.anyio
+async def test_append_at_wrong_offset(async_client: AsyncClient):
+    session = await start_session(async_client)
+    await append(async_client, session["id"], 0, b"0123")
+
+    response = await append(async_client, session["id"], 2, b"23")
+
+    assert response.status_code == 409
+    assert response.headers["upload-offset"] == "4"
+
+
+@pytest.mark.anyio
+async def test_append_past_declared_size(async_client: AsyncClient):
+    session = await start_session(async_client, size=3)
+
+    response = await append(async_client, session["id"], 0, b"0123")
+
+    assert response.status_code == 413
+
+
+@pytest.mark.anyio
+async def test_append_overwrites_bytes_past_offset(
+    async_client: AsyncClient, mock_storage
+):
+    session = await start_session(async_client)
+    # Left behind by an append that died before recording its progress.
+    pathlib.Path(upload_sessions.part_path(session["id"])).write_bytes(b"garbage")
+
+    await append(async_client, session["id"], 0, b"ok")
+    await async_client.post(f"/upload/sessions/{session['id']}/complete")
+
+    assert mock_storage.stored == {"big.bin": b"ok"}
+
+
+@pytest.mark.anyio
+async def test_complete_incomplete_upload(async_client: AsyncClient):
+    session = await start_session(async_client, size=10)
+    await append(async_client, session["id"], 0, b"01234")
+
+    response = await async_client.post(f"/upload/sessions/{session['id']}/complete")
+
+    assert response.status_code == 409
+
+
+@pytest.mark.anyio
+async def test_complete_twice_returns_same_url(async_client: AsyncClient, mock_storage):
+    session = await start_session(async_client)
+    await append(async_client, session["id"], 0, b"0123")
+
+    first = await async_client.post(f"/upload/sessions/{session['id']}/complete")
+    second = await async_client.post(f"/upload/sessions/{session['id']}/complete")
+
+    assert first.json()["file_url"] == second.json()["file_url"]
+    mock_storage.upload_file.assert_called_once()
+
+
+@pytest.mark.anyio
+async def test_unknown_session(async_client: AsyncClient):
+    response = await append(async_client, "missing", 0, b"0")
+
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_missing_staged_file_is_gone(async_client: AsyncClient):
+    session = await start_session(async_client)
+    os.remove(upload_sessions.part_path(session["id"]))
+
+    response = await append(async_client, session["id"], 0, b"abc")
+    assert response.status_code == 410
+
+    response = await async_client.post(f"/upload/sessions/{session['id']}/complete")
+    assert response.status_code == 410
+
+
+@pytest.mark.anyio
+async def test_append_that_outlives_its_lease_keeps_the_new_offset(
+    db: Database, async_client: AsyncClient, mocker
+):
+    session = await start_session(async_client)
+    lock_session = upload_sessions.lock_session
+
+    async def lock_then_lose_lease(session_id, **kwargs):
+        locked = await lock_session(session_id, **kwargs)
+        # The lease expires mid-append and another request appends 3 bytes.
+        await db.execute(
+            upload_sessions_table.update()
+            .where(upload_sessions_table.c.id == session_id)
+            .values(locked_until=time.time() + 60, received=3)
+        )
+        return locked
+
+    mocker.patch.object(upload_sessions, "lock_session", lock_then_lose_lease)
+
+    response = await append(async_client, session["id"], 0, b"abcdef")
+
+    assert response.status_code == 409
+    assert (await upload_sessions.get_session(session["id"])).received == 3
+
+
+@pytest.mark.anyio
+async def test_collect_garbage(db: Database, async_client: AsyncClient):
+    stale = await start_session(async_client)
+    fresh = await start_session(async_client)
+    await db.execute(
+        upload_sessions_table.update()
+        .where(upload_sessions_table.c.id == stale["id"])
+        .values(updated_at=time.time() - upload_sessions.config.UPLOAD_SESSION_TTL - 1)
+    )
+
+    assert await upload_sessions.collect_garbage() == 1
+
+    assert await upload_sessions.get_session(stale["id"]) is None
+    assert not os.path.exists(upload_sessions.part_path(stale["id"]))
+    assert await upload_sessions.get_session(fresh["id"]) is not None
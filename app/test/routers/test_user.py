@@ -1,6 +1,7 @@
 import pytest
 from httpx import AsyncClient
-from fastapi import BackgroundTasks
+from app import security
+from app.routers import routes_users
 
 
 async def create_user(async_client: AsyncClient, name: str, email: str, password: str):
@@ -26,11 +27,23 @@ async def test_create_user_already_exist(async_client: AsyncClient, created_user
     assert response.status_code == 400
 
 
+@pytest.mark.anyio
+async def test_create_user_rolls_back_when_enqueue_fails(
+    async_client: AsyncClient, mocker
+):
+    mocker.patch.object(routes_users, "enqueue", side_effect=RuntimeError("boom"))
+
+    with pytest.raises(RuntimeError):
+        await create_user(async_client, "test", "test@example.fake", "1234")
+
+    assert await security.get_user("test@example.fake") is None
+
+
 @pytest.mark.anyio
 async def test_confirm_user(async_client: AsyncClient, mocker):
-    spy = mocker.spy(BackgroundTasks, "add_task")
+    spy = mocker.spy(routes_users, "enqueue")
     await create_user(async_client, "test", "test@gmail.com", "1234")
-    confirmation_url = str(spy.call_args[1]["confirmation_url"])
+    confirmation_url = spy.call_args[0][1]["confirmation_url"]
 
     response = await async_client.post(confirmation_url)
     assert response.status_code == 200
@@ -47,9 +60,9 @@ async def test_confirm_user_invalid_token(async_client: AsyncClient):
 @pytest.mark.anyio
 async def test_confirm_user_expired_token(async_client: AsyncClient, mocker):
     mocker.patch("app.security.confirmn_token_expire_minutes", return_value=-1)
-    spy = mocker.spy(BackgroundTasks, "add_task")
+    spy = mocker.spy(routes_users, "enqueue")
     await create_user(async_client, "test", "test@gmail.com", "1234")
-    confirmation_url = str(spy.call_args[1]["confirmation_url"])
+    confirmation_url = spy.call_args[0][1]["confirmation_url"]
 
     response = await async_client.post(confirmation_url)
     assert response.status_code == 401
@@ -83,3 +96,30 @@ async def test_login_user(async_client: AsyncClient, confirm_user: dict):
     )
 
     assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_confirm_user_refreshes_cached_user(async_client: AsyncClient, mocker):
+    spy = mocker.spy(routes_users, "enqueue")
+    await create_user(async_client, "test", "test@gmail.com", "1234")
+    assert not (await security.get_cached_user("test@gmail.com")).confirmed
+
+    confirmation_url = spy.call_args[0][1]["confirmation_url"]
+    await async_client.post(confirmation_url)
+
+    assert (await security.get_cached_user("test@gmail.com")).confirmed
+
+
+@pytest.mark.anyio
+async def test_login_user_password_hashing_saturated(
+    async_client: AsyncClient, confirm_user: dict, mocker
+):
+    mocker.patch.object(security.password_hash_executor, "max_pending", 0)
+
+    response = await async_client.post(
+        "/user/login",
+        json={"email": confirm_user["email"], "password": confirm_user["password"]},
+    )
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
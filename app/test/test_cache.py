@@ -0,0 +1,164 @@
+import fnmatch
+
+import pytest
+
+from app import db_routing
+from app.cache import (
+    MemoryCacheBackend,
+    RedisCacheBackend,
+    ResponseCache,
+    TTLCache,
+)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, px=None, nx=False):
+        if nx and key in self.data:
+            return
+        self.data[key] = value
+
+    async def scan_iter(self, match):
+        for key in list(self.data):
+            if fnmatch.fnmatch(key, match):
+                yield key
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_respects_byte_budget():
+    cache = TTLCache(max_entries=10, ttl=60, max_bytes=5, sizeof=len)
+    cache.set("a", b"abc")
+    cache.set("b", b"abc")
+    cache.set("c", b"too large")
+
+    assert cache.get("a") is None
+    assert cache.get("b") == b"abc"
+    assert cache.get("c") is None
+    assert cache.size == 3
+
+
+def test_ttl_cache_expires_entries(mocker):
+    clock = mocker.patch("app.cache.time.monotonic", return_value=100)
+    cache = TTLCache(max_entries=10, ttl=5)
+    cache.set("a", 1)
+
+    clock.return_value = 104
+    assert cache.get("a") == 1
+
+    clock.return_value = 105
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "backend",
+    [
+        lambda: MemoryCacheBackend(max_entries=10, max_bytes=1024, ttl=60),
+        lambda: RedisCacheBackend(FakeRedis()),
+    ],
+)
+async def test_response_cache_read_through(backend):
+    cache = ResponseCache(backend(), ttl=60)
+    calls = []
+
+    async def build():
+        calls.append(1)
+        return b'{"a":1}', {"X-Next-Cursor": "abc"}
+
+    first = await cache.respond("post:list:", "new", build)
+    second = await cache.respond("post:list:", "new", build)
+
+    assert first.body == second.body == b'{"a":1}'
+    assert second.headers["X-Next-Cursor"] == "abc"
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+    await cache.invalidate("post:list:")
+    await cache.respond("post:list:", "new", build)
+    assert len(calls) == 2
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "backend",
+    [
+        lambda: MemoryCacheBackend(max_entries=10, max_bytes=1024, ttl=60),
+        lambda: RedisCacheBackend(FakeRedis()),
+    ],
+)
+async def test_response_built_across_an_invalidation_is_not_stored(backend):
+    cache = ResponseCache(backend(), ttl=60)
+    bodies = [b'{"before":1}', b'{"after":1}']
+
+    async def build_racing_a_write():
+        body = bodies.pop(0)
+        if body == b'{"before":1}':
+            await cache.invalidate("post:detail:1:")
+        return body, {}
+
+    first = await cache.respond("post:detail:1:", "20", build_racing_a_write)
+    second = await cache.respond("post:detail:1:", "20", build_racing_a_write)
+
+    assert first.body == b'{"before":1}'
+    assert second.body == b'{"after":1}'
+
+
+@pytest.mark.anyio
+async def test_invalidating_one_namespace_keeps_the_others():
+    cache = ResponseCache(
+        MemoryCacheBackend(max_entries=10, max_bytes=1024, ttl=60), ttl=60
+    )
+
+    async def build():
+        return b"{}", {}
+
+    await cache.respond("post:detail:1:", "20", build)
+    await cache.respond("post:detail:12:", "20", build)
+    await cache.invalidate("post:detail:1:")
+    await cache.respond("post:detail:1:", "20", build)
+    await cache.respond("post:detail:12:", "20", build)
+
+    assert cache.stats()["hits"] == 1
+
+
+@pytest.mark.anyio
+async def test_responses_built_after_an_invalidation_read_the_primary(mocker):
+    clock = mocker.patch("app.cache.time.time", return_value=1000)
+    cache = ResponseCache(
+        MemoryCacheBackend(max_entries=10, max_bytes=1024, ttl=60),
+        ttl=60,
+        primary_seconds=5,
+    )
+    primary = []
+
+    async def build():
+        primary.append(db_routing._primary_reads.get())
+        return b"{}", {}
+
+    await cache.invalidate("post:list:")
+    await cache.respond("post:list:", "new", build)
+    clock.return_value = 1010
+    await cache.respond("post:list:", "old", build)
+
+    assert primary == [True, False]
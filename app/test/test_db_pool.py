@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from app.db_pool import PoolGate, PoolTimeoutError
+
+
+class FakeConnection:
+    async def acquire(self) -> None:
+        pass
+
+    async def release(self) -> None:
+        pass
+
+
+class FakeBackend:
+    async def connect(self) -> None:
+        pass
+
+    async def disconnect(self) -> None:
+        pass
+
+    def connection(self) -> FakeConnection:
+        return FakeConnection()
+
+
+@pytest.fixture()
+async def gate() -> PoolGate:
+    gate = PoolGate(FakeBackend(), max_size=1, acquire_timeout=0.01)
+    await gate.connect()
+    return gate
+
+
+@pytest.mark.anyio
+async def test_exhausted_pool_times_out(gate: PoolGate):
+    held = gate.connection()
+    await held.acquire()
+
+    with pytest.raises(PoolTimeoutError):
+        await gate.connection().acquire()
+
+    stats = gate.stats()
+    assert stats["in_use"] == 1
+    assert stats["timeouts"] == 1
+    assert stats["waiters"] == 0
+
+
+@pytest.mark.anyio
+async def test_released_slot_goes_to_waiter(gate: PoolGate):
+    gate.acquire_timeout = 1
+    held = gate.connection()
+    await held.acquire()
+
+    waiting = asyncio.create_task(gate.connection().acquire())
+    await asyncio.sleep(0)
+    assert gate.stats()["waiters"] == 1
+
+    await held.release()
+    await waiting
+
+    assert gate.stats()["in_use"] == 1
+    assert gate.stats()["acquires"] == 2
+    assert gate.stats()["acquire_seconds_max"] > 0
+
+
+@pytest.mark.anyio
+async def test_pool_timeout_returns_503(async_client: AsyncClient, mocker):
+    mocker.patch(
+        "app.routers.routes_posts.list_posts",
+        side_effect=PoolTimeoutError("Database connection pool is exhausted"),
+    )
+
+    response = await async_client.get("/post/")
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+
+@pytest.mark.anyio
+async def test_database_stats(async_client: AsyncClient, ops_headers: dict):
+    response = await async_client.get("/stats/database", headers=ops_headers)
+
+    assert response.json()["in_use"] >= 1
@@ -0,0 +1,246 @@
+import pathlib
+import time
+
+import httpx
+import pytest
+import sqlalchemy
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app.database import metadata, post_table, user_table
+from app.db_pool import PooledDatabase
+from app.db_routing import (
+    LAST_WRITE_HEADER,
+    ReadYourWritesMiddleware,
+    RoutedDatabase,
+    Writes,
+    is_read_query,
+    primary_reads,
+    request_writes,
+)
+from app.db_sqlite import sqlite_pragmas
+
+
+def create_sqlite(path: pathlib.Path) -> str:
+    metadata.create_all(sqlalchemy.create_engine(f"sqlite:///{path}"))
+    return f"sqlite+aiosqlite:///{path}"
+
+
+@pytest.fixture()
+async def routed(tmp_path: pathlib.Path):
+    url = create_sqlite(tmp_path / "routed.db")
+    reader = PooledDatabase(
+        url, max_size=2, acquire_timeout=1, sqlite_pragmas=sqlite_pragmas()
+    )
+    database = RoutedDatabase(
+        url,
+        readers=[reader],
+        max_size=1,
+        acquire_timeout=1,
+        sqlite_pragmas=sqlite_pragmas(),
+    )
+    await database.connect()
+    yield database
+    await database.disconnect()
+
+
+def test_is_read_query():
+    assert is_read_query(post_table.select())
+    assert is_read_query("  SELECT 1")
+    assert not is_read_query(post_table.select().with_for_update())
+    assert not is_read_query(post_table.insert())
+    assert not is_read_query("PRAGMA journal_mode")
+
+
+@pytest.mark.anyio
+async def test_pragmas_applied(routed: RoutedDatabase):
+    assert await routed.fetch_val("PRAGMA journal_mode") == "wal"
+    assert await routed.fetch_val("PRAGMA synchronous") == 1
+    assert await routed.readers[0].fetch_val("PRAGMA foreign_keys") == 1
+
+
+@pytest.mark.anyio
+async def test_selects_go_to_reader(routed: RoutedDatabase, mocker):
+    reader_fetch = mocker.spy(routed.readers[0], "fetch_all")
+    await routed.execute(user_table.insert().values(email="a@example.com"))
+
+    rows = await routed.fetch_all(user_table.select())
+
+    assert [row.email for row in rows] == ["a@example.com"]
+    reader_fetch.assert_awaited_once()
+
+
+@pytest.mark.anyio
+async def test_reads_in_transaction_stay_on_writer(routed: RoutedDatabase, mocker):
+    reader_fetch = mocker.spy(routed.readers[0], "fetch_one")
+
+    async with routed.transaction():
+        await routed.execute(user_table.insert().values(email="a@example.com"))
+        row = await routed.fetch_one(user_table.select())
+
+    assert row.email == "a@example.com"
+    reader_fetch.assert_not_awaited()
+
+
+@pytest.mark.anyio
+async def test_connections_are_reused(routed: RoutedDatabase):
+    for _ in range(3):
+        await routed.fetch_all(user_table.select())
+        await routed.execute(user_table.insert().values(email=None))
+
+    stats = routed.pool_stats()
+    assert stats["max_size"] == 1
+    assert stats["in_use"] == 0
+    assert len(routed._backend.backend._pool._idle) == 1
+    assert len(routed.readers[0]._backend.backend._pool._idle) == 1
+
+
+@pytest.fixture()
+async def replicated(tmp_path: pathlib.Path):
+    # A second SQLite file stands in for a replica; nothing replicates to it,
+    # so which database answered shows in the data.
+    replica = PooledDatabase(
+        create_sqlite(tmp_path / "replica.db"), max_size=2, acquire_timeout=1
+    )
+    database = RoutedDatabase(
+        create_sqlite(tmp_path / "primary.db"),
+        readers=[replica],
+        sticky_seconds=60,
+        max_size=2,
+        acquire_timeout=1,
+    )
+    await database.connect()
+    await replica.execute(user_table.insert().values(email="replica@example.com"))
+    yield database
+    await database.disconnect()
+
+
+@pytest.mark.anyio
+async def test_reads_go_to_replica(replicated: RoutedDatabase):
+    await replicated.execute(user_table.insert().values(email="primary@example.com"))
+
+    assert await replicated.fetch_val(sqlalchemy.select(user_table.c.email)) == (
+        "replica@example.com"
+    )
+
+
+@pytest.mark.anyio
+async def test_writer_reads_own_writes(replicated: RoutedDatabase):
+    token = request_writes.set(Writes())
+    try:
+        await replicated.execute(
+            user_table.insert().values(email="primary@example.com")
+        )
+        email = await replicated.fetch_val(sqlalchemy.select(user_table.c.email))
+    finally:
+        request_writes.reset(token)
+
+    assert email == "primary@example.com"
+
+
+@pytest.mark.anyio
+async def test_reads_follow_a_write_from_an_earlier_request(
+    replicated: RoutedDatabase,
+):
+    await replicated.execute(user_table.insert().values(email="primary@example.com"))
+
+    token = request_writes.set(Writes(last_write=time.time() - 1))
+    try:
+        email = await replicated.fetch_val(sqlalchemy.select(user_table.c.email))
+    finally:
+        request_writes.reset(token)
+    token = request_writes.set(Writes(last_write=time.time() - 120))
+    try:
+        stale = await replicated.fetch_val(sqlalchemy.select(user_table.c.email))
+    finally:
+        request_writes.reset(token)
+
+    assert email == "primary@example.com"
+    assert stale == "replica@example.com"
+
+
+@pytest.mark.anyio
+async def test_primary_reads(replicated: RoutedDatabase):
+    await replicated.execute(user_table.insert().values(email="primary@example.com"))
+
+    with primary_reads():
+        email = await replicated.fetch_val(sqlalchemy.select(user_table.c.email))
+
+    assert email == "primary@example.com"
+
+
+@pytest.mark.anyio
+async def test_middleware_carries_the_last_write_between_requests(
+    replicated: RoutedDatabase,
+):
+    async def write(request):
+        await replicated.execute(
+            user_table.insert().values(email="primary@example.com")
+        )
+        return PlainTextResponse("")
+
+    async def read(request):
+        email = await replicated.fetch_val(sqlalchemy.select(user_table.c.email))
+        return PlainTextResponse(email)
+
+    app = ReadYourWritesMiddleware(
+        Starlette(routes=[Route("/write", write, methods=["POST"]), Route("/", read)]),
+        sticky_seconds=60,
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+        written = await ac.post("/write")
+        own = await ac.get("/")
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+        other = await ac.get("/")
+        by_header = await ac.get(
+            "/", headers={LAST_WRITE_HEADER: written.headers[LAST_WRITE_HEADER]}
+        )
+
+    assert "last_write=" in written.headers["set-cookie"]
+    assert own.text == "primary@example.com"
+    assert "set-cookie" not in own.headers
+    assert other.text == "replica@example.com"
+    assert by_header.text == "primary@example.com"
+
+
+@pytest.mark.anyio
+async def test_bad_query_keeps_replica_in_rotation(replicated: RoutedDatabase):
+    with pytest.raises(Exception, match="no such table"):
+        await replicated.fetch_all("SELECT * FROM missing")
+
+    assert replicated.healthy == [True]
+
+
+@pytest.mark.anyio
+async def test_broken_replica_falls_back_to_primary(
+    replicated: RoutedDatabase, tmp_path: pathlib.Path
+):
+    await replicated.execute(user_table.insert().values(email="primary@example.com"))
+    (tmp_path / "replica.db").unlink()
+    (tmp_path / "replica.db").mkdir()
+
+    email = await replicated.fetch_val(sqlalchemy.select(user_table.c.email))
+
+    assert email == "primary@example.com"
+    assert replicated.healthy == [False]
+    await replicated.check_health()
+    assert replicated.healthy == [False]
+    assert replicated.pool_stats()["readers"][0]["healthy"] is False
+
+
+@pytest.mark.parametrize("value", ["inf", "nan", "-inf", "not a time"])
+def test_middleware_ignores_bad_last_write(value: str):
+    middleware = ReadYourWritesMiddleware(None, sticky_seconds=5)
+    scope = {"type": "http", "headers": [(b"x-last-write", value.encode())]}
+
+    assert middleware._last_write(scope) == 0
+
+
+def test_middleware_clamps_last_write_to_now():
+    middleware = ReadYourWritesMiddleware(None, sticky_seconds=5)
+    future = time.time() + 3600
+    scope = {"type": "http", "headers": [(b"x-last-write", str(future).encode())]}
+
+    assert middleware._last_write(scope) <= time.time()
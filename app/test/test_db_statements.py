@@ -0,0 +1,47 @@
+import logging
+
+import pytest
+import sqlalchemy
+
+from app.database import database, user_table
+from app.db_routing import is_read_query
+from app.db_statements import CachedStatement
+
+
+@pytest.fixture()
+def by_email() -> CachedStatement:
+    return CachedStatement(
+        user_table.select().where(user_table.c.email == sqlalchemy.bindparam("email"))
+    )
+
+
+@pytest.mark.anyio
+async def test_statement_is_compiled_once(by_email: CachedStatement):
+    await database.execute_many(
+        user_table.insert(),
+        [{"email": "a@example.com"}, {"email": "b@example.com"}],
+    )
+
+    first = await database.fetch_one(by_email, {"email": "a@example.com"})
+    second = await database.fetch_one(by_email, {"email": "b@example.com"})
+    missing = await database.fetch_one(by_email, {"email": "c@example.com"})
+
+    assert first.email == "a@example.com"
+    assert second.email == "b@example.com"
+    assert missing is None
+    assert by_email.compiles == 1
+
+
+def test_cached_select_is_a_read(by_email: CachedStatement):
+    assert is_read_query(by_email)
+    assert is_read_query(by_email.values(email="a@example.com"))
+
+
+def test_logging_compiles_only_when_emitted(by_email: CachedStatement, mocker):
+    logger = logging.getLogger("app.test.statements")
+    logger.setLevel(logging.INFO)
+    compile = mocker.spy(by_email.statement, "compile")
+
+    logger.debug("Executing query: %s", by_email)
+
+    compile.assert_not_called()
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.executors import BoundedExecutor, ExecutorBusyError
+
+
+@pytest.mark.anyio
+async def test_bounded_executor_runs_off_the_event_loop():
+    executor = BoundedExecutor("test", max_workers=1, max_pending=1)
+
+    thread_name = await executor.run(lambda: threading.current_thread().name)
+
+    assert thread_name.startswith("test")
+    assert executor.stats()["completed"] == 1
+
+
+@pytest.mark.anyio
+async def test_bounded_executor_rejects_when_saturated():
+    executor = BoundedExecutor("test", max_workers=1, max_pending=1)
+    release = threading.Event()
+
+    running = asyncio.ensure_future(executor.run(release.wait))
+    await asyncio.sleep(0)
+
+    with pytest.raises(ExecutorBusyError):
+        await executor.run(lambda: None)
+
+    release.set()
+    await running
+    assert executor.stats()["rejected"] == 1
+
+
+@pytest.mark.anyio
+async def test_bounded_executor_timeout():
+    executor = BoundedExecutor("test", max_workers=1, max_pending=1)
+    release = threading.Event()
+
+    with pytest.raises(asyncio.TimeoutError):
+        await executor.run(release.wait, timeout=0.01)
+
+    release.set()
+    assert executor.stats()["timed_out"] == 1
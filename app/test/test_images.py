@@ -0,0 +1,83 @@
+import pathlib
+
+import pytest
+from databases import Database
+from httpx import AsyncClient
+from PIL import Image
+
+from app import images
+from app.database import post_table
+from app.libs.images import VARIANTS, render_variants
+from app.libs.storage import LocalStorage
+
+
+def make_image(path: pathlib.Path, size=(2000, 1000), mode="RGB") -> pathlib.Path:
+    Image.new(mode, size, "red").save(path)
+    return path
+
+
+def test_render_variants(tmp_path: pathlib.Path):
+    source = make_image(tmp_path / "source.jpg")
+
+    rendered = {v["name"]: v for v in render_variants(str(source), str(tmp_path), 80)}
+
+    assert set(rendered) == {variant.name for variant in VARIANTS}
+    assert (rendered["thumb_webp"]["width"], rendered["thumb_webp"]["height"]) == (
+        320,
+        160,
+    )
+    assert rendered["large_jpeg"]["width"] == 1600
+    with Image.open(rendered["thumb_webp"]["path"]) as thumb:
+        assert thumb.format == "WEBP"
+    with Image.open(rendered["large_jpeg"]["path"]) as large:
+        assert large.format == "JPEG"
+
+
+def test_render_variants_never_upscales(tmp_path: pathlib.Path):
+    source = make_image(tmp_path / "source.png", size=(100, 50), mode="RGBA")
+
+    rendered = render_variants(str(source), str(tmp_path), 80)
+
+    assert {(v["width"], v["height"]) for v in rendered} == {(100, 50)}
+
+
+@pytest.fixture()
+def local_storage(tmp_path: pathlib.Path, mocker) -> LocalStorage:
+    storage = LocalStorage(tmp_path / "storage", "/files")
+    mocker.patch("app.images.get_storage", return_value=storage)
+    return storage
+
+
+@pytest.mark.anyio
+async def test_generate_image_variants(
+    db: Database,
+    async_client: AsyncClient,
+    created_post: dict,
+    local_storage: LocalStorage,
+    tmp_path: pathlib.Path,
+):
+    image_url = local_storage.upload_file(
+        str(make_image(tmp_path / "source.jpg")), "source.jpg"
+    )
+    await db.execute(
+        post_table.update()
+        .where(post_table.c.id == created_post["id"])
+        .values(image_url=image_url)
+    )
+
+    variants = await images.generate_image_variants(created_post["id"], db)
+
+    assert len(variants) == len(VARIANTS)
+    response = await async_client.get("/post/")
+    stored = {v["name"]: v for v in response.json()[0]["image_variants"]}
+    assert set(stored) == {variant.name for variant in VARIANTS}
+    thumb = stored["thumb_jpeg"]
+    assert thumb["content_type"] == "image/jpeg"
+    assert local_storage.path_for(thumb["url"].removeprefix("/files/")).exists()
+
+
+@pytest.mark.anyio
+async def test_generate_image_variants_without_image(
+    db: Database, created_post: dict, local_storage: LocalStorage
+):
+    assert await images.generate_image_variants(created_post["id"], db) == []
@@ -0,0 +1,184 @@
+import asyncio
+
+import pytest
+from databases import Database
+
+from app import jobs
+from app.database import jobs_table, post_table
+
+
+async def fetch_job(db: Database, job_id: int):
+    return await db.fetch_one(jobs_table.select().where(jobs_table.c.id == job_id))
+
+
+@pytest.fixture()
+def mock_registration_email(mocker):
+    handler = mocker.AsyncMock()
+    mocker.patch.dict(jobs.JOB_HANDLERS, {"send_user_registration_email": handler})
+    return handler
+
+
+@pytest.mark.anyio
+async def test_enqueue_and_run(db: Database, mock_registration_email):
+    job_id = await jobs.enqueue(
+        "send_user_registration_email",
+        {"email": "test@example.com", "confirmation_url": "http://test/confirm"},
+    )
+
+    assert await jobs.run_pending_jobs() == 1
+    mock_registration_email.assert_awaited_once_with(
+        email="test@example.com", confirmation_url="http://test/confirm"
+    )
+    job = await fetch_job(db, job_id)
+    assert job.status == jobs.DONE
+    assert job.attempts == 1
+
+
+@pytest.mark.anyio
+async def test_enqueue_idempotency_key(db: Database, mock_registration_email):
+    payload = {"email": "test@example.com", "confirmation_url": "http://test/confirm"}
+
+    assert await jobs.enqueue("send_user_registration_email", payload, "key")
+    assert await jobs.enqueue("send_user_registration_email", payload, "key") is None
+    assert await jobs.run_pending_jobs() == 1
+
+
+@pytest.mark.anyio
+async def test_enqueue_unknown_task():
+    with pytest.raises(ValueError):
+        await jobs.enqueue("unknown", {})
+
+
+@pytest.mark.anyio
+async def test_failed_job_is_retried_with_backoff(
+    db: Database, mock_registration_email, mocker
+):
+    mocker.patch.object(jobs.config, "JOB_BACKOFF_BASE", 10)
+    mock_registration_email.side_effect = RuntimeError("boom")
+    job_id = await jobs.enqueue("send_user_registration_email", {})
+
+    assert await jobs.run_pending_jobs() == 1
+
+    job = await fetch_job(db, job_id)
+    assert job.status == jobs.QUEUED
+    assert job.last_error == "RuntimeError: boom"
+    assert job.run_at - job.created_at >= 5
+    assert await jobs.run_pending_jobs() == 0
+
+
+@pytest.mark.anyio
+async def test_job_is_dead_lettered_after_max_attempts(
+    db: Database, mock_registration_email, mocker
+):
+    mocker.patch.object(jobs.config, "JOB_MAX_ATTEMPTS", 2)
+    mocker.patch("app.jobs.backoff_delay", return_value=0)
+    mock_registration_email.side_effect = RuntimeError("boom")
+    job_id = await jobs.enqueue("send_user_registration_email", {})
+
+    assert await jobs.run_pending_jobs() == 2
+
+    job = await fetch_job(db, job_id)
+    assert job.status == jobs.DEAD
+    assert job.attempts == 2
+    assert mock_registration_email.await_count == 2
+
+
+@pytest.mark.anyio
+async def test_expired_lease_is_reclaimed(db: Database, mock_registration_email):
+    job_id = await jobs.enqueue("send_user_registration_email", {})
+    claimed = await jobs.claim_job()
+    assert claimed.id == job_id
+    assert await jobs.claim_job() is None
+
+    await db.execute(
+        jobs_table.update().where(jobs_table.c.id == job_id).values(locked_until=0)
+    )
+
+    reclaimed = await jobs.claim_job()
+    assert reclaimed.id == job_id
+    assert reclaimed.attempts == 2
+
+
+@pytest.mark.anyio
+async def test_queue_stats(async_client, mock_registration_email, ops_headers):
+    await jobs.enqueue("send_user_registration_email", {})
+
+    response = await async_client.get("/stats/jobs", headers=ops_headers)
+
+    assert response.json()[jobs.QUEUED] == 1
+
+
+@pytest.mark.anyio
+async def test_enqueue_image_variants_once_per_image(db: Database, created_post: dict):
+    assert await jobs.enqueue_image_variants(created_post["id"]) is None
+
+    await db.execute(
+        post_table.update()
+        .where(post_table.c.id == created_post["id"])
+        .values(image_url="https://example.com/cat.png")
+    )
+
+    assert await jobs.enqueue_image_variants(created_post["id"])
+    assert await jobs.enqueue_image_variants(created_post["id"]) is None
+
+
+@pytest.mark.anyio
+async def test_stale_worker_cannot_finish_a_reclaimed_job(
+    db: Database, mock_registration_email
+):
+    job_id = await jobs.enqueue("send_user_registration_email", {})
+    stale = await jobs.claim_job()
+    await db.execute(
+        jobs_table.update().where(jobs_table.c.id == job_id).values(locked_until=0)
+    )
+    reclaimed = await jobs.claim_job()
+
+    await jobs.run_job(stale)
+
+    job = await fetch_job(db, job_id)
+    assert job.status == jobs.RUNNING
+    assert job.locked_until == reclaimed.locked_until
+
+
+@pytest.mark.anyio
+async def test_lost_lease_cancels_the_handler(
+    db: Database, mock_registration_email, mocker
+):
+    mocker.patch.object(jobs.config, "JOB_VISIBILITY_TIMEOUT", 0.03)
+    cancelled = asyncio.Event()
+
+    async def slow_handler(**kwargs):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    mocker.patch.dict(jobs.JOB_HANDLERS, {"send_user_registration_email": slow_handler})
+    # Another worker took the job over.
+    mocker.patch.object(jobs.Lease, "renew", return_value=False)
+    job_id = await jobs.enqueue("send_user_registration_email", {})
+    job = await jobs.claim_job()
+
+    await jobs.run_job(job)
+
+    assert cancelled.is_set()
+    assert (await fetch_job(db, job_id)).status == jobs.RUNNING
+
+
+@pytest.mark.anyio
+async def test_purge_finished_jobs(db: Database, mock_registration_email, mocker):
+    old = await jobs.enqueue("send_user_registration_email", {})
+    await jobs.run_pending_jobs()
+    recent = await jobs.enqueue("send_user_registration_email", {})
+    await jobs.run_pending_jobs()
+    queued = await jobs.enqueue("send_user_registration_email", {})
+    await db.execute(
+        jobs_table.update().where(jobs_table.c.id.in_([old, queued])).values(run_at=0)
+    )
+
+    await jobs.purge_finished_jobs()
+
+    assert await fetch_job(db, old) is None
+    assert await fetch_job(db, recent) is not None
+    assert await fetch_job(db, queued) is not None
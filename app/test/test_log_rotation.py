@@ -0,0 +1,57 @@
+import gzip
+import logging
+import os
+import pathlib
+
+from app.log_rotation import CompressingRotatingFileHandler
+
+
+def emit(handler: logging.Handler, *messages: str) -> None:
+    for message in messages:
+        handler.handle(logging.makeLogRecord({"msg": message}))
+
+
+def test_rolls_over_by_size_and_compresses(tmp_path: pathlib.Path):
+    handler = CompressingRotatingFileHandler(str(tmp_path / "app.log"), max_bytes=10)
+
+    emit(handler, "first line", "second line")
+    handler.close()
+
+    segments = [path.name for path in tmp_path.iterdir()]
+    assert sorted(segments)[0] == "app.log"
+    [segment] = [name for name in segments if name != "app.log"]
+    assert segment.endswith(".gz")
+    assert gzip.decompress((tmp_path / segment).read_bytes()) == b"first line\n"
+    assert (tmp_path / "app.log").read_text() == "second line\n"
+
+
+def test_rolls_over_by_time(tmp_path: pathlib.Path):
+    handler = CompressingRotatingFileHandler(
+        str(tmp_path / "app.log"), max_bytes=0, interval=3600, compression="none"
+    )
+
+    emit(handler, "old")
+    handler.rollover_at = 0
+    emit(handler, "new")
+    handler.close()
+
+    assert len(list(tmp_path.iterdir())) == 2
+    assert (tmp_path / "app.log").read_text() == "new\n"
+
+
+def test_retention_keeps_newest_segments(tmp_path: pathlib.Path):
+    handler = CompressingRotatingFileHandler(
+        str(tmp_path / "app.log"),
+        max_bytes=1,
+        retention_bytes=25,
+        compression="none",
+    )
+    for index in range(5):
+        emit(handler, f"segment {index}")
+        # Distinct modification times order the segments.
+        if os.path.exists(tmp_path / "app.log"):
+            os.utime(tmp_path / "app.log", (index, index))
+    handler.close()
+
+    kept = sorted(path.read_text() for path in tmp_path.iterdir())
+    assert kept == ["segment 2\n", "segment 3\n", "segment 4\n"]
@@ -0,0 +1,166 @@
+import logging
+import sys
+
+import pytest
+from asgi_correlation_id import CorrelationIdFilter, correlation_id
+
+from app.logging_conf import (
+    EmailObfuscationFilter,
+    LogQueueHandler,
+    LogRateLimitFilter,
+    configure_logging,
+    log_queue_stats,
+    start_log_listener,
+    stop_log_listener,
+)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+@pytest.fixture()
+def queued_logger():
+    logger = logging.getLogger("app.test.queued")
+    handler = LogQueueHandler(max_size=100)
+    handler.addFilter(CorrelationIdFilter(default_value="-"))
+    output = ListHandler()
+    logger.addHandler(handler)
+    yield logger, handler, output
+    logger.removeHandler(handler)
+    stop_log_listener()
+
+
+def test_full_queue_drops_and_counts():
+    handler = LogQueueHandler(max_size=1)
+    record = logging.makeLogRecord({"msg": "hello"})
+
+    for _ in range(3):
+        handler.handle(record)
+
+    assert handler.stats() == {
+        "max_size": 1,
+        "queued": 1,
+        "overflow": "drop",
+        "dropped": 2,
+    }
+
+
+def test_listener_writes_records_with_caller_context(queued_logger):
+    logger, handler, output = queued_logger
+    start_log_listener(handler, output)
+    assert log_queue_stats()["enabled"] is True
+
+    token = correlation_id.set("request-1")
+    try:
+        logger.warning("Saved %s", "post")
+    finally:
+        correlation_id.reset(token)
+    stop_log_listener()
+
+    assert [record.getMessage() for record in output.records] == ["Saved post"]
+    assert output.records[0].correlation_id == "request-1"
+    assert log_queue_stats() == {"enabled": False}
+
+
+def test_queue_leaves_formatting_to_the_listener():
+    handler = LogQueueHandler(max_size=10)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.getLogger("app.test").makeRecord(
+            "app.test",
+            logging.ERROR,
+            __file__,
+            1,
+            "Saved %s",
+            ("post",),
+            sys.exc_info(),
+        )
+
+    handler.handle(record)
+    queued = handler.queue.get_nowait()
+
+    assert queued is not record
+    assert (queued.msg, queued.args) == ("Saved %s", ("post",))
+    assert queued.exc_info is record.exc_info
+    assert queued.exc_text is None
+    assert not hasattr(queued, "message")
+
+
+def filter_types(handler_name: str) -> set[type]:
+    return {type(f) for f in logging.getHandlerByName(handler_name).filters}
+
+
+def test_email_obfuscation_stays_with_the_console(mocker):
+    mocker.patch("app.logging_conf.config.LOG_QUEUE_ENABLED", True)
+    configure_logging()
+    try:
+        assert EmailObfuscationFilter not in filter_types("queue")
+        assert EmailObfuscationFilter in filter_types("default")
+        assert EmailObfuscationFilter not in filter_types("rotating_file")
+        assert CorrelationIdFilter in filter_types("queue")
+    finally:
+        stop_log_listener()
+
+
+def make_record(level: int = logging.INFO, lineno: int = 10) -> logging.LogRecord:
+    return logging.makeLogRecord(
+        {"name": "app.routes", "lineno": lineno, "levelno": level, "msg": "Fetching"}
+    )
+
+
+def test_rate_limit_per_call_site():
+    limit = LogRateLimitFilter(rate=0, burst=2, trace_sample_rate=0)
+
+    passed = [limit.filter(make_record()) for _ in range(5)]
+
+    assert passed == [True, True, False, False, False]
+    assert limit.filter(make_record(lineno=11))
+    assert limit.filter(make_record(level=logging.ERROR))
+    assert limit.stats()["suppressed_total"] == 3
+
+
+def test_record_is_limited_once_across_handlers():
+    limit = LogRateLimitFilter(rate=0, burst=1, trace_sample_rate=0)
+    record = make_record()
+
+    assert limit.filter(record) and limit.filter(record)
+    assert not limit.filter(make_record())
+
+
+def test_traced_requests_keep_every_record():
+    limit = LogRateLimitFilter(rate=0, burst=0, trace_sample_rate=1)
+
+    token = correlation_id.set("request-1")
+    try:
+        assert all(limit.filter(make_record()) for _ in range(5))
+    finally:
+        correlation_id.reset(token)
+    assert not limit.filter(make_record())
+
+
+def test_suppressed_records_are_summarized():
+    limit = LogRateLimitFilter(
+        rate=0, burst=0, trace_sample_rate=0, summary_interval=3600
+    )
+    output = ListHandler()
+    logger = logging.getLogger("app.logging_conf")
+    logger.addHandler(output)
+    try:
+        for _ in range(3):
+            limit.filter(make_record())
+        limit.summary_interval = 0
+        limit.filter(make_record())
+    finally:
+        logger.removeHandler(output)
+
+    assert [record.getMessage() for record in output.records] == [
+        "Suppressed 4 records from app.routes:10: Fetching"
+    ]
+    assert limit.stats()["suppressed_since_summary"] == 0
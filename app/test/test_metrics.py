@@ -0,0 +1,37 @@
+import pytest
+import sqlalchemy
+from prometheus_client import REGISTRY
+
+from app.database import jobs_table, post_table
+from app.db_pool import PoolGate
+from app.metrics import statement_name
+from app.routers.routes_posts import find_post_query
+
+
+def sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_statement_names():
+    assert statement_name(find_post_query.values(post_id=1)) == "find_post"
+    assert statement_name(sqlalchemy.select(post_table.c.id)) == "select_posts"
+    assert statement_name(jobs_table.update()) == "update_jobs"
+    assert statement_name(post_table.insert()) == "insert_posts"
+    assert statement_name(" SELECT 1") == "select"
+
+
+@pytest.mark.anyio
+async def test_pool_gate_reports_connections_in_use():
+    class Backend:
+        async def connect(self) -> None:
+            pass
+
+    gate = PoolGate(Backend(), max_size=2, acquire_timeout=1, name="test-gate")
+    await gate.connect()
+
+    await gate.acquire_slot()
+    assert sample("db_pool_connections_in_use", pool="test-gate") == 1
+    assert sample("db_pool_max_connections", pool="test-gate") == 2
+    gate.release_slot()
+    assert sample("db_pool_connections_in_use", pool="test-gate") == 0
+    assert sample("db_pool_acquire_duration_seconds_count", pool="test-gate") == 1
@@ -0,0 +1,102 @@
+import pathlib
+import sqlite3
+
+import pytest
+import sqlalchemy
+from databases import Database
+
+from app.database import metadata, post_table
+from app.migrations import MIGRATIONS, pending_migrations, upgrade
+
+
+@pytest.mark.anyio
+async def test_migrations_are_idempotent(created_post: dict, db: Database):
+    for _ in range(2):
+        for _, _, migrate in MIGRATIONS:
+            await migrate(db)
+
+    post = await db.fetch_one(
+        post_table.select().where(post_table.c.id == created_post["id"])
+    )
+    assert post.like_count == 0
+
+
+@pytest.mark.anyio
+async def test_upgrade_applies_each_version_once(tmp_path: pathlib.Path):
+    database = Database(f"sqlite+aiosqlite:///{tmp_path / 'fresh.db'}")
+    await database.connect()
+    try:
+        assert len(await pending_migrations(database)) == len(MIGRATIONS)
+
+        assert await upgrade(database) == [version for version, _, _ in MIGRATIONS]
+        assert await upgrade(database) == []
+        assert await pending_migrations(database) == []
+        assert await database.fetch_all(post_table.select()) == []
+    finally:
+        await database.disconnect()
+
+
+async def upgraded(path: pathlib.Path) -> list[int]:
+    database = Database(f"sqlite+aiosqlite:///{path}")
+    await database.connect()
+    try:
+        return await upgrade(database)
+    finally:
+        await database.disconnect()
+
+
+@pytest.mark.anyio
+async def test_upgraded_schema_matches_the_tables(tmp_path: pathlib.Path):
+    await upgraded(tmp_path / "fresh.db")
+
+    inspector = sqlalchemy.inspect(
+        sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    )
+    assert set(inspector.get_table_names()) == set(metadata.tables)
+    for table in metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        assert columns == set(table.c.keys()), table.name
+        assert indexes == {index.name for index in table.indexes}, table.name
+
+
+@pytest.mark.anyio
+async def test_upgrade_adds_columns_to_tables_made_before_migrations(
+    tmp_path: pathlib.Path,
+):
+    connection = sqlite3.connect(tmp_path / "old.db")
+    # The shape of the committed test.db, made by an early create_all.
+    connection.executescript("""
+        CREATE TABLE user (id INTEGER PRIMARY KEY, name VARCHAR, email VARCHAR,
+            password VARCHAR);
+        CREATE TABLE posts (id INTEGER PRIMARY KEY, body VARCHAR NOT NULL);
+        CREATE TABLE comments (id INTEGER PRIMARY KEY, body VARCHAR NOT NULL,
+            post_id INTEGER REFERENCES posts (id));
+        """)
+    connection.close()
+
+    assert await upgraded(tmp_path / "old.db") == [
+        version for version, _, _ in MIGRATIONS
+    ]
+
+    inspector = sqlalchemy.inspect(
+        sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    )
+    assert "confirmed" in {column["name"] for column in inspector.get_columns("user")}
+    assert {"user_id", "image_url", "like_count"} <= {
+        column["name"] for column in inspector.get_columns("posts")
+    }
+
+
+@pytest.mark.anyio
+async def test_upgrade_skips_a_version_another_upgrade_applied(
+    tmp_path: pathlib.Path, mocker
+):
+    await upgraded(tmp_path / "raced.db")
+    # As if another upgrade recorded every version after this one looked.
+    mocker.patch("app.migrations.applied_versions", return_value=set())
+    migrate = mocker.AsyncMock()
+    mocker.patch("app.migrations.MIGRATIONS", [(1, "create_tables", migrate)])
+
+    assert await upgraded(tmp_path / "raced.db") == []
+    migrate.assert_not_called()
@@ -0,0 +1,37 @@
+import pytest
+from databases import Database
+from httpx import AsyncClient
+
+from app.database import post_table
+from app.reconcile import reconcile_post_counters
+from app.test.helpers import create_comment, create_like
+
+
+@pytest.mark.anyio
+async def test_reconcile_post_counters(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str, db: Database
+):
+    await create_like(created_post["id"], async_client, logged_in_token)
+    await create_comment(
+        "Test comment", created_post["id"], async_client, logged_in_token
+    )
+    await db.execute(
+        post_table.update()
+        .where(post_table.c.id == created_post["id"])
+        .values(like_count=7, comment_count=0)
+    )
+
+    assert await reconcile_post_counters(db) == 1
+
+    post = await db.fetch_one(
+        post_table.select().where(post_table.c.id == created_post["id"])
+    )
+    assert post.like_count == 1
+    assert post.comment_count == 1
+
+
+@pytest.mark.anyio
+async def test_reconcile_post_counters_nothing_to_repair(
+    created_post: dict, db: Database
+):
+    assert await reconcile_post_counters(db) == 0
@@ -2,6 +2,7 @@ import httpx
 import pytest
 
 from databases import Database
+from app import http_clients
 from app.tasks import APIResponseError, send_simple_email, _generate_cute_creature_api, generate_and_add_to_post
 from app.database import  post_table
 
@@ -82,3 +83,25 @@ async def test_generate_and_add_to_post_success(mock_httpx_client, created_post:
 
 
 
+
+
+@pytest.mark.anyio
+async def test_simple_email_uses_shared_client_with_mock_transport(mocker):
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={})
+
+    mocker.patch("app.tasks.get_http_client", http_clients.get_http_client)
+    await http_clients.start_http_clients(transport=httpx.MockTransport(handler))
+    try:
+        await send_simple_email("test@example.com", "Test subject", "Test body")
+        await send_simple_email("test@example.com", "Test subject", "Test body")
+        client = http_clients.get_http_client(http_clients.MAILGUN)
+    finally:
+        await http_clients.close_http_clients()
+
+    assert len(requests) == 2
+    assert requests[0].url.host == "api.mailgun.net"
+    assert client.is_closed
@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import pytest
+from databases import Database
+
+from app import uploads
+from app.database import files_table
+
+CONTENT_HASH = "a" * 64
+
+
+async def fetch_file(db: Database):
+    return await db.fetch_one(
+        files_table.select().where(files_table.c.content_hash == CONTENT_HASH)
+    )
+
+
+@pytest.fixture(autouse=True)
+def fast_poll(mocker):
+    mocker.patch.object(uploads.config, "UPLOAD_DEDUP_POLL_INTERVAL", 0.01)
+
+
+@pytest.mark.anyio
+async def test_store_once_uploads_new_content(db: Database, mocker):
+    transfer = mocker.AsyncMock(return_value="https://fakeurl.com/a")
+
+    assert (
+        await uploads.store_once(CONTENT_HASH, 3, transfer) == "https://fakeurl.com/a"
+    )
+
+    transfer.assert_awaited_once()
+    row = await fetch_file(db)
+    assert row.status == uploads.READY
+    assert row.ref_count == 1
+
+
+@pytest.mark.anyio
+async def test_store_once_reuses_existing_content(db: Database, mocker):
+    transfer = mocker.AsyncMock(return_value="https://fakeurl.com/a")
+
+    await uploads.store_once(CONTENT_HASH, 3, transfer)
+    assert (
+        await uploads.store_once(CONTENT_HASH, 3, transfer) == "https://fakeurl.com/a"
+    )
+
+    transfer.assert_awaited_once()
+    assert (await fetch_file(db)).ref_count == 2
+
+
+@pytest.mark.anyio
+async def test_concurrent_uploads_of_same_content_transfer_once(db: Database):
+    release = asyncio.Event()
+    transfers = 0
+
+    async def transfer():
+        nonlocal transfers
+        transfers += 1
+        await release.wait()
+        return "https://fakeurl.com/a"
+
+    first = asyncio.create_task(uploads.store_once(CONTENT_HASH, 3, transfer))
+    second = asyncio.create_task(uploads.store_once(CONTENT_HASH, 3, transfer))
+    await asyncio.sleep(0.05)
+    release.set()
+
+    assert await asyncio.gather(first, second) == ["https://fakeurl.com/a"] * 2
+    assert transfers == 1
+    # The tasks commit on their own connections, outside the test's rollback.
+    assert (await asyncio.create_task(fetch_file(db))).ref_count == 2
+    await asyncio.create_task(db.execute(files_table.delete()))
+
+
+@pytest.mark.anyio
+async def test_failed_upload_releases_claim(db: Database, mocker):
+    failing = mocker.AsyncMock(side_effect=RuntimeError("boom"))
+
+    with pytest.raises(RuntimeError):
+        await uploads.store_once(CONTENT_HASH, 3, failing)
+
+    assert await fetch_file(db) is None
+
+
+@pytest.mark.anyio
+async def test_stale_claim_is_taken_over(db: Database, mocker):
+    await db.execute(
+        files_table.insert().values(
+            content_hash=CONTENT_HASH,
+            size=3,
+            status=uploads.PENDING,
+            ref_count=0,
+            claimed_at=time.time() - uploads.config.UPLOAD_TIMEOUT - 1,
+            created_at=time.time(),
+        )
+    )
+    transfer = mocker.AsyncMock(return_value="https://fakeurl.com/a")
+
+    assert (
+        await uploads.store_once(CONTENT_HASH, 3, transfer) == "https://fakeurl.com/a"
+    )
+    transfer.assert_awaited_once()
+
+
+@pytest.mark.anyio
+async def test_release_leaves_a_claim_taken_over_by_another_upload(db: Database):
+    _, claimed_at = await uploads.claim_content(CONTENT_HASH, 3)
+    await db.execute(
+        files_table.update()
+        .where(files_table.c.content_hash == CONTENT_HASH)
+        .values(claimed_at=claimed_at + 1)
+    )
+
+    await uploads.release_claim(CONTENT_HASH, claimed_at)
+
+    assert (await fetch_file(db)).status == uploads.PENDING
+
+
+@pytest.mark.anyio
+async def test_complete_leaves_a_claim_taken_over_by_another_upload(db: Database):
+    _, claimed_at = await uploads.claim_content(CONTENT_HASH, 3)
+    await db.execute(
+        files_table.update()
+        .where(files_table.c.content_hash == CONTENT_HASH)
+        .values(claimed_at=claimed_at + 1)
+    )
+
+    assert not await uploads.complete_upload(
+        CONTENT_HASH, claimed_at, "https://fakeurl.com/stale"
+    )
+
+    row = await fetch_file(db)
+    assert (row.status, row.file_url, row.ref_count) == (uploads.PENDING, None, 0)
@@ -0,0 +1,157 @@
+"""State of resumable uploads.
+
+A session row tracks how many bytes of a file have been received; the bytes
+themselves are staged in UPLOAD_SESSION_PATH, so any app worker that shares
+that directory can continue an upload another one started. Appends and the
+final transfer take a short lease on the row so two requests never write
+the same session at once.
+
+Abandoned sessions are removed by ``collect_garbage``, which the job worker
+runs periodically; ``python -m app.upload_sessions`` runs it once.
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import time
+import uuid
+from typing import Optional
+
+import aiofiles
+import aiofiles.os
+import sqlalchemy
+from databases import Database
+
+from app.config import config
+from app.database import database, upload_sessions_table
+from app.db_routing import primary_reads
+from app.logging_conf import configure_logging
+
+logger = logging.getLogger(__name__)
+
+OPEN = "open"
+COMPLETE = "complete"
+
+
+def part_path(session_id: str) -> str:
+    return os.path.join(config.UPLOAD_SESSION_PATH, f"{session_id}.part")
+
+
+async def create_session(file_name: str, size: Optional[int], db: Database = database):
+    session_id = uuid.uuid4().hex
+    await aiofiles.os.makedirs(config.UPLOAD_SESSION_PATH, exist_ok=True)
+    async with aiofiles.open(part_path(session_id), "wb"):
+        pass
+
+    now = time.time()
+    return await db.fetch_one(
+        upload_sessions_table.insert()
+        .values(
+            id=session_id,
+            file_name=file_name,
+            size=size,
+            received=0,
+            status=OPEN,
+            created_at=now,
+            updated_at=now,
+        )
+        .returning(*upload_sessions_table.c)
+    )
+
+
+async def get_session(session_id: str, db: Database = database):
+    # Clients append and complete straight after the previous write, possibly
+    # on another app worker, so a lagging replica would report a stale offset.
+    with primary_reads():
+        return await db.fetch_one(
+            upload_sessions_table.select().where(
+                upload_sessions_table.c.id == session_id
+            )
+        )
+
+
+async def lock_session(
+    session_id: str, received: Optional[int] = None, db: Database = database
+):
+    """Lease an open session, if given only at exactly ``received`` bytes.
+
+    Returns None when the session is missing, finished, leased by another
+    request or at a different offset.
+    """
+    now = time.time()
+    conditions = [
+        upload_sessions_table.c.id == session_id,
+        upload_sessions_table.c.status == OPEN,
+        sqlalchemy.or_(
+            upload_sessions_table.c.locked_until.is_(None),
+            upload_sessions_table.c.locked_until < now,
+        ),
+    ]
+    if received is not None:
+        conditions.append(upload_sessions_table.c.received == received)
+
+    return await db.fetch_one(
+        upload_sessions_table.update()
+        .where(*conditions)
+        .values(locked_until=now + config.UPLOAD_TIMEOUT)
+        .returning(*upload_sessions_table.c)
+    )
+
+
+async def unlock_session(
+    session_id: str, locked_until: float, db: Database = database, **values
+) -> bool:
+    """Release the lease taken by lock_session, recording ``values`` with it.
+
+    ``locked_until`` is the lease's expiry as returned by lock_session. Returns
+    False, writing nothing, when the lease ran out and another request took
+    the session over.
+    """
+    unlocked = await db.fetch_val(
+        upload_sessions_table.update()
+        .where(
+            upload_sessions_table.c.id == session_id,
+            upload_sessions_table.c.locked_until == locked_until,
+        )
+        .values(locked_until=None, updated_at=time.time(), **values)
+        .returning(upload_sessions_table.c.id)
+    )
+    if unlocked is None:
+        logger.warning(f"Upload session {session_id} was taken over, not recording")
+    return unlocked is not None
+
+
+async def collect_garbage(db: Database = database) -> int:
+    now = time.time()
+    expired = await db.fetch_all(
+        upload_sessions_table.delete()
+        .where(
+            upload_sessions_table.c.updated_at < now - config.UPLOAD_SESSION_TTL,
+            sqlalchemy.or_(
+                upload_sessions_table.c.locked_until.is_(None),
+                upload_sessions_table.c.locked_until < now,
+            ),
+        )
+        .returning(upload_sessions_table.c.id)
+    )
+    for session in expired:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(part_path(session.id))
+
+    if expired:
+        logger.info(f"Removed {len(expired)} expired upload sessions")
+    return len(expired)
+
+
+async def main() -> None:
+    configure_logging()
+    await database.connect()
+    try:
+        await collect_garbage(database)
+    finally:
+        await database.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,149 @@
+"""Content-addressed deduplication of uploaded files.
+
+Every upload is keyed on the SHA-256 of its body. The first upload of some
+content claims a pending row, transfers the file and marks it ready; later
+uploads of the same bytes get the stored URL back and only bump ref_count.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from databases import Database
+
+from app.config import config
+from app.database import database, dialect_insert, files_table
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+READY = "ready"
+
+dedup_stats = {"hits": 0, "misses": 0}
+
+
+async def claim_content(
+    content_hash: str, size: int, db: Database = database
+) -> tuple[Optional[str], Optional[float]]:
+    """Return ``(file_url, None)`` for stored content, else ``(None, claimed_at)``.
+
+    In the second case the caller holds the claim identified by
+    ``claimed_at`` and must upload the content. When another request is
+    uploading the same content this waits for it to finish instead of
+    transferring the bytes a second time.
+    """
+    deadline = time.monotonic() + config.UPLOAD_TIMEOUT
+    while True:
+        # Taking a reference and reading the URL in one statement means a
+        # concurrent delete can never hand out a URL it is about to remove.
+        file_url = await db.fetch_val(
+            files_table.update()
+            .where(
+                files_table.c.content_hash == content_hash,
+                files_table.c.status == READY,
+            )
+            .values(ref_count=files_table.c.ref_count + 1)
+            .returning(files_table.c.file_url)
+        )
+        if file_url is not None:
+            return file_url, None
+
+        now = time.time()
+        claimed = await db.fetch_val(
+            dialect_insert(files_table)
+            .values(
+                content_hash=content_hash,
+                size=size,
+                status=PENDING,
+                ref_count=0,
+                claimed_at=now,
+                created_at=now,
+            )
+            .on_conflict_do_nothing(index_elements=["content_hash"])
+            .returning(files_table.c.id)
+        )
+        if claimed is not None:
+            return None, now
+
+        # A claim older than the transfer timeout belongs to an upload that
+        # failed without releasing it; take it over.
+        stale = await db.fetch_val(
+            files_table.update()
+            .where(
+                files_table.c.content_hash == content_hash,
+                files_table.c.status == PENDING,
+                files_table.c.claimed_at < now - config.UPLOAD_TIMEOUT,
+            )
+            .values(claimed_at=now)
+            .returning(files_table.c.id)
+        )
+        if stale is not None:
+            logger.warning(f"Taking over stale upload claim for {content_hash}")
+            return None, now
+
+        if time.monotonic() >= deadline:
+            raise asyncio.TimeoutError
+        logger.debug(f"Waiting for in-flight upload of {content_hash}")
+        await asyncio.sleep(config.UPLOAD_DEDUP_POLL_INTERVAL)
+
+
+async def complete_upload(
+    content_hash: str, claimed_at: float, file_url: str, db: Database = database
+) -> bool:
+    # Only this claim, as in release_claim; False means it was taken over.
+    completed = await db.fetch_val(
+        files_table.update()
+        .where(
+            files_table.c.content_hash == content_hash,
+            files_table.c.status == PENDING,
+            files_table.c.claimed_at == claimed_at,
+        )
+        .values(
+            file_url=file_url,
+            status=READY,
+            ref_count=files_table.c.ref_count + 1,
+            claimed_at=None,
+        )
+        .returning(files_table.c.id)
+    )
+    return completed is not None
+
+
+async def release_claim(
+    content_hash: str, claimed_at: float, db: Database = database
+) -> None:
+    # Only this claim: another request may have taken over a stale one.
+    await db.execute(
+        files_table.delete().where(
+            files_table.c.content_hash == content_hash,
+            files_table.c.status == PENDING,
+            files_table.c.claimed_at == claimed_at,
+        )
+    )
+
+
+async def store_once(
+    content_hash: str,
+    size: int,
+    transfer: Callable[[], Awaitable[str]],
+    db: Database = database,
+) -> str:
+    file_url, claimed_at = await claim_content(content_hash, size, db)
+    if file_url is not None:
+        dedup_stats["hits"] += 1
+        logger.info(f"Content {content_hash} already stored, skipping upload")
+        return file_url
+
+    dedup_stats["misses"] += 1
+    try:
+        file_url = await transfer()
+    except BaseException:
+        await release_claim(content_hash, claimed_at, db)
+        raise
+
+    if not await complete_upload(content_hash, claimed_at, file_url, db):
+        # Our claim went stale and another upload took it over; that one
+        # records the content, so this copy is left untracked.
+        logger.warning(f"Upload claim for {content_hash} was lost before completing")
+    return file_url
@@ -0,0 +1,114 @@
+"""Background job worker.
+
+Run with ``python -m app.worker [--concurrency N]``; scale by running more
+processes. Each process runs N jobs at a time and shuts down gracefully on
+SIGINT/SIGTERM, letting in-flight jobs finish. Every worker also removes
+abandoned resumable uploads every UPLOAD_SESSION_GC_INTERVAL seconds and
+finished jobs older than JOB_RETENTION every JOB_PURGE_INTERVAL seconds.
+
+Jobs that change posts invalidate cached responses. Only a shared cache
+(CACHE_BACKEND=redis) lets the API processes see that; with the per-process
+memory backend they keep serving the old responses for CACHE_TTL_SECONDS.
+"""
+
+import argparse
+import asyncio
+import logging
+import signal
+
+from app.config import config
+from app.database import database
+from app.http_clients import close_http_clients, start_http_clients
+from app.images import image_executor
+from app.jobs import claim_job, purge_finished_jobs, run_job
+from app.libs.storage import transfer_executor
+from app.logging_conf import configure_logging, stop_log_listener
+from app.metrics import mark_process_dead
+from app.upload_sessions import collect_garbage
+
+logger = logging.getLogger("app.worker")
+
+
+async def work(stopping: asyncio.Event, poll_interval: float) -> None:
+    while not stopping.is_set():
+        try:
+            job = await claim_job()
+        except Exception:
+            logger.exception("Could not claim a job")
+            job = None
+
+        if job is None:
+            try:
+                await asyncio.wait_for(stopping.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            await run_job(job)
+        except Exception:
+            # The job's lease expires and another attempt picks it up.
+            logger.exception(f"Could not run job {job.id}")
+
+
+async def periodically(
+    stopping: asyncio.Event, interval: float, task, description: str
+) -> None:
+    while not stopping.is_set():
+        try:
+            await task()
+        except Exception:
+            logger.exception(f"Could not {description}")
+        try:
+            await asyncio.wait_for(stopping.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main(concurrency: int) -> None:
+    configure_logging()
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    await database.connect()
+    await start_http_clients()
+    logger.info(f"Worker started with {concurrency} concurrent jobs")
+    if config.CACHE_BACKEND != "redis":
+        logger.warning(
+            "CACHE_BACKEND is not shared, API processes will serve stale posts"
+            " until their cached responses expire"
+        )
+    try:
+        await asyncio.gather(
+            *(work(stopping, config.JOB_POLL_INTERVAL) for _ in range(concurrency)),
+            periodically(
+                stopping,
+                config.UPLOAD_SESSION_GC_INTERVAL,
+                collect_garbage,
+                "collect expired upload sessions",
+            ),
+            periodically(
+                stopping,
+                config.JOB_PURGE_INTERVAL,
+                purge_finished_jobs,
+                "purge finished jobs",
+            ),
+        )
+    finally:
+        await close_http_clients()
+        await database.disconnect()
+        image_executor.shutdown()
+        transfer_executor.shutdown()
+        mark_process_dead()
+        logger.info("Worker stopped")
+        stop_log_listener()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background jobs")
+    parser.add_argument(
+        "--concurrency", type=int, default=config.JOB_WORKER_CONCURRENCY
+    )
+    asyncio.run(main(parser.parse_args().concurrency))
@@ -0,0 +1,101 @@
+"""Throughput of the image variant pipeline on a corpus of local images.
+
+Renders every variant of each image on the process pool with 1..N workers.
+Pass a directory of JPEG/PNG files, or a synthetic corpus is generated.
+Run with ``python -m benchmarks.bench_image_variants [DIR] [--workers N]``.
+"""
+
+import argparse
+import asyncio
+import os
+import pathlib
+import random
+import tempfile
+import time
+
+from benchmarks.common import use_scratch_database
+
+use_scratch_database()
+
+from PIL import Image  # noqa: E402
+
+from app.config import config  # noqa: E402
+from app.executors import BoundedProcessExecutor  # noqa: E402
+from app.libs.images import limit_worker_memory, render_variants  # noqa: E402
+
+SYNTHETIC_IMAGES = 24
+SYNTHETIC_SIZES = ((4032, 3024), (3000, 2000), (1920, 1080), (1080, 1350))
+
+
+def synthetic_corpus(directory: pathlib.Path) -> list[pathlib.Path]:
+    rng = random.Random(0)
+    paths = []
+    for i in range(SYNTHETIC_IMAGES):
+        size = SYNTHETIC_SIZES[i % len(SYNTHETIC_SIZES)]
+        # Noise compresses like a photo rather than a flat colour would.
+        image = Image.effect_noise(size, 64).convert("RGB")
+        image = Image.blend(image, Image.new("RGB", size, tuple(rng.randbytes(3))), 0.5)
+        path = directory / f"image{i}.jpg"
+        image.save(path, "JPEG", quality=92)
+        paths.append(path)
+    return paths
+
+
+async def run(workers: int, corpus: list[pathlib.Path], output: str) -> float:
+    executor = BoundedProcessExecutor(
+        "bench-image",
+        max_workers=workers,
+        max_pending=len(corpus),
+        max_tasks_per_child=config.IMAGE_MAX_TASKS_PER_CHILD,
+        initializer=limit_worker_memory,
+        initargs=(config.IMAGE_MAX_PIXELS, config.IMAGE_WORKER_MEMORY_LIMIT),
+    )
+    # Start the workers before timing so spawn cost is not counted.
+    await asyncio.gather(*(executor.run(time.sleep, 0.1) for _ in range(workers)))
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            executor.run(
+                render_variants,
+                str(path),
+                tempfile.mkdtemp(dir=output),
+                config.IMAGE_QUALITY,
+            )
+            for path in corpus
+        )
+    )
+    elapsed = time.perf_counter() - started
+    executor.shutdown()
+    return elapsed
+
+
+async def main(directory: str, max_workers: int) -> None:
+    with tempfile.TemporaryDirectory() as scratch:
+        if directory:
+            corpus = sorted(
+                path
+                for path in pathlib.Path(directory).iterdir()
+                if path.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp")
+            )
+        else:
+            corpus = synthetic_corpus(pathlib.Path(scratch))
+        megabytes = sum(os.path.getsize(path) for path in corpus) / 1024 / 1024
+
+        workers = 1
+        while workers <= max_workers:
+            elapsed = await run(workers, corpus, scratch)
+            print(
+                f"workers={workers:<3} images={len(corpus):<4}"
+                f" {len(corpus) / elapsed:7.2f} images/s"
+                f" {megabytes / elapsed:7.2f} MB/s"
+            )
+            workers *= 2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", nargs="?")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    asyncio.run(main(args.directory, args.workers))
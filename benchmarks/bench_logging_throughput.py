@@ -0,0 +1,87 @@
+"""Request throughput with INFO logging: inline, queued, queued and rate limited.
+
+Serves GET /post/ (a response-cache hit, so logging is a large share of the
+work) through the ASGI app with the production log configuration: Rich
+console output and the rotating JSON file. Console output goes to /dev/null
+and the log file to a scratch directory. Run with
+``python -m benchmarks.bench_logging_throughput``.
+"""
+
+import asyncio
+import contextlib
+import os
+import tempfile
+import time
+
+from benchmarks.common import summarize, use_scratch_database
+
+use_scratch_database()
+
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+
+from app.config import config  # noqa: E402
+from app.database import database  # noqa: E402
+from app.logging_conf import (  # noqa: E402
+    configure_logging,
+    log_queue_stats,
+    stop_log_listener,
+)
+from app.main import app  # noqa: E402
+from app.migrations import upgrade  # noqa: E402
+
+REQUESTS = 2000
+CONCURRENCY = 20
+
+
+async def client(ac: AsyncClient, count: int, samples: list) -> None:
+    for _ in range(count):
+        started = time.perf_counter()
+        response = await ac.get("/post/")
+        response.raise_for_status()
+        samples.append(time.perf_counter() - started)
+
+
+async def run(name: str, queued: bool, rate_limited: bool = False) -> str:
+    config.LOG_QUEUE_ENABLED = queued
+    config.LOG_RATE_LIMIT_ENABLED = rate_limited
+    configure_logging()
+    samples: list[float] = []
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as ac:
+        await ac.get("/post/")
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(client(ac, REQUESTS // CONCURRENCY, samples) for _ in range(CONCURRENCY))
+        )
+        elapsed = time.perf_counter() - started
+        dropped = log_queue_stats().get("dropped", 0)
+        # Time until everything queued has been written, too.
+        stop_log_listener()
+        drained = time.perf_counter() - started
+
+    result = summarize(name, samples) + f" {len(samples) / elapsed:7.0f} req/s"
+    if queued:
+        result += f"\n{'':<32} all records written after {drained:.2f}s,"
+        result += f" {dropped} dropped"
+    return result
+
+
+async def main() -> None:
+    os.chdir(tempfile.mkdtemp(prefix="bench-logs-"))
+    await database.connect()
+    await upgrade(database)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results = [
+                await run("handlers on the event loop", queued=False),
+                await run("log queue + listener thread", queued=True),
+                await run("queue + per-call-site rate limit", True, True),
+            ]
+    finally:
+        await database.disconnect()
+    print("\n".join(results))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+"""Latency of GET /post/ while a burst of logins runs bcrypt.
+
+Compares verifying passwords inline on the event loop with the bounded
+password-hash executor. Run with ``python -m benchmarks.bench_login_burst``.
+"""
+
+import asyncio
+import time
+
+from benchmarks.common import summarize, use_scratch_database
+
+use_scratch_database(TEST_BCRYPT_ROUNDS="12", TEST_PASSWORD_HASH_MAX_PENDING="1000")
+
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+
+from app import security  # noqa: E402
+from app.database import database, user_table  # noqa: E402
+from app.main import app  # noqa: E402
+from app.migrations import upgrade  # noqa: E402
+
+LOGINS = 40
+USER = {"name": "bench", "email": "bench@example.com", "password": "1234"}
+
+
+async def inline_check_password(plain: str, hashed: str) -> bool:
+    return security.verify_password(plain, hashed)
+
+
+async def run_once(client: AsyncClient) -> tuple[list[float], float]:
+    async def login():
+        await client.post("/user/login", json=USER)
+
+    burst_started = time.perf_counter()
+    logins = [asyncio.create_task(login()) for _ in range(LOGINS)]
+
+    # Keep reading for as long as the login burst is in flight.
+    samples = []
+    while not all(task.done() for task in logins):
+        started = time.perf_counter()
+        await client.get("/post/")
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(0.005)
+    await asyncio.gather(*logins)
+    return samples, time.perf_counter() - burst_started
+
+
+async def main() -> None:
+    await database.connect()
+    await upgrade(database)
+    await database.execute(
+        user_table.insert().values(
+            name=USER["name"],
+            email=USER["email"],
+            password=security.get_password_hashed(USER["password"]),
+            confirmed=True,
+        )
+    )
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        original = security.check_password
+        security.check_password = inline_check_password
+        inline = await run_once(client)
+        security.check_password = original
+        offloaded = await run_once(client)
+
+    await database.disconnect()
+    for name, (samples, elapsed) in (
+        ("inline bcrypt", inline),
+        ("bcrypt on executor", offloaded),
+    ):
+        print(f"{summarize(name, samples)} burst={elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""CPU added to a request by recording its metrics.
+
+Calls a do-nothing ASGI endpoint directly, then through MetricsMiddleware and
+the in-flight wrapper, observing three statement latencies per request as a
+typical handler does. The difference is what metrics cost a request. It runs
+once in-process and once with PROMETHEUS_MULTIPROC_DIR set, where every value
+lands in a memory-mapped file so other workers can aggregate it. Run with
+``python -m benchmarks.bench_metrics_overhead``.
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REQUESTS = 20_000
+
+
+class Route:
+    path = "/post/{post_id}"
+
+
+async def endpoint(scope, receive, send) -> None:
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def run(app, record_queries) -> float:
+    async def receive() -> dict:
+        return {"type": "http.request"}
+
+    async def send(message: dict) -> None:
+        pass
+
+    started = time.process_time()
+    for i in range(REQUESTS):
+        scope = {"type": "http", "method": "GET", "path": f"/post/{i}"}
+        await app(scope, receive, send)
+        record_queries()
+    return (time.process_time() - started) / REQUESTS
+
+
+def measure() -> None:
+    from app.metrics import (
+        DB_QUERY_LATENCY,
+        InFlight,
+        MetricsMiddleware,
+        labelled,
+        multiprocess_enabled,
+    )
+
+    async def routed(scope, receive, send) -> None:
+        scope["route"] = Route
+        await in_flight(scope, receive, send)
+
+    def record_queries() -> None:
+        for name in ("user_by_email", "find_post", "post_detail"):
+            labelled(DB_QUERY_LATENCY, name).observe(0.001)
+
+    in_flight = InFlight(endpoint, Route.path)
+    bare = asyncio.run(run(endpoint, lambda: None))
+    measured = asyncio.run(run(MetricsMiddleware(routed), record_queries))
+    mode = "multiprocess files" if multiprocess_enabled() else "in-process"
+    print(
+        f"{mode:<20} bare {bare * 1e6:6.1f}us, with metrics {measured * 1e6:6.1f}us,"
+        f" +{(measured - bare) * 1e6:5.1f}us CPU/request"
+    )
+
+
+def main() -> None:
+    measure()
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": tempfile.mkdtemp()}
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_metrics_overhead", "--child"],
+        env=env,
+        check=True,
+    )
+
+
+if __name__ == "__main__":
+    if "--child" in sys.argv:
+        measure()
+    else:
+        main()
@@ -0,0 +1,93 @@
+"""Mixed read/write load on SQLite: stock setup vs the tuned profile.
+
+The stock setup is the journal-mode default with a fresh connection per
+query; the tuned profile is WAL plus pragmas, one writer connection and a
+pool of readers. Run with ``python -m benchmarks.bench_sqlite_profile``.
+"""
+
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import summarize, use_scratch_database
+
+use_scratch_database()
+
+import sqlalchemy  # noqa: E402
+
+from app.config import config  # noqa: E402
+from app.database import metadata, post_table, user_table  # noqa: E402
+from app.db_pool import PooledDatabase  # noqa: E402
+from app.db_routing import RoutedDatabase  # noqa: E402
+from app.db_sqlite import sqlite_pragmas  # noqa: E402
+
+CLIENTS = 32
+OPERATIONS_PER_CLIENT = 200
+WRITE_RATIO = 0.1
+SEED_POSTS = 1000
+
+
+def stock_database(url: str) -> PooledDatabase:
+    return PooledDatabase(url, max_size=CLIENTS, acquire_timeout=60)
+
+
+def tuned_database(url: str) -> PooledDatabase:
+    pragmas = sqlite_pragmas()
+    reader = PooledDatabase(
+        url,
+        max_size=config.SQLITE_READERS,
+        acquire_timeout=60,
+        sqlite_pragmas=pragmas,
+    )
+    return RoutedDatabase(
+        url, readers=[reader], max_size=1, acquire_timeout=60, sqlite_pragmas=pragmas
+    )
+
+
+async def client(database, rng: random.Random, reads: list, writes: list) -> None:
+    for _ in range(OPERATIONS_PER_CLIENT):
+        started = time.perf_counter()
+        if rng.random() < WRITE_RATIO:
+            await database.execute(post_table.insert().values(body="bench", user_id=1))
+            writes.append(time.perf_counter() - started)
+        else:
+            await database.fetch_all(
+                post_table.select().order_by(post_table.c.id.desc()).limit(20)
+            )
+            reads.append(time.perf_counter() - started)
+
+
+async def run(name: str, factory) -> None:
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    engine = sqlalchemy.create_engine(f"sqlite:///{path}")
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(user_table.insert().values(id=1, email="bench@example.com"))
+        connection.execute(
+            post_table.insert(), [{"body": "seed", "user_id": 1}] * SEED_POSTS
+        )
+
+    database = factory(f"sqlite+aiosqlite:///{path}")
+    await database.connect()
+    reads, writes = [], []
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(client(database, random.Random(i), reads, writes) for i in range(CLIENTS))
+    )
+    elapsed = time.perf_counter() - started
+    await database.disconnect()
+
+    print(f"{name}: {(len(reads) + len(writes)) / elapsed:.0f} ops/s")
+    print(summarize("  reads", reads))
+    print(summarize("  writes", writes))
+
+
+async def main() -> None:
+    await run("stock", stock_database)
+    await run("tuned", tuned_database)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
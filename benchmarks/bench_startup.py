@@ -0,0 +1,97 @@
+"""Cold start of the app: import time and time to first response.
+
+Import time is the cumulative ``python -X importtime`` figure for app.main,
+with the slowest top-level imports listed. Time to first response runs
+uvicorn in a fresh process and polls GET /post/ until it answers. The
+scratch database is migrated beforehand, outside the timing. Run with
+``python -m benchmarks.bench_startup``.
+"""
+
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from benchmarks.common import use_scratch_database
+
+RUNS = 5
+TOP_IMPORTS = 8
+
+
+def import_time(env: dict) -> tuple[int, list[tuple[int, str]]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0
+    top_level = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        if name.strip() == "app.main":
+            total = int(cumulative)
+        elif name.startswith("   ") and not name.startswith("    "):
+            top_level.append((int(cumulative), name.strip()))
+    return total, sorted(top_level, reverse=True)[:TOP_IMPORTS]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_response(env: dict) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/post/") as r:
+                    r.read()
+                return time.perf_counter() - started
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError("uvicorn exited before answering")
+                time.sleep(0.005)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    use_scratch_database()
+    env = dict(os.environ)
+    subprocess.run([sys.executable, "-m", "app.migrations"], env=env, check=True)
+
+    totals = []
+    for _ in range(RUNS):
+        total, top = import_time(env)
+        totals.append(total)
+    print(f"import app.main: {statistics.median(totals) / 1000:8.1f}ms (median)")
+    for cumulative, name in top:
+        print(f"    {name:<32} {cumulative / 1000:8.1f}ms")
+
+    samples = [time_to_first_response(env) for _ in range(RUNS)]
+    print(
+        f"time to first response: {statistics.median(samples) * 1000:8.1f}ms (median)"
+    )
+
+
+if __name__ == "__main__":
+    main()
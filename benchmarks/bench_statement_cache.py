@@ -0,0 +1,79 @@
+"""CPU spent preparing the hot queries of one request, before and after caching.
+
+"Before" builds each statement per request, stringifies it for the debug log
+whether or not that is emitted, and compiles it in the database backend, as
+the handlers used to. "After" uses the cached statements with lazy logging.
+Only statement preparation is timed, no I/O. The log level is INFO, as in
+production. Run with ``python -m benchmarks.bench_statement_cache``.
+"""
+
+import logging
+import time
+
+from benchmarks.common import use_scratch_database
+
+use_scratch_database()
+
+from databases.backends.sqlite import SQLiteBackend  # noqa: E402
+
+from app.database import post_table, user_table  # noqa: E402
+from app.routers.routes_posts import (  # noqa: E402
+    PostSorting,
+    find_post_query,
+    post_list_queries,
+    select_post_and_likes,
+)
+from app.security import user_by_email_query  # noqa: E402
+
+REQUESTS = 2000
+
+logger = logging.getLogger("app.bench")
+logger.setLevel(logging.INFO)
+backend = SQLiteBackend("sqlite:///:memory:").connection()
+
+
+def uncached_request(i: int) -> None:
+    query = user_table.select().where(user_table.c.email == f"user{i}@example.com")
+    logger.info(query)
+    backend._compile(query)
+
+    query = post_table.select().where(post_table.c.id == i)
+    logger.debug(f"Executing query: {query}")
+    backend._compile(query)
+
+    query = select_post_and_likes.order_by(post_table.c.id.desc()).limit(21)
+    logger.debug(f"Executing query: {query}")
+    backend._compile(query)
+
+
+def cached_request(i: int) -> None:
+    logger.debug("Executing query: %s", user_by_email_query)
+    backend._compile(user_by_email_query.values(email=f"user{i}@example.com"))
+
+    logger.debug("Executing query: %s", find_post_query)
+    backend._compile(find_post_query.values(post_id=i))
+
+    query = post_list_queries[PostSorting.new, False]
+    logger.debug("Executing query: %s", query)
+    backend._compile(query.values(limit=21))
+
+
+def run(request) -> float:
+    request(0)
+    started = time.process_time()
+    for i in range(REQUESTS):
+        request(i)
+    return (time.process_time() - started) / REQUESTS
+
+
+def main() -> None:
+    uncached = run(uncached_request)
+    cached = run(cached_request)
+
+    print(f"build + compile per request:   {uncached * 1e6:8.1f}us CPU/request")
+    print(f"cached statements, lazy logs:  {cached * 1e6:8.1f}us CPU/request")
+    print(f"speedup: {uncached / cached:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
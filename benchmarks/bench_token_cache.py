@@ -0,0 +1,49 @@
+"""Per-request cost of resolving an access token, with and without the cache.
+
+Simulates clients reusing tokens: each token is presented REQUESTS_PER_TOKEN
+times. Run with ``python -m benchmarks.bench_token_cache``.
+"""
+
+import time
+
+from benchmarks.common import use_scratch_database
+
+use_scratch_database()
+
+from app import security  # noqa: E402
+
+TOKENS = 200
+REQUESTS_PER_TOKEN = 50
+
+
+def run(tokens: list[str], cached: bool) -> float:
+    security.token_cache.clear()
+    started = time.perf_counter()
+    for _ in range(REQUESTS_PER_TOKEN):
+        for token in tokens:
+            if not cached:
+                security.token_cache.clear()
+            security.get_subject_for_token_type(token, "access")
+    return (time.perf_counter() - started) / (len(tokens) * REQUESTS_PER_TOKEN)
+
+
+def main() -> None:
+    tokens = [
+        security.create_access_token(f"user{i}@example.com") for i in range(TOKENS)
+    ]
+
+    uncached = run(tokens, cached=False)
+    hits_before = security.token_cache.hits
+    misses_before = security.token_cache.misses
+    cached = run(tokens, cached=True)
+    hits = security.token_cache.hits - hits_before
+    misses = security.token_cache.misses - misses_before
+
+    print(f"jose decode + verify every request: {uncached * 1e6:8.1f}us/request")
+    print(f"verified-token cache:               {cached * 1e6:8.1f}us/request")
+    print(f"hit rate: {hits / (hits + misses):.1%} ({hits} hits, {misses} misses)")
+    print(f"saved per request: {(uncached - cached) * 1e6:.1f}us")
+
+
+if __name__ == "__main__":
+    main()
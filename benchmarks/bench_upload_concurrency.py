@@ -0,0 +1,83 @@
+"""Latency of GET /post/ while several uploads are in flight.
+
+Storage is replaced by a blocking stand-in that sleeps like a slow network
+transfer. Compares calling it on the event loop with the transfer executor.
+Run with ``python -m benchmarks.bench_upload_concurrency``.
+"""
+
+import asyncio
+import time
+
+from benchmarks.common import summarize, use_scratch_database
+
+use_scratch_database()
+
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+
+from app.database import database  # noqa: E402
+from app.main import app  # noqa: E402
+from app.migrations import upgrade  # noqa: E402
+from app.libs.storage import StorageBackend  # noqa: E402
+from app.routers import routes_upload  # noqa: E402
+
+UPLOADS = 8
+UPLOAD_BYTES = 2 * 1024 * 1024
+TRANSFER_SECONDS = 0.3
+
+
+class SlowStorage(StorageBackend):
+    def upload_file(self, local_file: str, file_name: str) -> str:
+        time.sleep(TRANSFER_SECONDS)
+        return f"https://example.com/{file_name}"
+
+    def upload_stream(self, stream, file_name: str) -> str:
+        return self.upload_file("", file_name)
+
+
+async def inline_transfer(upload, source, file_name: str, size: int) -> str:
+    return upload(source, file_name)
+
+
+async def run_once(client: AsyncClient) -> tuple[list[float], float]:
+    async def upload(i: int):
+        # Distinct bodies so content deduplication does not skip transfers.
+        payload = str(time.perf_counter_ns() + i).encode().ljust(UPLOAD_BYTES)
+        await client.post("/upload/", files={"file": (f"file{i}.bin", payload)})
+
+    started = time.perf_counter()
+    uploads = [asyncio.create_task(upload(i)) for i in range(UPLOADS)]
+
+    samples = []
+    while not all(task.done() for task in uploads):
+        request_started = time.perf_counter()
+        await client.get("/post/")
+        samples.append(time.perf_counter() - request_started)
+        await asyncio.sleep(0.005)
+    await asyncio.gather(*uploads)
+    return samples, time.perf_counter() - started
+
+
+async def main() -> None:
+    await database.connect()
+    await upgrade(database)
+    storage = SlowStorage()
+    routes_upload.get_storage = lambda: storage
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        original = routes_upload.run_transfer
+        routes_upload.run_transfer = inline_transfer
+        inline = await run_once(client)
+        routes_upload.run_transfer = original
+        offloaded = await run_once(client)
+
+    await database.disconnect()
+    for name, (samples, elapsed) in (
+        ("uploads on event loop", inline),
+        ("uploads on transfer executor", offloaded),
+    ):
+        print(f"{summarize(name, samples)} total={elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,23 @@
+import os
+import statistics
+import tempfile
+
+
+def use_scratch_database(**env: str) -> str:
+    """Point the test config at a throwaway SQLite file. Call before importing app."""
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    os.environ.setdefault("ENV_STATE", "test")
+    os.environ["TEST_DATABASE_URL"] = f"sqlite+aiosqlite:///{path}"
+    os.environ.setdefault("TEST_SECRET_KEY", "benchmark-secret")
+    os.environ.update(env)
+    return path
+
+
+def summarize(name: str, samples: list[float]) -> str:
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return (
+        f"{name:<32} n={len(samples):<6} p50={p50 * 1000:8.2f}ms"
+        f" p99={p99 * 1000:8.2f}ms max={samples[-1] * 1000:8.2f}ms"
+    )